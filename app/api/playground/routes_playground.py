@@ -12,6 +12,7 @@ import mimetypes
 
 from utils.auth import auth, user_ad
 from utils.azure_clients import get_blob_service_client
+from utils.blob_upload import decode_base64_blocks, upload_blocks
 from utils.db import leave_feedback
 from utils.file_manager import FileManager
 from apiflask import APIBlueprint
@@ -499,14 +500,6 @@ def upload_file(upload_request: PlaygroundUploadRequest):
     if not normalized_name:
         return {"message": "Invalid file name"}, 400
 
-    encoded_payload = encoded_file
-    if encoded_payload.startswith("data:"):
-        encoded_payload = encoded_payload.split(",", 1)[-1]
-    try:
-        file_bytes = base64.b64decode(encoded_payload)
-    except Exception:
-        return {"message": "Failed to decode file"}, 400
-
     resolved_mime = mime_type or mimetypes.guess_type(normalized_name)[0]
     if not _is_supported_file(resolved_mime, normalized_name, safe_category):
         return {"message": "Unsupported file type"}, 400
@@ -561,13 +554,16 @@ def upload_file(upload_request: PlaygroundUploadRequest):
     try:
         blob_client = container_client.get_blob_client(blob_name)
         content_settings = ContentSettings(content_type=mime_type) if mime_type else None
-        blob_client.upload_blob(
-            file_bytes,
-            overwrite=True,
+        # Decoded and staged block by block, with the metadata set by the same call
+        file_size = upload_blocks(
+            blob_client,
+            decode_base64_blocks(encoded_file),
             metadata=metadata,
             content_settings=content_settings,
         )
         blob_url = blob_client.url
+    except ValueError:
+        return {"message": "Failed to decode file"}, 400
     except HttpResponseError as exc:
         if getattr(exc, "error_code", None) == "InvalidMetadata":
             logger.warning(
@@ -585,7 +581,7 @@ def upload_file(upload_request: PlaygroundUploadRequest):
         "name": blob_name,
         "url": blob_url,
         "blobName": blob_name,
-        "size": len(file_bytes),
+        "size": file_size,
         "contentType": mime_type,
         "originalName": original_name,
         "uploadedAt": uploaded_at,
@@ -10,10 +10,15 @@ from src.dao.suggestion_context.mock_suggestion_context_dao import (
     MockSuggestionContextDao,
 )
 from src.dao.suggestion_context.blob_suggestion_context_dao import BlobSuggestionContextDao
+from src.service.stats_report_cache import StatsReportCache
 from src.service.stats_report_service import StatsReportService
-from src.dao.chat_table_dao import ChatTableDaoImpl
+from src.dao.chat_table_dao import LOAD_SHARDS, ChatTableDaoImpl
+from src.dao.chat_table_delta_sync_dao import ChatTableDeltaSyncDao
+from src.dao.completion_usage.table_completion_usage_dao import TableCompletionUsageDao
+from src.dao.usage_rollup.table_usage_rollup_dao import TableUsageRollupDao
 from src.repository.conversation_repository import ConversationRepository
 from src.service.suggestion_service import SuggestionService
+from src.service.usage_rollup_service import UsageRollupService
 from utils.azure_clients import get_blob_service_client
 
 instance: Union[AppContext, None] = None
@@ -28,10 +33,17 @@ def _build_context(
             endpoint=os.getenv("DATABASE_ENDPOINT") or "", credential=credential
         )
         chat_table_dao = ChatTableDaoMemoryCacheAdapter(
-            ChatTableDaoImpl(table_service_client)
+            ChatTableDeltaSyncDao(ChatTableDaoImpl(table_service_client, load_shards=LOAD_SHARDS))
         )
         conversation_repo = ConversationRepository(chat_table_dao)
-        stats_report_service = StatsReportService(conversation_repo)
+        usage_rollup_service = UsageRollupService(
+            chat_table_dao, TableUsageRollupDao(table_service_client)
+        )
+        stats_report_service = StatsReportService(
+            conversation_repo, usage_rollup_service, TableCompletionUsageDao(table_service_client)
+        )
+        # Started by the first request for the reports, not by every caller of the context (/suggest...)
+        stats_report_cache = StatsReportCache(stats_report_service)
 
         suggestion_context_dao = env_specific_dependencies["suggestion_context_dao"]
         suggestion_service = SuggestionService(suggestion_context_dao)
@@ -42,12 +54,18 @@ def _build_context(
             chat_table_dao=chat_table_dao,
             conversation_repo=conversation_repo,
             stats_report_service=stats_report_service,
+            stats_report_cache=stats_report_cache,
+            usage_rollup_service=usage_rollup_service,
             suggestion_service=suggestion_service,
             suggestion_context_dao=suggestion_context_dao,
         )
 
     return instance
 
+def get_built_context() -> AppContext | None:
+    """The context if it was already built, without building it."""
+    return instance
+
 def build_prod_context() -> AppContext:
     return _build_context(
         EnvSpecificDependencies(
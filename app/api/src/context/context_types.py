@@ -6,18 +6,22 @@ from azure.data.tables import TableServiceClient
 from src.dao.suggestion_context.suggestion_context_dao_types import (
     BaseSuggestionContextDao,
 )
+from src.service.stats_report_cache import StatsReportCache
 from src.service.stats_report_service import StatsReportService
-from src.dao.chat_table_dao import ChatTableDaoImpl
+from src.dao.chat_table_dao_memory_cache_adapter import ChatTableDaoMemoryCacheAdapter
 from src.repository.conversation_repository import ConversationRepository
 from src.service.suggestion_service import SuggestionService
+from src.service.usage_rollup_service import UsageRollupService
 
 
 class AppContext(TypedDict):
     credential: DefaultAzureCredential
     table_service_client: TableServiceClient
-    chat_table_dao: ChatTableDaoImpl
+    chat_table_dao: ChatTableDaoMemoryCacheAdapter
     conversation_repo: ConversationRepository
     stats_report_service: StatsReportService
+    stats_report_cache: StatsReportCache
+    usage_rollup_service: UsageRollupService
     suggestion_context_dao: BaseSuggestionContextDao
     suggestion_service: SuggestionService
 
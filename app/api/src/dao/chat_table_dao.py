@@ -4,39 +4,127 @@
 # pyright: reportUnknownArgumentType=false
 
 
-from typing import override
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, override
 from azure.data.tables import TableServiceClient
+from azure.storage.blob import BlobServiceClient
 from azure.core.paging import ItemPaged
 from azure.data.tables import TableEntity, TableClient
 from src.dao.chat_table_dao_types import ChatTableDaoInterface
 from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
+from utils.entity_codec import SPILL_CONTAINER, codec_columns, decode_entity, is_encoded
 
-from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
+# Only the columns the chat rows are made of are downloaded, not the MessageRequest and Completion payloads
+SELECTED_COLUMNS = [
+    "PartitionKey",
+    "RowKey",
+    "Timestamp",
+    "Question",
+    "Answer",
+    "oid",
+    "preferred_username",
+] + codec_columns(["Question", "Answer"])
+
+# The production context downloads the whole table by this many concurrent queries on ranges of PartitionKey
+# (conversation ids)
+LOAD_SHARDS = int(os.getenv("CHAT_TABLE_LOAD_SHARDS", "16"))
+_HEX_DIGITS = "0123456789abcdef"
+
+
+def partition_ranges(shards: int) -> list[tuple[str | None, str | None]]:
+    """
+    (low, high) PartitionKey ranges, low included and high excluded, splitting uuids on their first hex digit.
+    The first and last ranges are open so any key is in exactly one range.
+    """
+    shards = max(1, min(shards, len(_HEX_DIGITS)))
+    bounds: list[str | None] = [None]
+    bounds += [_HEX_DIGITS[index * len(_HEX_DIGITS) // shards] for index in range(1, shards)]
+    bounds.append(None)
+    return list(zip(bounds, bounds[1:]))
 
 
 class ChatTableDaoImpl(ChatTableDaoInterface):
     """
     The default implementation of the `ChatTableDaoInterface`.
+
+    Rows are decoded with `decode_entity`, so compressed and spilled properties are read back transparently.
+    Queries only select the SELECTED_COLUMNS, the few rows with a compressed Question or Answer are then
+    fetched whole to be decoded. `all` downloads `load_shards` PartitionKey ranges concurrently, a single listing
+    of the table by default.
     """
 
-    def __init__(self, table_service_client: TableServiceClient):
+    def __init__(self, table_service_client: TableServiceClient,
+                 blob_service_client: Optional[BlobServiceClient] = None,
+                 load_shards: int = 1):
         self.chat_table_client: TableClient = table_service_client.get_table_client(
             table_name="chat"
         )
+        self.blob_service_client = blob_service_client
+        self.load_shards = load_shards
+
+    def _load_blob(self, blob_name: str) -> bytes:
+        if self.blob_service_client is None:
+            # Imported here, the blob client is created on import and most rows never need it
+            from utils.azure_clients import get_blob_service_client  # pylint: disable=import-outside-toplevel
+
+            self.blob_service_client = get_blob_service_client()
+        blob_service_client = self.blob_service_client
+        return blob_service_client.get_blob_client(container=SPILL_CONTAINER, blob=blob_name).download_blob().readall()
+
+    def _to_row(self, entity: TableEntity) -> ChatTableRow:
+        if is_encoded(entity):
+            entity = self.chat_table_client.get_entity(entity["PartitionKey"], entity["RowKey"])
+        row = decode_entity(entity, self._load_blob)
+        return ChatTableRow(
+            Answer=row.get("Answer"),
+            Question=row.get("Question"),
+            PartitionKey=row.get("PartitionKey"),
+            RowKey=row.get("RowKey"),
+            metadata=TableRowMetadata(timestamp=entity.metadata.get("timestamp")),
+            oid=row.get("oid"),
+            preferred_username=row.get("preferred_username"),
+        )
+
+    def _load_range(self, low: str | None, high: str | None) -> list[ChatTableRow]:
+        if low is None and high is None:
+            results_raw: ItemPaged[TableEntity] = self.chat_table_client.list_entities(select=SELECTED_COLUMNS)  # type: ignore (this throws reportUnknownParameterType)
+        else:
+            conditions = []
+            if low is not None:
+                conditions.append("PartitionKey ge @low")
+            if high is not None:
+                conditions.append("PartitionKey lt @high")
+            results_raw = self.chat_table_client.query_entities(  # type: ignore
+                " and ".join(conditions), parameters={"low": low, "high": high}, select=SELECTED_COLUMNS
+            )
+        return [self._to_row(row) for row in results_raw]
 
     @override
     def all(self) -> list[ChatTableRow]:
-        results_raw: ItemPaged[TableEntity] = self.chat_table_client.list_entities()  # type: ignore (this throws reportUnknownParameterType)
-        results_list = [
-            ChatTableRow(
-                Answer=row.get("Answer"),
-                Question=row.get("Question"),
-                PartitionKey=row.get("PartitionKey"),
-                RowKey=row.get("RowKey"),
-                metadata=TableRowMetadata(timestamp=row.metadata.get("timestamp")),
-                oid=row.get("oid"),
-                preferred_username=row.get("preferred_username"),
-            )
-            for row in results_raw
-        ]
-        return results_list
+        ranges = partition_ranges(self.load_shards)
+        if len(ranges) == 1:
+            return self._load_range(None, None)
+        # The ranges are listed in PartitionKey order, like a single query returns its rows
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="chat-table-load") as executor:
+            shards = list(executor.map(lambda bounds: self._load_range(*bounds), ranges))
+        return [row for shard in shards for row in shard]
+
+    @override
+    def since(self, after: datetime | None) -> list[ChatTableRow]:
+        if after is None:
+            return self.all()
+        results_raw: ItemPaged[TableEntity] = self.chat_table_client.query_entities(  # type: ignore
+            "Timestamp gt @after", parameters={"after": after}, select=SELECTED_COLUMNS
+        )
+        return [self._to_row(row) for row in results_raw]
+
+    @override
+    def conversation(self, conversation_id: str) -> list[ChatTableRow]:
+        results_raw: ItemPaged[TableEntity] = self.chat_table_client.query_entities(  # type: ignore
+            "PartitionKey eq @conversation_id",
+            parameters={"conversation_id": conversation_id},
+            select=SELECTED_COLUMNS,
+        )
+        return [self._to_row(row) for row in results_raw]
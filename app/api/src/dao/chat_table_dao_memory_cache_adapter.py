@@ -1,37 +1,113 @@
+import logging
+import os
+import threading
+import time
 from datetime import datetime
-from typing import Union
 from src.dao.chat_table_dao_types import ChatTableDaoInterface
 from src.entity.table_row_entity import ChatTableRow
 
-EXPIRY_TIME_SECS = 15 * 60  # 15 minutes
+logger = logging.getLogger(__name__)
 
+EXPIRY_TIME_SECS = int(os.getenv("CHAT_TABLE_CACHE_TTL_SECS", str(15 * 60)))  # 15 minutes
 
-class ChatTableDaoMemoryCacheAdapter:
+
+class ChatTableDaoMemoryCacheAdapter(ChatTableDaoInterface):
     """
-    This is a temporary solution to cache the chat table data in memory. This is not a
-    scalable solution and should be replaced with a proper caching solution.
+    Caches the rows of the chat table in memory, stale-while-revalidate.
 
-    An important limitation of this temporary solution is that it will force users to
-    wait for results to be fetched from the database if the cache is expired. The ideal
-    solution will not have this limitation and will fetch the data from the cache while
-    it is being updated in the background.
+    Only the very first `all` waits for the rows to be fetched (concurrent callers share that fetch). Once the
+    snapshot is older than `ttl` seconds it is still returned right away, while a single background thread fetches
+    a fresh one; a failed refresh keeps the stale snapshot and is retried by the next call. `start_refresh` can be
+    called at startup so no caller waits at all.
     """
-    cache: Union[list[ChatTableRow], None] = None
-    cache_populated_time: datetime | None = None
-    chat_table_dao: ChatTableDaoInterface
 
-    def __init__(self, chat_table_dao: ChatTableDaoInterface):
+    def __init__(self, chat_table_dao: ChatTableDaoInterface, ttl: float = EXPIRY_TIME_SECS):
         self.chat_table_dao = chat_table_dao
-        self.cache = {}
+        self.ttl = ttl
+        self.cache: list[ChatTableRow] | None = None
+        self.cache_populated_time: float | None = None
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._metrics = {
+            "refreshes": 0,
+            "failed_refreshes": 0,
+            "stale_reads": 0,
+            "last_refresh_duration_ms": None,
+            "max_refresh_duration_ms": 0.0,
+        }
+
+    def _fetch(self):
+        started = time.monotonic()
+        try:
+            rows = self.chat_table_dao.all()
+        except Exception:
+            with self._refresh_lock:
+                self._metrics["failed_refreshes"] += 1
+            raise
+        duration_ms = round((time.monotonic() - started) * 1000, 3)
+        with self._refresh_lock:
+            self.cache = rows
+            self.cache_populated_time = time.monotonic()
+            self._metrics["refreshes"] += 1
+            self._metrics["last_refresh_duration_ms"] = duration_ms
+            self._metrics["max_refresh_duration_ms"] = max(
+                self._metrics["max_refresh_duration_ms"], duration_ms
+            )
+
+    def _refresh_in_background(self):
+        try:
+            # Callers arriving before the first snapshot wait for this fetch instead of starting their own
+            with self._load_lock:
+                self._fetch()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Unable to refresh the chat table cache: %s", e)
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
+
+    def start_refresh(self) -> bool:
+        """Refresh the snapshot in a background thread, unless a refresh is already running."""
+        with self._refresh_lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        threading.Thread(
+            target=self._refresh_in_background, name="chat-table-cache-refresh", daemon=True
+        ).start()
+        return True
 
     def all(self) -> list[ChatTableRow]:
-        is_expired = (
-            self.cache_populated_time is None
-            or (datetime.now() - self.cache_populated_time).seconds > EXPIRY_TIME_SECS
-        )
+        if self.cache is None:
+            with self._load_lock:
+                if self.cache is None:
+                    self._fetch()
 
-        if "all" not in self.cache or is_expired:
-            self.cache["all"] = self.chat_table_dao.all()
-            self.cache_populated_time = datetime.now()
+        with self._refresh_lock:
+            rows, populated = self.cache, self.cache_populated_time
+            is_expired = time.monotonic() - populated > self.ttl
+            if is_expired:
+                self._metrics["stale_reads"] += 1
+        if is_expired:
+            self.start_refresh()
 
-        return self.cache["all"]
+        return rows
+
+    def since(self, after: datetime | None) -> list[ChatTableRow]:
+        # Incremental reads are small, they are not cached
+        return self.chat_table_dao.since(after)
+
+    def conversation(self, conversation_id: str) -> list[ChatTableRow]:
+        return self.chat_table_dao.conversation(conversation_id)
+
+    def metrics(self) -> dict:
+        """Refresh counters and durations, and the age of the snapshot in seconds."""
+        with self._refresh_lock:
+            metrics = dict(self._metrics)
+            metrics["refreshing"] = self._refreshing
+            populated = self.cache_populated_time
+        metrics["staleness_secs"] = (
+            round(time.monotonic() - populated, 3) if populated is not None else None
+        )
+        metrics["ttl_secs"] = self.ttl
+        return metrics
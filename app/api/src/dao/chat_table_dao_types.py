@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
 
 class ChatTableDaoInterface:
@@ -6,4 +8,16 @@ class ChatTableDaoInterface:
     """
 
     def all(self) -> list[ChatTableRow]:
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def since(self, after: datetime | None) -> list[ChatTableRow]:
+        """
+        The rows written (Timestamp) after `after`, every row when it is None.
+        """
+        raise NotImplementedError
+
+    def conversation(self, conversation_id: str) -> list[ChatTableRow]:
+        """
+        The rows of a conversation (PartitionKey).
+        """
+        raise NotImplementedError
@@ -0,0 +1,159 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import override
+
+from src.dao.chat_table_dao import ChatTableDaoImpl
+from src.dao.chat_table_dao_types import ChatTableDaoInterface
+from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = os.getenv(
+    "CHAT_SYNC_STORE_PATH", os.path.join(tempfile.gettempdir(), "chat-sync.sqlite3")
+)
+# Syncs read again the rows of that many seconds before the newest one, rows committed late with an older
+# Timestamp (concurrent writers, retried writes) are not missed
+OVERLAP_SECS = int(os.getenv("CHAT_SYNC_OVERLAP_SECS", "300"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_rows (
+    partition_key TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    timestamp_us INTEGER NOT NULL,
+    question TEXT,
+    answer TEXT,
+    oid TEXT,
+    preferred_username TEXT,
+    PRIMARY KEY (partition_key, row_key)
+);
+CREATE INDEX IF NOT EXISTS chat_rows_timestamp ON chat_rows (timestamp_us);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+_COLUMNS = "partition_key, row_key, timestamp_us, question, answer, oid, preferred_username"
+
+
+def _to_micros(timestamp: datetime) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp()) * 1_000_000 + timestamp.microsecond
+
+
+def _from_micros(micros: int) -> datetime:
+    seconds, microsecond = divmod(micros, 1_000_000)
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=microsecond)
+
+
+class ChatTableDeltaSyncDao(ChatTableDaoInterface):
+    """
+    A `ChatTableDaoInterface` reading from a local SQLite copy of the `chat` table.
+
+    Every read first syncs the copy: only the rows written (Timestamp) since the newest row of the copy, less
+    `overlap_secs`, are downloaded from the table, with the columns of `SELECTED_COLUMNS`. The rows of the overlap
+    already in the copy are replaced. The first sync downloads the whole table, the following ones take seconds.
+    Rows deleted from the table are kept in the copy.
+    """
+
+    def __init__(
+        self, chat_table_dao: ChatTableDaoImpl, store_path: str = STORE_PATH, overlap_secs: float = OVERLAP_SECS
+    ):
+        self.chat_table_dao = chat_table_dao
+        self.store_path = store_path
+        self.overlap_secs = overlap_secs
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(store_path, check_same_thread=False, timeout=30)
+        if store_path != ":memory:":
+            # Readers of other processes (workers) are not blocked by a sync
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def last_sync(self) -> datetime | None:
+        """Timestamp of the newest row of the local copy."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM sync_state WHERE key = 'high_water_mark'"
+            ).fetchone()
+        return _from_micros(row[0]) if row else None
+
+    def sync(self) -> int:
+        """Download the rows written since the last sync (less the overlap) into the local copy, returns how many."""
+        started = time.monotonic()
+        after = self.last_sync()
+        if after is not None:
+            after -= timedelta(seconds=self.overlap_secs)
+        rows = self.chat_table_dao.since(after)
+        records = [
+            (
+                row["PartitionKey"],
+                row["RowKey"],
+                _to_micros(row["metadata"]["timestamp"]),
+                row["Question"],
+                row["Answer"],
+                row["oid"],
+                row["preferred_username"],
+            )
+            for row in rows
+            if row["metadata"]["timestamp"] is not None
+        ]
+        if not records:
+            return 0
+        high_water_mark = max(record[2] for record in records)
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO chat_rows ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            self._connection.execute(
+                "INSERT INTO sync_state (key, value) VALUES ('high_water_mark', ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)",
+                (high_water_mark,),
+            )
+        logger.info(
+            "Synced %s chat rows in %.2f seconds", len(records), time.monotonic() - started
+        )
+        return len(records)
+
+    def _select(self, after: datetime | None, conversation_id: str | None = None) -> list[ChatTableRow]:
+        query = f"SELECT {_COLUMNS} FROM chat_rows"
+        conditions, parameters = [], []
+        if after is not None:
+            conditions.append("timestamp_us > ?")
+            parameters.append(_to_micros(after))
+        if conversation_id is not None:
+            conditions.append("partition_key = ?")
+            parameters.append(conversation_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            records = self._connection.execute(query, parameters).fetchall()
+        return [
+            ChatTableRow(
+                PartitionKey=partition_key,
+                RowKey=row_key,
+                metadata=TableRowMetadata(timestamp=_from_micros(timestamp_us)),
+                Question=question,
+                Answer=answer,
+                oid=oid,
+                preferred_username=preferred_username,
+            )
+            for partition_key, row_key, timestamp_us, question, answer, oid, preferred_username in records
+        ]
+
+    @override
+    def all(self) -> list[ChatTableRow]:
+        self.sync()
+        return self._select(None)
+
+    @override
+    def since(self, after: datetime | None) -> list[ChatTableRow]:
+        self.sync()
+        return self._select(after)
+
+    @override
+    def conversation(self, conversation_id: str) -> list[ChatTableRow]:
+        self.sync()
+        return self._select(None, conversation_id)
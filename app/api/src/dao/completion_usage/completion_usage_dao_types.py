@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from src.entity.completion_usage_entity import CompletionUsage
+
+
+# abstract version of the DAO
+class BaseCompletionUsageDao:
+    """
+    Reads the token counts and the tools of the stored completions.
+    """
+
+    def since(self, after: datetime | None) -> list[CompletionUsage]:
+        """The usage of the completions written after `after`, of every completion when it is None."""
+        raise NotImplementedError
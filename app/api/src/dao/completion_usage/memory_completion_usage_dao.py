@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import override
+
+from src.dao.completion_usage.completion_usage_dao_types import BaseCompletionUsageDao
+from src.entity.completion_usage_entity import CompletionUsage
+
+
+class MemoryCompletionUsageDao(BaseCompletionUsageDao):
+    """
+    An in-memory implementation of the CompletionUsageDao, used in testing.
+    """
+
+    def __init__(self, usages: list[CompletionUsage] | None = None):
+        self.usages: list[CompletionUsage] = list(usages or [])
+
+    @override
+    def since(self, after: datetime | None) -> list[CompletionUsage]:
+        return [usage for usage in self.usages if after is None or usage["timestamp"] > after]
@@ -0,0 +1,74 @@
+import json
+import logging
+from datetime import datetime
+from typing import override
+
+from azure.data.tables import TableClient, TableEntity, TableServiceClient
+
+from src.dao.completion_usage.completion_usage_dao_types import BaseCompletionUsageDao
+from src.entity.completion_usage_entity import CompletionUsage, ToolUsage
+
+logger = logging.getLogger(__name__)
+
+# The completions are the rows of the chat table with a "Completion-<uuid>" RowKey
+_COMPLETIONS_FILTER = "RowKey ge 'Completion-' and RowKey lt 'Completion.'"
+SELECTED_COLUMNS = [
+    "PartitionKey",
+    "RowKey",
+    "Timestamp",
+    "oid",
+    "preferred_username",
+    "PromptTokens",
+    "CompletionTokens",
+    "TotalTokens",
+    "Tools",
+]
+
+
+class TableCompletionUsageDao(BaseCompletionUsageDao):
+    """
+    Azure Table Storage implementation of the CompletionUsageDao.
+    Only the usage columns of the completion rows of the 'chat' table are downloaded, not their payload. Rows
+    stored before these columns existed have no token counts and are skipped.
+    """
+
+    def __init__(self, table_service_client: TableServiceClient):
+        self.chat_table_client: TableClient = table_service_client.get_table_client(
+            table_name="chat"
+        )
+
+    @override
+    def since(self, after: datetime | None) -> list[CompletionUsage]:
+        query_filter = _COMPLETIONS_FILTER
+        parameters = {}
+        if after is not None:
+            query_filter += " and Timestamp gt @after"
+            parameters["after"] = after
+        entities = self.chat_table_client.query_entities(  # type: ignore
+            query_filter, parameters=parameters, select=SELECTED_COLUMNS
+        )
+        usages = [self._from_entity(entity) for entity in entities]
+        return [usage for usage in usages if usage is not None]
+
+    def _from_entity(self, entity: TableEntity) -> CompletionUsage | None:
+        timestamp = entity.metadata.get("timestamp")
+        if entity.get("TotalTokens") is None or timestamp is None:
+            return None
+        tools: list[ToolUsage] = []
+        if entity.get("Tools"):
+            try:
+                tools = [ToolUsage(tool_type=tool["tool_type"], function_name=tool["function_name"],
+                                   count=tool.get("count", 1), index_name=tool.get("index_name"))
+                         for tool in json.loads(entity["Tools"])]
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("Unable to read the tools of %s/%s: %s", entity["PartitionKey"], entity["RowKey"], e)
+        return CompletionUsage(
+            conversation_id=entity["PartitionKey"],
+            message_id=entity["RowKey"],
+            timestamp=timestamp,
+            owner_id=entity.get("oid") or entity.get("preferred_username"),
+            prompt_tokens=entity.get("PromptTokens") or 0,
+            completion_tokens=entity.get("CompletionTokens") or 0,
+            total_tokens=entity["TotalTokens"],
+            tools=tools,
+        )
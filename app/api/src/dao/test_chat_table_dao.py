@@ -0,0 +1,54 @@
+import threading
+from datetime import datetime
+
+from azure.data.tables import TableEntity
+
+from src.dao.chat_table_dao import ChatTableDaoImpl, partition_ranges
+
+
+class FakeChatTableClient:
+    """Stands for the table service and the `chat` table, records the PartitionKey ranges queried."""
+
+    def __init__(self, entities: list[TableEntity]):
+        self.entities = entities
+        self.ranges: list[tuple[str | None, str | None]] = []
+        self.lock = threading.Lock()
+
+    def get_table_client(self, table_name):
+        return self
+
+    def list_entities(self, select):
+        with self.lock:
+            self.ranges.append((None, None))
+        yield from self.entities
+
+    def query_entities(self, query_filter, parameters, select):
+        low, high = parameters.get("low"), parameters.get("high")
+        with self.lock:
+            self.ranges.append((low, high))
+        for entity in self.entities:
+            if (low is None or entity["PartitionKey"] >= low) and (high is None or entity["PartitionKey"] < high):
+                yield entity
+
+
+def _entity(partition_key: str) -> TableEntity:
+    entity = TableEntity(PartitionKey=partition_key, RowKey="MessageRequest-1", Question="Hello?")
+    entity._metadata = {"timestamp": datetime(2025, 1, 10)}  # pylint: disable=protected-access
+    return entity
+
+
+def test_partition_ranges_split_the_hex_digits():
+    assert partition_ranges(1) == [(None, None)]
+    assert partition_ranges(4) == [(None, "4"), ("4", "8"), ("8", "c"), ("c", None)]
+    assert len(partition_ranges(32)) == 16
+
+
+def test_all_loads_the_partition_ranges_in_order():
+    partition_keys = ["", "0a", "3f", "7", "9e", "c1", "f0", "zz"]
+    for shards in [1, 4, 16]:
+        client = FakeChatTableClient([_entity(partition_key) for partition_key in partition_keys])
+
+        rows = ChatTableDaoImpl(client, load_shards=shards).all()
+
+        assert [row["PartitionKey"] for row in rows] == partition_keys
+        assert sorted(client.ranges, key=str) == sorted(partition_ranges(shards), key=str)
@@ -0,0 +1,86 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from src.dao.chat_table_dao_memory_cache_adapter import ChatTableDaoMemoryCacheAdapter
+from src.dao.chat_table_dao_types import ChatTableDaoInterface
+from src.entity.table_row_entity import ChatTableRow
+
+
+class SlowChatTableDao(ChatTableDaoInterface):
+    """Each `all` returns a new snapshot (its number) once `release` is set."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.error: Exception | None = None
+
+    def all(self) -> list[ChatTableRow]:
+        self.calls += 1
+        self.release.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        return [self.calls]  # type: ignore
+
+    def since(self, after: datetime | None) -> list[ChatTableRow]:
+        return []
+
+
+def _wait_for_refresh(adapter: ChatTableDaoMemoryCacheAdapter):
+    while adapter.metrics()["refreshing"]:
+        time.sleep(0.01)
+
+
+def test_first_load_is_shared_by_concurrent_callers():
+    dao = SlowChatTableDao()
+    dao.release.clear()
+    adapter = ChatTableDaoMemoryCacheAdapter(dao, ttl=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(adapter.all())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    dao.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [[1]] * 5
+    assert dao.calls == 1
+
+
+def test_expired_snapshot_is_served_while_refreshing():
+    dao = SlowChatTableDao()
+    adapter = ChatTableDaoMemoryCacheAdapter(dao, ttl=0.05)
+    assert adapter.all() == [1]
+    time.sleep(0.06)
+
+    dao.release.clear()
+    # Stale snapshots are served right away, a single refresh runs in the background
+    assert [adapter.all() for _ in range(3)] == [[1]] * 3
+    dao.release.set()
+    _wait_for_refresh(adapter)
+
+    assert adapter.all() == [2]
+    assert dao.calls == 2
+    metrics = adapter.metrics()
+    assert metrics["stale_reads"] == 3
+    assert metrics["last_refresh_duration_ms"] is not None
+    assert metrics["staleness_secs"] >= 0
+
+
+def test_failed_refresh_keeps_the_stale_snapshot():
+    dao = SlowChatTableDao()
+    adapter = ChatTableDaoMemoryCacheAdapter(dao, ttl=0.05)
+    adapter.all()
+    time.sleep(0.06)
+    dao.error = RuntimeError("table unavailable")
+
+    assert adapter.all() == [1]
+    _wait_for_refresh(adapter)
+    assert adapter.all() == [1]
+    assert adapter.metrics()["failed_refreshes"] >= 1
+
+    with pytest.raises(RuntimeError):
+        ChatTableDaoMemoryCacheAdapter(dao).all()
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+from typing import cast
+
+from src.dao.chat_table_dao import ChatTableDaoImpl
+from src.dao.chat_table_delta_sync_dao import ChatTableDeltaSyncDao
+from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
+
+
+def _row(row_key: str, timestamp: str, question: str | None = "Hello?") -> ChatTableRow:
+    return ChatTableRow(
+        metadata=TableRowMetadata(timestamp=datetime.fromisoformat(timestamp)),
+        Question=question,
+        Answer=None if question else "Hi!",
+        oid="alice",
+        PartitionKey="c1",
+        RowKey=row_key,
+        preferred_username=None,
+    )
+
+
+class FakeChatTableDao:
+    """Stands for the table, records the `since` queries."""
+
+    def __init__(self, rows: list[ChatTableRow]):
+        self.rows = rows
+        self.queries: list[datetime | None] = []
+
+    def since(self, after: datetime | None) -> list[ChatTableRow]:
+        self.queries.append(after)
+        return [row for row in self.rows if after is None or row["metadata"]["timestamp"] > after]
+
+
+def test_only_new_rows_are_downloaded(tmp_path):
+    table = FakeChatTableDao(
+        [_row("q1", "2024-06-01T09:00:00+00:00"), _row("a1", "2024-06-01T09:00:05.250000+00:00", None)]
+    )
+    dao = ChatTableDeltaSyncDao(cast(ChatTableDaoImpl, table), str(tmp_path / "chat.sqlite3"), overlap_secs=0)
+
+    assert [row["RowKey"] for row in dao.all()] == ["q1", "a1"]
+    table.rows.append(_row("q2", "2024-06-02T10:00:00+00:00"))
+    assert len(dao.all()) == 3
+    assert dao.sync() == 0
+
+    assert table.queries == [None, datetime.fromisoformat("2024-06-01T09:00:05.250000+00:00"),
+                             datetime.fromisoformat("2024-06-02T10:00:00+00:00")]
+    assert dao.all()[1] == _row("a1", "2024-06-01T09:00:05.250000+00:00", None)
+    assert [row["RowKey"] for row in dao.since(datetime.fromisoformat("2024-06-01T12:00:00+00:00"))] == ["q2"]
+
+
+def test_the_local_copy_is_kept_between_restarts(tmp_path):
+    store_path = str(tmp_path / "chat.sqlite3")
+    table = FakeChatTableDao([_row("q1", "2024-06-01T09:00:00+00:00")])
+    ChatTableDeltaSyncDao(cast(ChatTableDaoImpl, table), store_path, overlap_secs=0).sync()
+
+    restarted = ChatTableDeltaSyncDao(cast(ChatTableDaoImpl, table), store_path, overlap_secs=0)
+
+    assert [row["RowKey"] for row in restarted.all()] == ["q1"]
+    assert table.queries[-1] == datetime.fromisoformat("2024-06-01T09:00:00+00:00")
+
+
+def test_rows_committed_late_within_the_overlap_are_synced(tmp_path):
+    table = FakeChatTableDao([_row("q1", "2024-06-01T09:00:00+00:00"), _row("q3", "2024-06-01T09:02:00+00:00")])
+    dao = ChatTableDeltaSyncDao(cast(ChatTableDaoImpl, table), str(tmp_path / "chat.sqlite3"), overlap_secs=300)
+    dao.sync()
+    # Written before q3 but committed after the sync
+    table.rows.append(_row("q2", "2024-06-01T09:01:00+00:00"))
+
+    assert dao.sync() == 3  # q1 is within the overlap too
+    assert table.queries[-1] == datetime.fromisoformat("2024-06-01T09:02:00+00:00") - timedelta(seconds=300)
+    assert sorted(row["RowKey"] for row in dao.all()) == ["q1", "q2", "q3"]
+    assert dao.last_sync() == datetime.fromisoformat("2024-06-01T09:02:00+00:00")
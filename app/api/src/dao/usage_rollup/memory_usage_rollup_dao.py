@@ -0,0 +1,50 @@
+from datetime import datetime
+from typing import override
+
+from src.dao.usage_rollup.usage_rollup_dao_types import BaseUsageRollupDao
+from src.entity.usage_rollup_entity import DailyUserRollup
+
+
+class MemoryUsageRollupDao(BaseUsageRollupDao):
+    """
+    An in-memory implementation of the UsageRollupDao, used in testing.
+    """
+
+    def __init__(self):
+        # Questions by (day, owner, conversation)
+        self._counts: dict[tuple[str, str | None, str], int] = {}
+        self._high_water_mark: datetime | None = None
+        self._version = 0
+
+    @override
+    def all(self) -> list[DailyUserRollup]:
+        rollups: dict[tuple[str, str | None], DailyUserRollup] = {}
+        for (day, owner_id, conversation_id), count in self._counts.items():
+            if not count:
+                continue
+            rollup = rollups.setdefault(
+                (day, owner_id), DailyUserRollup(day=day, owner_id=owner_id, questions=0, conversations={})
+            )
+            rollup["questions"] += count
+            rollup["conversations"][conversation_id] = count
+        return list(rollups.values())
+
+    @override
+    def upsert(self, rollups: list[DailyUserRollup]):
+        for rollup in rollups:
+            for conversation_id, count in rollup["conversations"].items():
+                self._counts[(rollup["day"], rollup["owner_id"], conversation_id)] = count
+
+    @override
+    def get_high_water_mark(self) -> tuple[datetime | None, str | None]:
+        if self._high_water_mark is None:
+            return None, None
+        return self._high_water_mark, str(self._version)
+
+    @override
+    def set_high_water_mark(self, high_water_mark: datetime, etag: str | None) -> bool:
+        if etag != self.get_high_water_mark()[1]:
+            return False
+        self._high_water_mark = high_water_mark
+        self._version += 1
+        return True
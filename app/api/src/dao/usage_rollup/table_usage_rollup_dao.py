@@ -0,0 +1,120 @@
+import logging
+from datetime import datetime
+from itertools import groupby
+from typing import override
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableClient, TableServiceClient, UpdateMode
+
+from src.dao.usage_rollup.usage_rollup_dao_types import BaseUsageRollupDao
+from src.entity.usage_rollup_entity import DailyUserRollup
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "chatrollup"
+# Partition of the high-water mark, the other partitions are days
+_META_PARTITION = "_meta"
+_HIGH_WATER_MARK_KEY = "high_water_mark"
+# Owner part of the RowKey of the questions whose owner was not recorded (RowKeys cannot be None)
+_NO_OWNER_KEY = "-"
+_MAX_TRANSACTION_ENTITIES = 100
+
+
+class TableUsageRollupDao(BaseUsageRollupDao):
+    """
+    Azure Table Storage implementation of the UsageRollupDao.
+    The questions of an owner in a conversation on a day are a row of the 'chatrollup' table, partitioned by day
+    with "owner|conversation" as RowKey, so upserting a recount replaces the previous one. Rows recounted to 0
+    are kept and skipped when read.
+    """
+
+    def __init__(self, table_service_client: TableServiceClient):
+        self.table_service_client = table_service_client
+        self.table_client: TableClient = table_service_client.get_table_client(
+            table_name=TABLE_NAME
+        )
+        self._table_created = False
+
+    def _ensure_table(self):
+        if not self._table_created:
+            self.table_service_client.create_table_if_not_exists(TABLE_NAME)
+            self._table_created = True
+
+    @override
+    def all(self) -> list[DailyUserRollup]:
+        try:
+            entities = list(self.table_client.query_entities(
+                f"PartitionKey ne '{_META_PARTITION}'"
+            ))
+        except ResourceNotFoundError:
+            return []
+        rollups: dict[tuple[str, str | None], DailyUserRollup] = {}
+        for entity in entities:
+            questions = entity.get("Questions", 0)
+            if not questions:
+                continue
+            owner_id = entity.get("Owner")
+            rollup = rollups.setdefault(
+                (entity["PartitionKey"], owner_id),
+                DailyUserRollup(day=entity["PartitionKey"], owner_id=owner_id, questions=0, conversations={}),
+            )
+            rollup["questions"] += questions
+            rollup["conversations"][entity["Conversation"]] = questions
+        return list(rollups.values())
+
+    @override
+    def upsert(self, rollups: list[DailyUserRollup]):
+        self._ensure_table()
+        entities = sorted(
+            (entity for rollup in rollups for entity in self._to_entities(rollup)),
+            key=lambda entity: entity["PartitionKey"],
+        )
+        # Transactions are limited to a partition (a day) and 100 entities
+        for _, day_entities in groupby(entities, key=lambda entity: entity["PartitionKey"]):
+            day_entities = list(day_entities)
+            for start in range(0, len(day_entities), _MAX_TRANSACTION_ENTITIES):
+                chunk = day_entities[start:start + _MAX_TRANSACTION_ENTITIES]
+                self.table_client.submit_transaction(
+                    [("upsert", entity) for entity in chunk]
+                )
+
+    @override
+    def get_high_water_mark(self) -> tuple[datetime | None, str | None]:
+        try:
+            entity = self.table_client.get_entity(_META_PARTITION, _HIGH_WATER_MARK_KEY)
+        except ResourceNotFoundError:
+            return None, None
+        return entity.get("HighWaterMark"), entity.metadata.get("etag")
+
+    @override
+    def set_high_water_mark(self, high_water_mark: datetime, etag: str | None) -> bool:
+        self._ensure_table()
+        entity = {
+            "PartitionKey": _META_PARTITION,
+            "RowKey": _HIGH_WATER_MARK_KEY,
+            "HighWaterMark": high_water_mark,
+        }
+        try:
+            if etag is None:
+                self.table_client.create_entity(entity)
+            else:
+                self.table_client.update_entity(
+                    entity, mode=UpdateMode.REPLACE, etag=etag, match_condition=MatchConditions.IfNotModified
+                )
+        except (ResourceExistsError, ResourceModifiedError):
+            return False
+        return True
+
+    def _to_entities(self, rollup: DailyUserRollup) -> list[dict]:
+        owner_key = rollup["owner_id"] or _NO_OWNER_KEY
+        return [
+            {
+                "PartitionKey": rollup["day"],
+                "RowKey": f"{owner_key}|{conversation_id}",
+                "Owner": rollup["owner_id"] or None,
+                "Conversation": conversation_id,
+                "Questions": count,
+            }
+            for conversation_id, count in rollup["conversations"].items()
+        ]
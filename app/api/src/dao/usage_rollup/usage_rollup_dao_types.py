@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from src.entity.usage_rollup_entity import DailyUserRollup
+
+
+# abstract version of the DAO
+class BaseUsageRollupDao:
+    """
+    Store of the daily usage rollups and of the high-water mark: the timestamp of the newest chat row
+    counted in them.
+    """
+
+    def all(self) -> list[DailyUserRollup]:
+        raise NotImplementedError
+
+    def upsert(self, rollups: list[DailyUserRollup]):
+        """
+        Replace the question counts of the conversations of the rollups, the other conversations of the same day
+        and owner are kept. Writing the same counts twice changes nothing.
+        """
+        raise NotImplementedError
+
+    def get_high_water_mark(self) -> tuple[datetime | None, str | None]:
+        """The high-water mark and its ETag, (None, None) before the first refresh."""
+        raise NotImplementedError
+
+    def set_high_water_mark(self, high_water_mark: datetime, etag: str | None) -> bool:
+        """
+        Move the high-water mark, unless it changed since it was read with `etag` (None when there was none).
+        Returns whether it was written.
+        """
+        raise NotImplementedError
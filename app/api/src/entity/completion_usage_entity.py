@@ -0,0 +1,28 @@
+"""
+This module contains the type definitions of the usage of the completions (answers): the tokens they took and
+the tools called for them, that the token usage reports are computed from.
+"""
+
+from datetime import datetime
+from typing import TypedDict
+
+
+class ToolUsage(TypedDict):
+    tool_type: str
+    function_name: str
+    # Number of calls of the function for the answer
+    count: int
+    # The search index of the search tools (corporate, pmcoe, telecom), None for the other tools.
+    index_name: str | None
+
+
+class CompletionUsage(TypedDict):
+    conversation_id: str
+    message_id: str
+    timestamp: datetime
+    # It is possible for the owner_id to be None, if we did not record the owner_id.
+    owner_id: str | None
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    tools: list[ToolUsage]
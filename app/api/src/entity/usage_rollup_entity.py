@@ -0,0 +1,16 @@
+"""
+This module contains the type definitions of the usage rollups, the daily question counts of each user
+that the usage reports are computed from.
+"""
+
+from typing import TypedDict
+
+
+class DailyUserRollup(TypedDict):
+    # The UTC day of the questions, YYYY-MM-DD
+    day: str
+    # It is possible for the owner_id to be None, if we did not record the owner_id.
+    owner_id: str | None
+    # Number of questions asked that day, in total and in each conversation (by conversation_id)
+    questions: int
+    conversations: dict[str, int]
@@ -0,0 +1,159 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import NamedTuple, Optional
+
+from src.entity.table_row_entity import ChatTableRow
+from src.entity.user_entity import UserEntity
+from src.mapper.conversation_entity_mapper import ChatTableEntityMapper
+from src.mapper.table_entity_common_fields_mapper import TableEntityCommonFieldsMapper
+from src.repository.conversation_store import MessageRecord, message_record
+
+logger = logging.getLogger(__name__)
+
+MAP_WORKERS = int(os.getenv("CHAT_MAP_WORKERS", str(os.cpu_count() or 1)))
+MAP_CHUNK_ROWS = int(os.getenv("CHAT_MAP_CHUNK_ROWS", "5000"))
+# Below this, sending the rows to other processes costs more than mapping them here
+MAP_PARALLEL_MIN_ROWS = int(os.getenv("CHAT_MAP_PARALLEL_MIN_ROWS", "20000"))
+
+
+class MappedChatRows(NamedTuple):
+    records: list[MessageRecord]
+    users: dict[str, UserEntity]
+
+
+def map_chunk(rows: list[ChatTableRow], log_validation_errors: bool = False) -> MappedChatRows:
+    """Map and validate chat rows into message records and the users who asked the questions."""
+    records: list[MessageRecord] = []
+    users: dict[str, UserEntity] = {}
+    for row in rows:
+        message = ChatTableEntityMapper.map_and_validate_to_conversation_message_entity(
+            row, log_validation_errors=log_validation_errors
+        )
+        if message is not None:
+            records.append(message_record(message))
+
+        # Right now only the user messages make users, "oid" is the unique ID.
+        oid = row.get("oid")
+        if not row.get("Question") or oid is None:
+            continue
+        common_fields = TableEntityCommonFieldsMapper.extract_and_validate_common_fields(
+            "chatrow", row
+        )
+        if common_fields is None:
+            continue
+        timestamp = common_fields["timestamp"]
+        username = row.get("preferred_username")
+        user = users.get(oid)
+        if user is None:
+            users[oid] = UserEntity(
+                user_id=oid,
+                username=username or "",
+                created_at=timestamp,
+                last_message_at=timestamp,
+            )
+            continue
+        if timestamp < user["created_at"]:
+            user["created_at"] = timestamp
+        if timestamp > user["last_message_at"]:
+            user["last_message_at"] = timestamp
+            if username is not None:
+                user["username"] = username
+    return MappedChatRows(records, users)
+
+
+def merge_users(users: dict[str, UserEntity], other: dict[str, UserEntity]):
+    """Merge the users of a later chunk, the username of the latest message wins."""
+    for oid, theirs in other.items():
+        user = users.get(oid)
+        if user is None:
+            users[oid] = theirs
+            continue
+        if theirs["created_at"] < user["created_at"]:
+            user["created_at"] = theirs["created_at"]
+        if theirs["last_message_at"] > user["last_message_at"]:
+            user["last_message_at"] = theirs["last_message_at"]
+            if theirs["username"] and theirs["username"] != user["username"]:
+                logger.info(
+                    "User %s changed username from %s to %s", oid, user["username"], theirs["username"]
+                )
+                user["username"] = theirs["username"]
+
+
+class ChatRowLoader:
+    """
+    Maps the chat rows for the conversation and user repositories.
+
+    Large snapshots are cut in chunks of `chunk_rows` mapped in a pool of `workers` processes, the chunks are
+    submitted up front so the pool maps while the results of the first chunks are merged. The result of the last
+    snapshot is kept, the repositories sharing a loader map the rows of a snapshot once.
+    """
+
+    def __init__(
+        self,
+        workers: int = MAP_WORKERS,
+        chunk_rows: int = MAP_CHUNK_ROWS,
+        parallel_min_rows: int = MAP_PARALLEL_MIN_ROWS,
+    ):
+        self.workers = workers
+        self.chunk_rows = chunk_rows
+        self.parallel_min_rows = parallel_min_rows
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._last: Optional[tuple[list[ChatTableRow], bool, MappedChatRows]] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            # Not forked, the API process runs threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _map(self, rows: list[ChatTableRow], log_validation_errors: bool) -> MappedChatRows:
+        if self.workers <= 1 or len(rows) < self.parallel_min_rows:
+            return map_chunk(rows, log_validation_errors)
+        executor = self._get_executor()
+        futures = [
+            executor.submit(map_chunk, rows[start:start + self.chunk_rows], log_validation_errors)
+            for start in range(0, len(rows), self.chunk_rows)
+        ]
+        # Merged in order, a conversation keeps the owner and date of its first row
+        mapped = MappedChatRows([], {})
+        for future in futures:
+            records, users = future.result()
+            mapped.records.extend(records)
+            merge_users(mapped.users, users)
+        return mapped
+
+    def load(self, rows: list[ChatTableRow], log_validation_errors: bool = False) -> MappedChatRows:
+        with self._lock:
+            if self._last is not None and self._last[0] is rows and self._last[1] == log_validation_errors:
+                return self._last[2]
+            mapped = self._map(rows, log_validation_errors)
+            self._last = (rows, log_validation_errors, mapped)
+            return mapped
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+            self._last = None
+
+
+_loader: Optional[ChatRowLoader] = None
+_loader_lock = threading.Lock()
+
+
+def get_chat_row_loader() -> ChatRowLoader:
+    """Return the process wide chat row loader, its pool is shut down when the process exits."""
+    global _loader  # pylint: disable=global-statement
+    with _loader_lock:
+        if _loader is None:
+            _loader = ChatRowLoader()
+            atexit.register(_loader.shutdown)
+    return _loader
@@ -1,6 +1,7 @@
 from src.dao.chat_table_dao import ChatTableDaoInterface
 from src.entity.conversation_entity import ConversationEntity
-from src.mapper.conversation_entity_mapper import ChatTableEntityMapper
+from src.repository.chat_row_loader import ChatRowLoader, get_chat_row_loader
+from src.repository.conversation_store import ConversationStore
 
 
 
@@ -11,52 +12,28 @@ class ConversationRepository:
     grouping messages by a common `conversation_id`.
     """
 
-    def __init__(self, chat_table_dao: ChatTableDaoInterface):
+    def __init__(
+        self, chat_table_dao: ChatTableDaoInterface, chat_row_loader: ChatRowLoader | None = None
+    ):
         self.chat_table_dao = chat_table_dao
+        self.chat_row_loader = chat_row_loader or get_chat_row_loader()
+
+    def load_store(
+        self, log_validation_errors: bool = False, keep_content: bool = True
+    ) -> ConversationStore:
+        """
+        This function will return every conversation of the chat table in a compact `ConversationStore`.
+        """
+        mapped = self.chat_row_loader.load(
+            self.chat_table_dao.all(), log_validation_errors=log_validation_errors
+        )
+        return ConversationStore.from_records(mapped.records, keep_content=keep_content)
 
     def list_conversations(
         self, log_validation_errors: bool = False
     ) -> list[ConversationEntity]:
         """
         This function will return a list of all conversations in the chat table.
-        It maps the data from the chat table to the ConversationEntity model.
+        It maps the data from the chat table to the ConversationEntity model, messages sorted by their timestamp.
         """
-
-        # Get all chatrows from the chat table
-        chat_table_rows = self.chat_table_dao.all()
-
-        # This dictionary will store all conversations, with the PartitionKey as the key.
-        # This is done to ensure that we don't have duplicate conversations.
-        unique_conversations_dict: dict[str, ConversationEntity] = {}
-
-        # Loop over all chatrows and create a conversation object for each conversation.
-        for chatrow in chat_table_rows:
-            message = (
-                ChatTableEntityMapper.map_and_validate_to_conversation_message_entity(
-                    chatrow, log_validation_errors=log_validation_errors
-                )
-            )
-
-            if message is None:
-                continue
-
-            conversation_id = message["conversation_id"]
-            convo = unique_conversations_dict.get(conversation_id)
-
-            # If the conversation object does not exist, create a new one.
-            if convo is None:
-                convo = ConversationEntity(
-                    conversation_id=conversation_id,
-                    created_at=message["created_at"],
-                    owner_id=message["owner_id"],
-                    messages=[],
-                )
-                unique_conversations_dict[conversation_id] = convo
-
-            convo["messages"].append(message)
-
-        # Sort messages in each conversation by their created_at timestamp
-        for convo in unique_conversations_dict.values():
-            convo["messages"].sort(key=lambda msg: msg["created_at"])
-
-        return list(unique_conversations_dict.values())
+        return self.load_store(log_validation_errors=log_validation_errors).to_entities()
@@ -0,0 +1,151 @@
+import sys
+from array import array
+from datetime import datetime, timezone
+from typing import Iterable, Iterator
+
+from src.entity.conversation_entity import ConversationEntity, ConversationMessageEntity
+
+_MICROS = 1_000_000
+
+# A message as (conversation id, epoch microseconds, owner id, 1 when sent by the user, message id, content)
+MessageRecord = tuple[str, int, str | None, int, str, str]
+
+
+def to_epoch_micros(iso_date: str) -> int:
+    """Microseconds since the epoch of an ISO 8601 timestamp, naive timestamps are taken as UTC."""
+    parsed = datetime.fromisoformat(iso_date)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp()) * _MICROS + parsed.microsecond
+
+
+def from_epoch_micros(micros: int) -> str:
+    seconds, microsecond = divmod(micros, _MICROS)
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=microsecond).isoformat()
+
+
+def message_record(message: ConversationMessageEntity, keep_content: bool = True) -> MessageRecord:
+    return (
+        message["conversation_id"],
+        to_epoch_micros(message["created_at"]),
+        message["owner_id"],
+        1 if message["sender"] == "user" else 0,
+        message["message_id"],
+        message["content"] if keep_content else "",
+    )
+
+
+class ConversationStore:
+    """
+    Compact, columnar store of the conversations of the chat table.
+
+    Messages are stored sorted by conversation then timestamp, one array per field: owner codes indexing the
+    interned `owners` (-1 when not recorded or empty), int64 epoch microseconds and a byte per sender (1 for the user).
+    The messages of conversation `i` are the rows `offsets[i]` to `offsets[i + 1]`. Contents are only kept with
+    `keep_content`, the usage reports do not need them. `ConversationEntity` dicts are only built on demand by
+    `conversation` and `to_entities`.
+    """
+
+    def __init__(self):
+        self.conversation_ids: list[str] = []
+        self.conversation_owner_codes = array("l")
+        self.conversation_created_at = array("q")
+        self.offsets = array("q", [0])
+        self.owners: list[str] = []
+        self.message_ids: list[str] = []
+        self.contents: list[str] | None = None
+        self.owner_codes = array("l")
+        self.timestamps = array("q")
+        self.senders = bytearray()
+
+    @classmethod
+    def from_messages(
+        cls, messages: Iterable[ConversationMessageEntity], keep_content: bool = True
+    ) -> "ConversationStore":
+        return cls.from_records(
+            (message_record(message, keep_content) for message in messages), keep_content
+        )
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[MessageRecord], keep_content: bool = True
+    ) -> "ConversationStore":
+        store = cls()
+        owner_index: dict[str, int] = {}
+        conversation_index: dict[str, int] = {}
+        pending: list[tuple[int, int, int, int, str, str]] = []
+
+        def owner_code(owner_id: str | None) -> int:
+            if not owner_id:
+                return -1
+            code = owner_index.get(owner_id)
+            if code is None:
+                code = owner_index[owner_id] = len(store.owners)
+                store.owners.append(sys.intern(owner_id))
+            return code
+
+        for conversation_id, timestamp, owner_id, sender, message_id, content in records:
+            code = owner_code(owner_id)
+            conversation_code = conversation_index.get(conversation_id)
+            if conversation_code is None:
+                # Like the repository always did, a conversation takes the owner and date of its first row
+                conversation_code = conversation_index[conversation_id] = len(store.conversation_ids)
+                store.conversation_ids.append(conversation_id)
+                store.conversation_owner_codes.append(code)
+                store.conversation_created_at.append(timestamp)
+            pending.append(
+                (conversation_code, timestamp, code, sender, message_id, content if keep_content else "")
+            )
+
+        pending.sort(key=lambda message: (message[0], message[1]))
+        if keep_content:
+            store.contents = []
+        counts = [0] * len(store.conversation_ids)
+        for conversation_code, timestamp, code, sender, message_id, content in pending:
+            counts[conversation_code] += 1
+            store.timestamps.append(timestamp)
+            store.owner_codes.append(code)
+            store.senders.append(sender)
+            store.message_ids.append(message_id)
+            if store.contents is not None:
+                store.contents.append(content)
+        for count in counts:
+            store.offsets.append(store.offsets[-1] + count)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.conversation_ids)
+
+    @property
+    def message_count(self) -> int:
+        return len(self.timestamps)
+
+    def _owner(self, code: int) -> str | None:
+        return None if code == -1 else self.owners[code]
+
+    def conversation(self, index: int) -> ConversationEntity:
+        """Materialize a conversation and its messages as dicts."""
+        conversation_id = self.conversation_ids[index]
+        messages: list[ConversationMessageEntity] = [
+            ConversationMessageEntity(
+                message_id=self.message_ids[row],
+                conversation_id=conversation_id,
+                created_at=from_epoch_micros(self.timestamps[row]),
+                sender="user" if self.senders[row] else "assistant",
+                content=self.contents[row] if self.contents is not None else "",
+                owner_id=self._owner(self.owner_codes[row]),
+            )
+            for row in range(self.offsets[index], self.offsets[index + 1])
+        ]
+        return ConversationEntity(
+            conversation_id=conversation_id,
+            created_at=from_epoch_micros(self.conversation_created_at[index]),
+            owner_id=self._owner(self.conversation_owner_codes[index]),
+            messages=messages,
+        )
+
+    def __iter__(self) -> Iterator[ConversationEntity]:
+        return (self.conversation(index) for index in range(len(self)))
+
+    def to_entities(self) -> list[ConversationEntity]:
+        return list(self)
@@ -0,0 +1,204 @@
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from src.entity.conversation_entity import ConversationEntity
+from src.entity.usage_rollup_entity import DailyUserRollup
+from src.repository.conversation_store import ConversationStore
+
+SECONDS_PER_DAY = 86400
+# 1970-01-01 (epoch day 0) was a Thursday, weekdays are numbered from Monday (0) like `date.weekday()`
+_EPOCH_WEEKDAY = 3
+
+
+def epoch_seconds(iso_date: str) -> int:
+    """Seconds since the epoch of an ISO 8601 timestamp, naive timestamps are taken as UTC."""
+    parsed = datetime.fromisoformat(iso_date)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+class MessageColumns:
+    """
+    Messages of every conversation as parallel stdlib arrays, each timestamp parsed once. The reports are plain
+    linear loops over these arrays, nothing is vectorized.
+
+    Row `i` is a message: `owner_codes[i]` indexes `owners` (-1 when the owner was not recorded or is empty),
+    `conversation_codes[i]` numbers its conversation, `seconds[i]` and `days[i]` are its epoch second and epoch day
+    (UTC) and `is_user[i]` is 1 for questions and 0 for answers. Built from rollups, a row stands for the
+    `counts[i]` questions of an owner in a conversation on a day (messages have a count of 1).
+    """
+
+    def __init__(self):
+        self.owners: list[str] = []
+        self.owner_codes = array("l")
+        self.conversation_codes = array("l")
+        self.seconds = array("q")
+        self.days = array("l")
+        self.is_user = array("b")
+        self.counts = array("l")
+        self._owner_index: dict[str, int] = {}
+
+    def _owner_code(self, owner_id: str | None) -> int:
+        if not owner_id:
+            return -1
+        owner_code = self._owner_index.get(owner_id)
+        if owner_code is None:
+            owner_code = self._owner_index[owner_id] = len(self.owners)
+            self.owners.append(owner_id)
+        return owner_code
+
+    def _append(self, owner_code: int, conversation_code: int, second: int, is_user: bool, count: int = 1):
+        self.owner_codes.append(owner_code)
+        self.conversation_codes.append(conversation_code)
+        self.seconds.append(second)
+        self.days.append(second // SECONDS_PER_DAY)
+        self.is_user.append(1 if is_user else 0)
+        self.counts.append(count)
+
+    @classmethod
+    def from_conversations(cls, conversations: list[ConversationEntity]) -> "MessageColumns":
+        columns = cls()
+        for conversation_code, conversation in enumerate(conversations):
+            for message in conversation["messages"]:
+                columns._append(
+                    columns._owner_code(message["owner_id"]),
+                    conversation_code,
+                    epoch_seconds(message["created_at"]),
+                    message["sender"] == "user",
+                )
+        return columns
+
+    @classmethod
+    def from_store(cls, store: ConversationStore) -> "MessageColumns":
+        """Reuses the owners and owner codes of the store, nothing is parsed."""
+        columns = cls()
+        columns.owners = store.owners
+        columns.owner_codes = store.owner_codes
+        for conversation_code in range(len(store)):
+            count = store.offsets[conversation_code + 1] - store.offsets[conversation_code]
+            columns.conversation_codes.extend([conversation_code] * count)
+        columns.seconds = array("q", (timestamp // 1_000_000 for timestamp in store.timestamps))
+        columns.days = array("l", (second // SECONDS_PER_DAY for second in columns.seconds))
+        columns.is_user = array("b", store.senders)
+        columns.counts = array("l", [1]) * len(store.timestamps)
+        return columns
+
+    @classmethod
+    def from_rollups(cls, rollups: list[DailyUserRollup]) -> "MessageColumns":
+        """One row per (day, owner, conversation), dated at the start of the day."""
+        columns = cls()
+        conversation_index: dict[str, int] = {}
+        for rollup in rollups:
+            owner_code = columns._owner_code(rollup["owner_id"])
+            second = epoch_seconds(f"{rollup['day']}T00:00:00+00:00")
+            for conversation_id, count in rollup["conversations"].items():
+                conversation_code = conversation_index.setdefault(conversation_id, len(conversation_index))
+                columns._append(owner_code, conversation_code, second, True, count)
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+
+class PeriodAggregate:
+    """Questions of each period (month...) grouped by owner and by (owner, conversation)."""
+
+    def __init__(self):
+        self.questions = 0
+        self.owner_questions: Counter[int] = Counter()
+        self.owner_sessions: Counter[int] = Counter()
+        self._sessions: set[tuple[int, int]] = set()
+
+    def add(self, owner_code: int, conversation_code: int, count: int = 1):
+        self.questions += count
+        if owner_code == -1:
+            return
+        self.owner_questions[owner_code] += count
+        if (owner_code, conversation_code) not in self._sessions:
+            self._sessions.add((owner_code, conversation_code))
+            self.owner_sessions[owner_code] += 1
+
+
+def aggregate_periods(
+    columns: MessageColumns, periods: list[tuple[str, str]]
+) -> list[PeriodAggregate]:
+    """
+    Group the questions by period in a single pass, periods are (start, end) ISO timestamps, both included.
+
+    Each message is bucketed by its epoch day through a day to period lookup, so the cost does not grow with the
+    number of periods.
+    """
+    day_to_period: dict[int, int] = {}
+    bounds = []
+    for index, (start, end) in enumerate(periods):
+        start_second, end_second = epoch_seconds(start), epoch_seconds(end)
+        bounds.append((start_second, end_second))
+        for day in range(start_second // SECONDS_PER_DAY, end_second // SECONDS_PER_DAY + 1):
+            day_to_period.setdefault(day, index)
+
+    aggregates = [PeriodAggregate() for _ in periods]
+    get_period = day_to_period.get
+    for owner_code, conversation_code, second, day, is_user, count in zip(
+        columns.owner_codes, columns.conversation_codes, columns.seconds, columns.days, columns.is_user,
+        columns.counts,
+    ):
+        if not is_user:
+            continue
+        index = get_period(day)
+        if index is None:
+            continue
+        start_second, end_second = bounds[index]
+        # The end of a period is a whole second (23:59:59), the rest of that second still belongs to it
+        if start_second <= second <= end_second:
+            aggregates[index].add(owner_code, conversation_code, count)
+    return aggregates
+
+
+def questions_by_weekday(columns: MessageColumns) -> list[int]:
+    """Number of questions asked on each weekday (UTC), Monday first."""
+    counts = [0] * 7
+    for day, is_user, count in zip(columns.days, columns.is_user, columns.counts):
+        if is_user:
+            counts[(day + _EPOCH_WEEKDAY) % 7] += count
+    return counts
+
+
+def active_owners(columns: MessageColumns) -> set[int]:
+    """Owners who asked at least one question."""
+    return {owner for owner, is_user in zip(columns.owner_codes, columns.is_user) if is_user and owner != -1}
+
+
+def questions_by_owner_since(columns: MessageColumns, start_second: int, end_second: int) -> Counter[int]:
+    """Number of questions asked by each owner between two epoch seconds (included)."""
+    questions: Counter[int] = Counter()
+    for owner, second, is_user, count in zip(columns.owner_codes, columns.seconds, columns.is_user, columns.counts):
+        if is_user and owner != -1 and start_second <= second <= end_second:
+            questions[owner] += count
+    return questions
+
+
+def month_ranges(columns: MessageColumns) -> list[tuple[str, str, str]]:
+    """
+    (label, start, end) of every month from the first to the last question, start and end as ISO timestamps.
+    """
+    days = [day for day, is_user in zip(columns.days, columns.is_user) if is_user]
+    if not days:
+        return []
+    first = datetime.fromtimestamp(min(days) * SECONDS_PER_DAY, timezone.utc)
+    last = datetime.fromtimestamp(max(days) * SECONDS_PER_DAY, timezone.utc)
+    ranges = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        month_end = datetime(next_year, next_month, 1, tzinfo=timezone.utc) - timedelta(days=1)
+        ranges.append(
+            (
+                datetime(year, month, 1).strftime("%b %Y"),
+                f"{year:04d}-{month:02d}-01T00:00:00Z",
+                f"{month_end.date().isoformat()}T23:59:59Z",
+            )
+        )
+        year, month = next_year, next_month
+    return ranges
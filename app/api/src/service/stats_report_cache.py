@@ -0,0 +1,112 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from src.service.stats_report_service import StatsReportService
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECS = int(os.getenv("STATS_REPORT_REFRESH_SECS", "300"))
+
+
+class StatsReportSnapshot(NamedTuple):
+    body: bytes
+    etag: str
+    generated_at: datetime
+
+
+class StatsReportCache:
+    """
+    Precomputes the reports of the `StatsReportService` in a background thread, every `refresh_secs` seconds.
+
+    Requests are served the last snapshot, the JSON body is serialized once with its ETag (a hash of the body), so
+    clients polling with `If-None-Match` cost nothing. A snapshot is only replaced when the reports changed, its
+    `generated_at` is the time the reports it holds were computed. A failed refresh keeps the last snapshot.
+    """
+
+    def __init__(self, stats_report_service: StatsReportService, refresh_secs: float = REFRESH_SECS):
+        self.stats_report_service = stats_report_service
+        self.refresh_secs = refresh_secs
+        self._snapshot: StatsReportSnapshot | None = None
+        self._reports_hash: str | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._metrics = {
+            "refreshes": 0,
+            "failed_refreshes": 0,
+            "last_refresh_duration_ms": None,
+            "last_refresh_at": None,
+        }
+
+    def _compute(self) -> dict:
+        service = self.stats_report_service
+        return {
+            "by_month": service.get_statistics_by_month_of_year(),
+            "by_day_of_week": service.get_statistics_by_day_of_week(),
+            "top_users_past_90_days": service.get_top_users_past_90_days(),
+            "monthly_user_engagement": service.get_monthly_user_engagement_report(),
+            "token_usage": service.get_token_usage_report(),
+        }
+
+    def refresh(self) -> bool:
+        """Compute the reports, returns whether the snapshot changed."""
+        started = time.monotonic()
+        try:
+            reports = json.dumps(self._compute(), sort_keys=True, separators=(",", ":"))
+        except Exception:
+            with self._lock:
+                self._metrics["failed_refreshes"] += 1
+            raise
+        generated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        reports_hash = hashlib.sha256(reports.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._metrics["refreshes"] += 1
+            self._metrics["last_refresh_duration_ms"] = round((time.monotonic() - started) * 1000, 3)
+            self._metrics["last_refresh_at"] = generated_at.isoformat()
+            if reports_hash == self._reports_hash:
+                return False
+            body = f'{{"generated_at":"{generated_at.isoformat()}","reports":{reports}}}'.encode("utf-8")
+            self._snapshot = StatsReportSnapshot(
+                body=body, etag=hashlib.sha256(body).hexdigest()[:32], generated_at=generated_at
+            )
+            self._reports_hash = reports_hash
+            return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Unable to compute the stats reports: %s", e)
+            self._stop.wait(self.refresh_secs)
+
+    def start(self) -> bool:
+        """Compute the reports now then every `refresh_secs` in a background thread, unless it already runs."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="stats-report-refresh", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> StatsReportSnapshot | None:
+        """The last snapshot, None until the first reports are computed."""
+        with self._lock:
+            return self._snapshot
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["generated_at"] = self._snapshot.generated_at.isoformat() if self._snapshot else None
+        metrics["refresh_secs"] = self.refresh_secs
+        return metrics
@@ -1,7 +1,31 @@
+import os
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import TypedDict
-from src.entity.conversation_entity import ConversationEntity
+from src.dao.completion_usage.completion_usage_dao_types import BaseCompletionUsageDao
+from src.entity.completion_usage_entity import CompletionUsage
 from src.repository.conversation_repository import ConversationRepository
+from src.repository.conversation_store import ConversationStore
+from src.service.stats_aggregation import (
+    SECONDS_PER_DAY,
+    MessageColumns,
+    PeriodAggregate,
+    active_owners,
+    aggregate_periods,
+    month_ranges,
+    questions_by_owner_since,
+    questions_by_weekday,
+)
+from src.service.token_usage_aggregation import (
+    TokenTotals,
+    prompt_outliers,
+    prompt_size_distribution,
+    totals_by,
+    totals_by_tool,
+    usage_day,
+)
+from src.service.usage_rollup_service import UsageRollupService
 from src.service.stats_report_service_types import (
     MonthlyUserEngagement,
     DistributionOfSessionsPerUser,
@@ -18,57 +42,95 @@ class MonthlyReportRow(TypedDict):
     average_questions_per_user: float
 
 
+# How often the reports catch up with the new chat rows, when computed from the usage rollups
+ROLLUP_REFRESH_SECS = int(os.getenv("STATS_ROLLUP_REFRESH_SECS", "300"))
+# The completions of that many seconds before the newest one read are read again, so completions committed late
+# with an older Timestamp are not missed
+USAGE_OVERLAP_SECS = int(os.getenv("STATS_USAGE_OVERLAP_SECS", "300"))
+
+WEEKDAYS = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
 class StatsReportService:
-    def __init__(self, conversation_repository: ConversationRepository):
-        self.conversations_cache: list[ConversationEntity] = []
+    """
+    Usage reports of the chat. The data is loaded once and turned into `MessageColumns`, every report is then
+    computed in a single pass over those columns (see `stats_aggregation`).
+
+    With a `usage_rollup_service`, the columns are built from the daily usage rollups, refreshed every
+    ROLLUP_REFRESH_SECS, instead of every conversation of the chat table. The months of the reports go from the
+    first to the last question.
+
+    With a `completion_usage_dao`, `get_token_usage_report` reports the tokens and tools of the completions, only
+    the completions written since the last report (less USAGE_OVERLAP_SECS) are read. They are kept by
+    (conversation_id, message_id), the PartitionKey and RowKey of their row, so a completion read again or
+    rewritten is only counted once.
+    """
+
+    def __init__(
+        self,
+        conversation_repository: ConversationRepository,
+        usage_rollup_service: UsageRollupService | None = None,
+        completion_usage_dao: BaseCompletionUsageDao | None = None,
+    ):
+        self.conversation_store: ConversationStore | None = None
+        self.columns_cache: MessageColumns | None = None
+        self.columns_refreshed_at: float | None = None
         self.conversation_repository = conversation_repository
+        self.usage_rollup_service = usage_rollup_service
+        self.completion_usage_dao = completion_usage_dao
+        self.completion_usages: dict[tuple[str, str], CompletionUsage] = {}
+        self.completion_usages_high_water_mark: datetime | None = None
+        self._lock = threading.Lock()
+        self._usage_lock = threading.Lock()
 
     def _get_date_ranges(self):
-        return [
-            ("May 2024", "2024-05-01T00:00:00Z", "2024-05-31T23:59:59Z"),
-            ("Jun 2024", "2024-06-01T00:00:00Z", "2024-06-30T23:59:59Z"),
-            ("Jul 2024", "2024-07-01T00:00:00Z", "2024-07-31T23:59:59Z"),
-            ("Aug 2024", "2024-08-01T00:00:00Z", "2024-08-31T23:59:59Z"),
-            ("Sep 2024", "2024-09-01T00:00:00Z", "2024-09-30T23:59:59Z"),
-            ("Oct 2024", "2024-10-01T00:00:00Z", "2024-10-31T23:59:59Z"),
-            ("Nov 2024", "2024-11-01T00:00:00Z", "2024-11-30T23:59:59Z"),
-            ("Dec 2024", "2024-12-01T00:00:00Z", "2024-12-31T23:59:59Z"),
-            ("Jan 2025", "2025-01-01T00:00:00Z", "2025-01-31T23:59:59Z"),
-        ]
+        return month_ranges(self._get_columns())
+
+    def _get_columns(self) -> MessageColumns:
+        if self.usage_rollup_service is not None:
+            return self._get_rollup_columns()
+        if not self.conversation_store:
+            self.conversation_store = self.conversation_repository.load_store(keep_content=False)
+            self.columns_cache = None
+        if self.columns_cache is None:
+            self.columns_cache = MessageColumns.from_store(self.conversation_store)
+        return self.columns_cache
+
+    def _get_rollup_columns(self) -> MessageColumns:
+        with self._lock:
+            expired = (
+                self.columns_refreshed_at is None
+                or time.monotonic() - self.columns_refreshed_at > ROLLUP_REFRESH_SECS
+            )
+            if self.columns_cache is None or expired:
+                self.usage_rollup_service.refresh()
+                self.columns_cache = MessageColumns.from_rollups(
+                    self.usage_rollup_service.rollups()
+                )
+                self.columns_refreshed_at = time.monotonic()
+            return self.columns_cache
+
+    def _get_monthly_aggregates(self) -> list[PeriodAggregate]:
+        date_ranges = self._get_date_ranges()
+        return aggregate_periods(
+            self._get_columns(), [(start, end) for _, start, end in date_ranges]
+        )
 
     def get_statistics_by_month_of_year(self):
-        if not self.conversations_cache:
-            self.conversations_cache = self.conversation_repository.list_conversations()
-
-        conversations = self.conversations_cache
         date_ranges = self._get_date_ranges()
-
         rows: list[MonthlyReportRow] = []
 
-        for date_range in date_ranges:
-            # Active users
-            active_users_set: set[str] = set()
-            for conversation in conversations:
-                for message in conversation["messages"]:
-                    owner_id = message["owner_id"]
-                    if (
-                        owner_id is not None
-                        and date_range[1] <= message["created_at"] <= date_range[2]
-                        and message["sender"] == "user"
-                    ):
-                        active_users_set.add(owner_id)
-
-            active_users_count = len(active_users_set)
-
-            # Total questions asked
-            total_questions_asked = 0
-            for conversation in conversations:
-                for message in conversation["messages"]:
-                    if (
-                        date_range[1] <= message["created_at"] <= date_range[2]
-                        and message["sender"] == "user"
-                    ):
-                        total_questions_asked += 1
+        for date_range, aggregate in zip(date_ranges, self._get_monthly_aggregates()):
+            active_users_count = len(aggregate.owner_questions)
+            total_questions_asked = aggregate.questions
 
             # Average questions asked per day
             start_day = datetime.fromisoformat(date_range[1])
@@ -98,10 +160,7 @@ class StatsReportService:
         return rows
 
     def get_statistics_by_day_of_week(self):
-        if not self.conversations_cache:
-            self.conversations_cache = self.conversation_repository.list_conversations()
-
-        conversations = self.conversations_cache
+        columns = self._get_columns()
         days = [
             "Sunday",
             "Monday",
@@ -113,28 +172,17 @@ class StatsReportService:
         ]
         date_ranges = self._get_date_ranges()
 
-        active_users: set[str] = set()
-        for conversation in conversations:
-            for message in conversation["messages"]:
-                owner_id = message["owner_id"]
-                if owner_id is not None and message["sender"] == "user":
-                    active_users.add(owner_id)
-
-        active_users_count = len(active_users)
+        active_users_count = len(active_owners(columns))
+        # Monday first, like `date.weekday()`
+        questions_per_weekday = questions_by_weekday(columns)
         statistics = []
 
         for day_name in days:
-            total_questions_asked = 0
-            for conversation in conversations:
-                for message in conversation["messages"]:
-                    if (
-                        message["sender"] == "user"
-                        and datetime.fromisoformat(message["created_at"]).strftime("%A")
-                        == day_name
-                    ):
-                        total_questions_asked += 1
-
-            average_questions_per_day = total_questions_asked / len(date_ranges)
+            total_questions_asked = questions_per_weekday[WEEKDAYS.index(day_name)]
+
+            average_questions_per_day = (
+                total_questions_asked / len(date_ranges) if date_ranges else 0
+            )
             average_questions_per_user = (
                 total_questions_asked / active_users_count
                 if active_users_count > 0
@@ -155,32 +203,18 @@ class StatsReportService:
         return statistics
 
     def get_top_users_past_90_days(self):
-        if not self.conversations_cache:
-            self.conversations_cache = self.conversation_repository.list_conversations()
+        columns = self._get_columns()
 
-        conversations = self.conversations_cache
-
-        date_range = (
-            datetime.now().isoformat(),
-            (datetime.now() - timedelta(days=90)).isoformat(),
+        now = int(time.time())
+        active_users = questions_by_owner_since(
+            columns, now - 90 * SECONDS_PER_DAY, now
         )
 
-        active_users: dict[str, int] = {}
-
-        for conversation in conversations:
-            for message in conversation["messages"]:
-                owner_id = message["owner_id"]
-                if (
-                    owner_id is not None
-                    and date_range[1] <= message["created_at"] <= date_range[0]
-                    and message["sender"] == "user"
-                ):
-                    if owner_id in active_users:
-                        active_users[owner_id] += 1
-                    else:
-                        active_users[owner_id] = 1
-
-        sorted_users = sorted(active_users.items(), key=lambda x: x[1], reverse=True)
+        sorted_users = sorted(
+            ((columns.owners[owner], count) for owner, count in active_users.items()),
+            key=lambda x: x[1],
+            reverse=True,
+        )
 
         return sorted_users
 
@@ -192,39 +226,15 @@ class StatsReportService:
         # - Average questions per user: the total questions asked divided by the number of active users.
         # - Distribution of number of sessions per user: the number of users who asked 1 question, 2 questions, 3 questions, etc. in the month.
         #     - The buckets should be 1, 2, 3, 4, 5, 6-10, 11-20, 21-50, 51-100, 100+.
-        if not self.conversations_cache:
-            self.conversations_cache = self.conversation_repository.list_conversations()
-
         date_ranges = self._get_date_ranges()
         monthly_engagement: list[MonthlyUserEngagement] = []
 
-        for month_label, month_start_iso_date, month_end_iso_date in date_ranges:
-            user_questions = {}
-            user_sessions = {}
-
-            for conversation in self.conversations_cache:
-                users_in_convo = set()
-                for message in conversation["messages"]:
-                    if (
-                        month_start_iso_date
-                        <= message["created_at"]
-                        <= month_end_iso_date
-                        and message["sender"] == "user"
-                    ):
-                        owner_id = message["owner_id"]
-                        if owner_id:
-                            # Count the number of questions asked by each user
-                            user_questions[owner_id] = (
-                                user_questions.get(owner_id, 0) + 1
-                            )
-                            users_in_convo.add(owner_id)
-
-                for user_id in users_in_convo:
-                    # Count the number of sessions per user
-                    user_sessions[user_id] = user_sessions.get(user_id, 0) + 1
-
-            active_users_count = len(user_questions)
-            total_questions_asked = sum(user_questions.values())
+        for (month_label, month_start_iso_date, month_end_iso_date), aggregate in zip(
+            date_ranges, self._get_monthly_aggregates()
+        ):
+            active_users_count = len(aggregate.owner_questions)
+            # Questions of users that were not recorded are left out of the engagement
+            total_questions_asked = sum(aggregate.owner_questions.values())
             average_questions_per_user = (
                 round(total_questions_asked / active_users_count, 2)
                 if active_users_count
@@ -255,7 +265,7 @@ class StatsReportService:
                     "100+",
                 ],
             }
-            for _, session_count in user_sessions.items():
+            for session_count in aggregate.owner_sessions.values():
                 if session_count <= 5:
                     distribution[str(session_count)] += 1
                 elif session_count <= 10:
@@ -284,4 +294,59 @@ class StatsReportService:
         # reverse so that the most recent month is first
         monthly_engagement.reverse()
 
-        return monthly_engagement
\ No newline at end of file
+        return monthly_engagement
+
+    def _get_completion_usages(self) -> list[CompletionUsage]:
+        with self._usage_lock:
+            high_water_mark = self.completion_usages_high_water_mark
+            after = high_water_mark - timedelta(seconds=USAGE_OVERLAP_SECS) if high_water_mark else None
+            for usage in self.completion_usage_dao.since(after):
+                self.completion_usages[(usage["conversation_id"], usage["message_id"])] = usage
+                if high_water_mark is None or usage["timestamp"] > high_water_mark:
+                    high_water_mark = usage["timestamp"]
+            self.completion_usages_high_water_mark = high_water_mark
+            return list(self.completion_usages.values())
+
+    def get_token_usage_report(self, outlier_limit: int = 20):
+        # Tokens by day, user, tool and search index, and the distribution of the prompt sizes with the largest
+        # prompts (outliers): the conversations driving the cost and latency of the deployments.
+        if self.completion_usage_dao is None:
+            return None
+        usages = self._get_completion_usages()
+
+        by_tool, by_index = totals_by_tool(usages)
+        distribution = prompt_size_distribution([usage["prompt_tokens"] for usage in usages])
+        by_user = totals_by(usages, lambda usage: usage["owner_id"])
+        totals = TokenTotals()
+        for usage in usages:
+            totals.add(usage)
+
+        return {
+            "totals": totals.to_dict(),
+            "by_day": [
+                {"day": day, **totals.to_dict()}
+                for day, totals in sorted(totals_by(usages, usage_day).items())
+            ],
+            "by_user": [
+                {"owner_id": owner_id, **totals.to_dict()}
+                for owner_id, totals in sorted(
+                    by_user.items(), key=lambda item: item[1].total_tokens, reverse=True
+                )
+            ],
+            "by_tool": [
+                {"tool_type": tool_type, "function_name": function_name, **totals.to_dict(with_calls=True)}
+                for (tool_type, function_name), totals in sorted(
+                    by_tool.items(), key=lambda item: item[1].total_tokens, reverse=True
+                )
+            ],
+            "by_index": [
+                {"index_name": index_name, **totals.to_dict(with_calls=True)}
+                for index_name, totals in sorted(
+                    by_index.items(), key=lambda item: item[1].total_tokens, reverse=True
+                )
+            ],
+            "prompt_tokens_distribution": distribution,
+            "prompt_outliers": prompt_outliers(
+                usages, distribution.get("outlier_threshold"), outlier_limit
+            ),
+        }
@@ -0,0 +1,61 @@
+import json
+from typing import cast
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.service.stats_report_cache import StatsReportCache
+from src.service.stats_report_service import StatsReportService
+
+
+def _service(questions: int = 3) -> MagicMock:
+    service = MagicMock()
+    service.get_statistics_by_month_of_year.return_value = [{"month_label": "May 2024", "total_questions_asked": questions}]
+    service.get_statistics_by_day_of_week.return_value = []
+    service.get_top_users_past_90_days.return_value = [("1", questions)]
+    service.get_monthly_user_engagement_report.return_value = []
+    service.get_token_usage_report.return_value = None
+    return service
+
+
+def test_reports_are_precomputed_once_with_an_etag():
+    service = _service()
+    cache = StatsReportCache(cast(StatsReportService, service))
+    assert cache.snapshot() is None
+
+    assert cache.refresh() is True
+    snapshot = cache.snapshot()
+    body = json.loads(snapshot.body)
+    assert body["generated_at"] == snapshot.generated_at.isoformat()
+    assert body["reports"]["top_users_past_90_days"] == [["1", 3]]
+
+    cache.snapshot()
+    assert service.get_statistics_by_month_of_year.call_count == 1
+
+
+def test_the_snapshot_only_changes_with_the_reports():
+    service = _service()
+    cache = StatsReportCache(cast(StatsReportService, service))
+    cache.refresh()
+    first = cache.snapshot()
+
+    assert cache.refresh() is False
+    assert cache.snapshot() is first
+
+    service.get_top_users_past_90_days.return_value = [("1", 4)]
+    assert cache.refresh() is True
+    assert cache.snapshot().etag != first.etag
+
+
+def test_a_failed_refresh_keeps_the_last_snapshot():
+    service = _service()
+    cache = StatsReportCache(cast(StatsReportService, service))
+    cache.refresh()
+    first = cache.snapshot()
+
+    service.get_statistics_by_day_of_week.side_effect = RuntimeError("table unavailable")
+    with pytest.raises(RuntimeError):
+        cache.refresh()
+
+    assert cache.snapshot() is first
+    assert cache.metrics()["failed_refreshes"] == 1
@@ -5,6 +5,8 @@ from unittest.mock import MagicMock
 from pytest import fixture
 
 from src.dao.chat_table_dao_types import ChatTableDaoInterface
+from src.dao.completion_usage.memory_completion_usage_dao import MemoryCompletionUsageDao
+from src.entity.completion_usage_entity import CompletionUsage, ToolUsage
 from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
 from src.repository.conversation_repository import ConversationRepository
 from src.service.stats_report_service import StatsReportService
@@ -53,3 +55,105 @@ def test_empty_database_returns_empty_results(ctx: TstContext):
 #     conversation_repository = ConversationRepository(mock_instance)
 #     conversations = conversation_repository.list_conversations()
 #     assert len(conversations) == 0
+
+
+def _row(conversation_id: str, row_key: str, timestamp: str, oid: str | None, question: bool = True) -> ChatTableRow:
+    return ChatTableRow(
+        metadata=TableRowMetadata(timestamp=datetime.fromisoformat(timestamp)),
+        Question="Hello?" if question else None,
+        Answer=None if question else "Hi!",
+        oid=oid,
+        PartitionKey=conversation_id,
+        RowKey=row_key,
+        preferred_username=None,
+    )
+
+
+def _service(rows: list[ChatTableRow]) -> StatsReportService:
+    mock_chat_table_dao = MagicMock()
+    mock_chat_table_dao.all.return_value = rows
+    return StatsReportService(ConversationRepository(cast(ChatTableDaoInterface, mock_chat_table_dao)))
+
+
+def test_reports_are_aggregated_by_month_weekday_and_user():
+    service = _service([
+        # Friday 2024-05-31, the last second of May
+        _row("c1", "q1", "2024-05-31T23:59:59.500000+00:00", "alice"),
+        _row("c1", "a1", "2024-05-31T23:59:59.900000+00:00", "alice", question=False),
+        # Saturday 2024-06-01
+        _row("c1", "q2", "2024-06-01T00:00:00+00:00", "alice"),
+        _row("c2", "q3", "2024-06-01T10:00:00+00:00", "alice"),
+        _row("c3", "q4", "2024-06-01T11:00:00+00:00", "bob"),
+        _row("c4", "q5", "2024-06-01T12:00:00+00:00", None),
+        _row("c5", "q6", "2024-06-01T13:00:00+00:00", ""),
+    ])
+
+    monthly = {row["month_label"]: row for row in service.get_statistics_by_month_of_year()}
+    assert (monthly["May 2024"]["active_users"], monthly["May 2024"]["total_questions_asked"]) == (1, 1)
+    assert (monthly["Jun 2024"]["active_users"], monthly["Jun 2024"]["total_questions_asked"]) == (2, 5)
+    assert monthly["Jun 2024"]["average_questions_asked_per_day"] == 0.17
+    # The months go from the first to the last question
+    assert list(monthly) == ["May 2024", "Jun 2024"]
+
+    weekdays = {row["day_of_week"]: row["total_questions_asked"] for row in service.get_statistics_by_day_of_week()}
+    assert weekdays == {"Sunday": 0, "Monday": 0, "Tuesday": 0, "Wednesday": 0, "Thursday": 0, "Friday": 1,
+                        "Saturday": 5}
+
+    engagement = {row["month_label"]: row for row in service.get_monthly_user_engagement_report()}
+    june = engagement["Jun 2024"]
+    # The questions without a recorded user are not part of the engagement
+    assert (june["active_users"], june["total_questions_asked"]) == (2, 3)
+    # alice asked in two conversations (sessions), bob in one
+    assert june["distribution_of_sessions_per_user"]["1"] == 1
+    assert june["distribution_of_sessions_per_user"]["2"] == 1
+    assert service.get_top_users_past_90_days() == []
+
+
+def _usage(message_id: str, timestamp: str, owner_id: str, prompt_tokens: int, tools=()) -> CompletionUsage:
+    return CompletionUsage(
+        conversation_id=f"c-{message_id}",
+        message_id=message_id,
+        timestamp=datetime.fromisoformat(timestamp),
+        owner_id=owner_id,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=10,
+        total_tokens=prompt_tokens + 10,
+        tools=[ToolUsage(tool_type=tool_type, function_name=function_name, count=count, index_name=index_name)
+               for tool_type, function_name, count, index_name in tools],
+    )
+
+
+def test_token_usage_is_reported_by_day_user_tool_and_index():
+    search = ("corporate", "intranet_question", 1, "current")
+    usage_dao = MemoryCompletionUsageDao([
+        _usage(f"m{number}", f"2024-06-0{1 + number % 2}T12:00:00+00:00", "alice", 100 + number, [search])
+        for number in range(10)
+    ] + [_usage("runaway", "2024-06-02T13:00:00+00:00", "bob", 9000, [("geds", "get_employee_information", 2, None)])])
+    mock_chat_table_dao = MagicMock()
+    service = StatsReportService(
+        ConversationRepository(cast(ChatTableDaoInterface, mock_chat_table_dao)), completion_usage_dao=usage_dao
+    )
+
+    report = service.get_token_usage_report()
+
+    assert report["totals"] == {"completions": 11, "prompt_tokens": 10045, "completion_tokens": 110,
+                                "total_tokens": 10155}
+    assert [(day["day"], day["completions"]) for day in report["by_day"]] == [("2024-06-01", 5), ("2024-06-02", 6)]
+    assert [(user["owner_id"], user["total_tokens"]) for user in report["by_user"]] == [("bob", 9010), ("alice", 1145)]
+    assert [(tool["function_name"], tool["calls"]) for tool in report["by_tool"]] == [
+        ("get_employee_information", 2), ("intranet_question", 10)]
+    assert report["by_index"] == [{"index_name": "current", "completions": 10, "calls": 10, "prompt_tokens": 1045,
+                                   "completion_tokens": 100, "total_tokens": 1145}]
+    assert report["prompt_tokens_distribution"]["max"] == 9000
+    assert report["prompt_tokens_distribution"]["p50"] == 105
+    assert [outlier["message_id"] for outlier in report["prompt_outliers"]] == ["runaway"]
+
+    # Only the new completions are read again, with those of the overlap, each counted once
+    usage_dao.usages.append(_usage("late", "2024-06-03T08:00:00+00:00", "alice", 50))
+    assert service.get_token_usage_report()["totals"]["completions"] == 12
+    usage_dao.usages.append(_usage("early", "2024-06-03T07:58:00+00:00", "alice", 50))
+    usage_dao.usages.append(_usage("late", "2024-06-03T08:01:00+00:00", "alice", 60))
+    report = service.get_token_usage_report()
+    assert report["totals"]["completions"] == 13
+    assert report["totals"]["prompt_tokens"] == 10045 + 50 + 60
+    assert service.completion_usages_high_water_mark == datetime.fromisoformat("2024-06-03T08:01:00+00:00")
@@ -0,0 +1,139 @@
+from datetime import datetime
+from typing import cast
+from unittest.mock import MagicMock
+
+from src.dao.chat_table_dao_types import ChatTableDaoInterface
+from src.dao.usage_rollup.memory_usage_rollup_dao import MemoryUsageRollupDao
+from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
+from src.repository.conversation_repository import ConversationRepository
+from src.service.stats_report_service import StatsReportService
+from src.service.usage_rollup_service import UsageRollupService
+
+
+def _row(conversation_id: str, row_key: str, timestamp: str, oid: str | None, question: bool = True) -> ChatTableRow:
+    return ChatTableRow(
+        metadata=TableRowMetadata(timestamp=datetime.fromisoformat(timestamp)),
+        Question="Hello?" if question else None,
+        Answer=None if question else "Hi!",
+        oid=oid,
+        PartitionKey=conversation_id,
+        RowKey=row_key,
+        preferred_username=None,
+    )
+
+
+ROWS = [
+    _row("c1", "q1", "2024-05-31T23:00:00+00:00", "alice"),
+    _row("c1", "a1", "2024-05-31T23:00:05+00:00", "alice", question=False),
+    _row("c1", "q2", "2024-06-01T09:00:00+00:00", "alice"),
+    _row("c2", "q3", "2024-06-01T10:00:00+00:00", "alice"),
+    _row("c3", "q4", "2024-06-03T11:00:00+00:00", "bob"),
+    _row("c4", "q5", "2024-07-02T12:00:00+00:00", None),
+]
+
+
+class FakeChatTableDao(ChatTableDaoInterface):
+    def __init__(self, rows: list[ChatTableRow]):
+        self.rows = rows
+        self.since_calls: list[datetime | None] = []
+
+    def all(self) -> list[ChatTableRow]:
+        return self.rows
+
+    def since(self, after: datetime | None) -> list[ChatTableRow]:
+        self.since_calls.append(after)
+        return [row for row in self.rows if after is None or row["metadata"]["timestamp"] > after]
+
+    def conversation(self, conversation_id: str) -> list[ChatTableRow]:
+        return [row for row in self.rows if row["PartitionKey"] == conversation_id]
+
+
+class LostHighWaterMarkDao(MemoryUsageRollupDao):
+    """The high-water mark is never moved, like when another worker moves it first or the refresh is retried."""
+
+    def set_high_water_mark(self, high_water_mark: datetime, etag: str | None) -> bool:
+        return False
+
+
+def test_rollups_are_updated_from_the_new_rows_only():
+    chat_table_dao = FakeChatTableDao(ROWS[:3])
+    rollup_dao = MemoryUsageRollupDao()
+    service = UsageRollupService(chat_table_dao, rollup_dao, overlap_secs=0)
+
+    assert service.refresh() == 2
+    chat_table_dao.rows = ROWS
+    assert service.refresh() == 3
+    assert service.refresh() == 0
+
+    assert chat_table_dao.since_calls[1] == datetime.fromisoformat("2024-06-01T09:00:00+00:00")
+    assert service.high_water_mark() == datetime.fromisoformat("2024-07-02T12:00:00+00:00")
+    rollups = {(rollup["day"], rollup["owner_id"]): rollup for rollup in service.rollups()}
+    assert rollups[("2024-06-01", "alice")]["questions"] == 2
+    assert rollups[("2024-06-01", "alice")]["conversations"] == {"c1": 1, "c2": 1}
+    assert rollups[("2024-07-02", None)]["questions"] == 1
+
+
+def test_refreshing_the_same_rows_again_does_not_count_them_twice():
+    chat_table_dao = FakeChatTableDao(ROWS)
+    service = UsageRollupService(chat_table_dao, LostHighWaterMarkDao())
+
+    assert service.refresh() == 5
+    assert service.refresh() == 5
+
+    assert chat_table_dao.since_calls == [None, None]
+    rollups = {(rollup["day"], rollup["owner_id"]): rollup for rollup in service.rollups()}
+    assert rollups[("2024-06-01", "alice")]["questions"] == 2
+    assert rollups[("2024-06-01", "alice")]["conversations"] == {"c1": 1, "c2": 1}
+    assert sum(rollup["questions"] for rollup in rollups.values()) == 5
+
+
+def test_rows_committed_late_within_the_overlap_are_counted():
+    chat_table_dao = FakeChatTableDao([ROWS[2], ROWS[3]])
+    service = UsageRollupService(chat_table_dao, MemoryUsageRollupDao(), overlap_secs=3600)
+    service.refresh()
+    # Written before q3 but committed after the refresh
+    chat_table_dao.rows.append(_row("c5", "q6", "2024-06-01T09:30:00+00:00", "alice"))
+
+    assert service.refresh() == 2  # q6 and q3, read again
+    rollups = {(rollup["day"], rollup["owner_id"]): rollup for rollup in service.rollups()}
+    assert rollups[("2024-06-01", "alice")]["conversations"] == {"c1": 1, "c2": 1, "c5": 1}
+    assert service.high_water_mark() == datetime.fromisoformat("2024-06-01T10:00:00+00:00")
+
+
+def test_high_water_mark_is_only_moved_from_the_version_read():
+    rollup_dao = MemoryUsageRollupDao()
+    first = datetime.fromisoformat("2024-06-01T00:00:00+00:00")
+    second = datetime.fromisoformat("2024-06-02T00:00:00+00:00")
+
+    assert rollup_dao.get_high_water_mark() == (None, None)
+    assert rollup_dao.set_high_water_mark(first, None)
+    assert not rollup_dao.set_high_water_mark(second, None)
+    high_water_mark, etag = rollup_dao.get_high_water_mark()
+    assert high_water_mark == first
+    assert rollup_dao.set_high_water_mark(second, etag)
+    assert not rollup_dao.set_high_water_mark(first, etag)
+    assert rollup_dao.get_high_water_mark()[0] == second
+
+
+def test_reports_from_rollups_match_the_reports_from_conversations():
+    mock_chat_table_dao = MagicMock()
+    mock_chat_table_dao.all.return_value = ROWS
+    from_conversations = StatsReportService(
+        ConversationRepository(cast(ChatTableDaoInterface, mock_chat_table_dao))
+    )
+    from_rollups = StatsReportService(
+        ConversationRepository(cast(ChatTableDaoInterface, mock_chat_table_dao)),
+        UsageRollupService(FakeChatTableDao(ROWS), MemoryUsageRollupDao()),
+    )
+
+    for report in (
+        "get_statistics_by_month_of_year",
+        "get_statistics_by_day_of_week",
+        "get_monthly_user_engagement_report",
+    ):
+        assert getattr(from_rollups, report)() == getattr(from_conversations, report)()
+    assert [row["month_label"] for row in from_rollups.get_statistics_by_month_of_year()] == [
+        "May 2024",
+        "Jun 2024",
+        "Jul 2024",
+    ]
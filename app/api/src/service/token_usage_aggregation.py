@@ -0,0 +1,117 @@
+import statistics
+from datetime import timezone
+from typing import Callable, Iterable
+
+from src.entity.completion_usage_entity import CompletionUsage
+
+# Prompts above the third quartile plus this many interquartile ranges are outliers (Tukey's far out values)
+OUTLIER_IQR_FACTOR = 3.0
+_PERCENTILES = (50, 90, 95, 99)
+
+
+class TokenTotals:
+    """Completions and tokens of a group (day, user, tool...), `calls` counts the calls of the tools."""
+
+    def __init__(self):
+        self.completions = 0
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+
+    def add(self, usage: CompletionUsage, calls: int = 0):
+        self.completions += 1
+        self.calls += calls
+        self.prompt_tokens += usage["prompt_tokens"]
+        self.completion_tokens += usage["completion_tokens"]
+        self.total_tokens += usage["total_tokens"]
+
+    def to_dict(self, with_calls: bool = False) -> dict:
+        totals = {
+            "completions": self.completions,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+        }
+        if with_calls:
+            totals["calls"] = self.calls
+        return totals
+
+
+def usage_day(usage: CompletionUsage) -> str:
+    """The UTC day of a completion, YYYY-MM-DD."""
+    timestamp = usage["timestamp"]
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc).date().isoformat()
+
+
+def totals_by(usages: Iterable[CompletionUsage], key: Callable[[CompletionUsage], object]) -> dict:
+    totals: dict = {}
+    for usage in usages:
+        group = key(usage)
+        if group not in totals:
+            totals[group] = TokenTotals()
+        totals[group].add(usage)
+    return totals
+
+
+def totals_by_tool(usages: Iterable[CompletionUsage]) -> tuple[dict, dict]:
+    """
+    Totals by (tool_type, function_name) and by search index. A completion counts in full for each tool it called,
+    the tools of an answer are not apportioned.
+    """
+    by_tool: dict[tuple[str, str], TokenTotals] = {}
+    by_index: dict[str, TokenTotals] = {}
+    for usage in usages:
+        for tool in usage["tools"]:
+            key = (tool["tool_type"], tool["function_name"])
+            by_tool.setdefault(key, TokenTotals()).add(usage, tool["count"])
+            if tool["index_name"]:
+                by_index.setdefault(tool["index_name"], TokenTotals()).add(usage, tool["count"])
+    return by_tool, by_index
+
+
+def prompt_size_distribution(prompt_tokens: list[int]) -> dict:
+    """Count, mean, min, max and percentiles of the prompt sizes, with the threshold above which they are outliers."""
+    if not prompt_tokens:
+        return {"count": 0}
+    distribution: dict = {
+        "count": len(prompt_tokens),
+        "mean": round(statistics.fmean(prompt_tokens), 2),
+        "min": min(prompt_tokens),
+        "max": max(prompt_tokens),
+        "outlier_threshold": None,
+    }
+    if len(prompt_tokens) < 2:
+        return distribution
+    cuts = statistics.quantiles(prompt_tokens, n=100, method="inclusive")
+    for percentile in _PERCENTILES:
+        distribution[f"p{percentile}"] = round(cuts[percentile - 1], 2)
+    first_quartile, _, third_quartile = statistics.quantiles(prompt_tokens, n=4, method="inclusive")
+    distribution["outlier_threshold"] = round(
+        third_quartile + OUTLIER_IQR_FACTOR * (third_quartile - first_quartile), 2
+    )
+    return distribution
+
+
+def prompt_outliers(usages: Iterable[CompletionUsage], threshold: float | None, limit: int) -> list[dict]:
+    """The `limit` largest prompts above the threshold, largest first."""
+    if threshold is None:
+        return []
+    outliers = sorted(
+        (usage for usage in usages if usage["prompt_tokens"] > threshold),
+        key=lambda usage: usage["prompt_tokens"],
+        reverse=True,
+    )[:limit]
+    return [
+        {
+            "conversation_id": usage["conversation_id"],
+            "message_id": usage["message_id"],
+            "owner_id": usage["owner_id"],
+            "created_at": usage["timestamp"].isoformat(),
+            "prompt_tokens": usage["prompt_tokens"],
+            "total_tokens": usage["total_tokens"],
+        }
+        for usage in outliers
+    ]
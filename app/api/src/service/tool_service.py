@@ -93,12 +93,13 @@ class ToolService:
             })
 
             # Here we process the "message" so we can collect the function called and return it in a different format.
-            self._process_function_for_payload(function_name,response_as_string)
+            # The structured response is passed along so tools do not have to parse their own output again.
+            self._process_function_for_payload(function_name, response_as_string, function_response)
             # reworking with this example to refine a bit:
             # https://learn.microsoft.com/en-us/azure/ai-services/openai/how-to/function-calling?tabs=python#working-with-function-calling
         return returned_messages
 
-    def _process_function_for_payload(self, function_name: str, response_as_string: str):
+    def _process_function_for_payload(self, function_name: str, response_as_string: str, function_response=None):
         """
         Process the function response for payload
         """
@@ -121,9 +122,12 @@ class ToolService:
 
                 data = {}
                 if tool_type == TOOL_GEDS:
-                    data = self._process_geds_function_for_payload(function_name, response_as_string)
-                elif tool_type == TOOL_CORPORATE or tool_type == TOOL_PMCOE:
-                    pass
+                    data = self._process_geds_function_for_payload(function_name, response_as_string,
+                                                                   function_response)
+                elif tool_type in (TOOL_CORPORATE, TOOL_PMCOE, TOOL_TELECOM):
+                    # The search tools answer with the config of the index to search, kept for the usage reports
+                    if isinstance(function_response, dict) and function_response.get("index_name"):
+                        data = {"index_name": function_response["index_name"]}
                 elif tool_type == TOOL_ARCHIBUS:
                     data = self._process_archibus_function_for_payload(function_name, response_as_string)
                 elif tool_type == TOOL_BR:
@@ -147,13 +151,15 @@ class ToolService:
                             tool_info.payload[key] = value
 
 
-    def _process_geds_function_for_payload(self, function_name: str, response_as_string: str) -> dict | None:
+    def _process_geds_function_for_payload(self, function_name: str, response_as_string: str,
+                                           function_response=None) -> dict | None:
         """
-        Process the message for geds tool
+        Process the message for geds tool, from the structured function response when there is one
         """
-        if function_name == "get_employee_information":
-            if response_as_string is not None:
-                profiles = extract_geds_profiles(response_as_string)
+        if function_name in ("get_employee_information", "get_employees_information"):
+            content = function_response if isinstance(function_response, (dict, list)) else response_as_string
+            if content is not None:
+                profiles = extract_geds_profiles(content)
                 if profiles:
                     return {"profiles": profiles}
 
@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from src.dao.chat_table_dao_types import ChatTableDaoInterface
+from src.dao.usage_rollup.usage_rollup_dao_types import BaseUsageRollupDao
+from src.entity.usage_rollup_entity import DailyUserRollup
+from src.mapper.conversation_entity_mapper import ChatTableEntityMapper
+
+logger = logging.getLogger(__name__)
+
+# Refreshes read again the rows of that many seconds before the high-water mark, so rows committed late with an
+# older Timestamp are counted, recounting the others changes nothing
+OVERLAP_SECS = int(os.getenv("STATS_ROLLUP_OVERLAP_SECS", "300"))
+
+
+class UsageRollupService:
+    """
+    Keeps the daily usage rollups (questions of each user on each day) up to date.
+
+    `refresh` reads the chat rows written since the high-water mark, the Timestamp of the newest row already
+    counted (less `overlap_secs`), and recounts the conversations they belong to from all of their rows. The rollups store those counts
+    by conversation, so a refresh retried or run by two workers at once writes the same counts instead of adding
+    them twice. The reports then read the rollups instead of every row of the chat table.
+    """
+
+    def __init__(
+        self,
+        chat_table_dao: ChatTableDaoInterface,
+        usage_rollup_dao: BaseUsageRollupDao,
+        overlap_secs: float = OVERLAP_SECS,
+    ):
+        self.chat_table_dao = chat_table_dao
+        self.usage_rollup_dao = usage_rollup_dao
+        self.overlap_secs = overlap_secs
+        self._lock = threading.Lock()
+
+    def _count_questions(self, conversation_id: str) -> dict[tuple[str, str | None], int]:
+        """Questions of a conversation by (day, owner)."""
+        counts: dict[tuple[str, str | None], int] = {}
+        for row in self.chat_table_dao.conversation(conversation_id):
+            message = ChatTableEntityMapper.map_and_validate_to_conversation_message_entity(row)
+            timestamp = row["metadata"]["timestamp"]
+            if message is None or message["sender"] != "user" or timestamp is None:
+                continue
+            key = (timestamp.astimezone(timezone.utc).date().isoformat(), message["owner_id"] or None)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def refresh(self) -> int:
+        """
+        Recount the conversations of the chat rows newer than the high-water mark (less the overlap), returns the
+        number of questions read.
+        """
+        with self._lock:
+            high_water_mark, etag = self.usage_rollup_dao.get_high_water_mark()
+            after = high_water_mark - timedelta(seconds=self.overlap_secs) if high_water_mark else None
+            rows = self.chat_table_dao.since(after)
+            if not rows:
+                return 0
+
+            newest = high_water_mark
+            questions = 0
+            conversation_ids: set[str] = set()
+            for row in rows:
+                timestamp = row["metadata"]["timestamp"]
+                if timestamp is not None and (newest is None or timestamp > newest):
+                    newest = timestamp
+                message = ChatTableEntityMapper.map_and_validate_to_conversation_message_entity(row)
+                if message is None:
+                    continue
+                conversation_ids.add(message["conversation_id"])
+                if message["sender"] == "user":
+                    questions += 1
+
+            # The (day, owner) a conversation was counted in before, so a rewritten row moved to another day
+            # is recounted to 0 there
+            counted: dict[str, set[tuple[str, str | None]]] = {}
+            for rollup in self.usage_rollup_dao.all():
+                for conversation_id in rollup["conversations"]:
+                    if conversation_id in conversation_ids:
+                        counted.setdefault(conversation_id, set()).add((rollup["day"], rollup["owner_id"]))
+
+            recounted: dict[tuple[str, str | None], DailyUserRollup] = {}
+            for conversation_id in conversation_ids:
+                counts = self._count_questions(conversation_id)
+                for key in counted.get(conversation_id, ()):
+                    counts.setdefault(key, 0)
+                for (day, owner_id), count in counts.items():
+                    rollup = recounted.setdefault(
+                        (day, owner_id),
+                        DailyUserRollup(day=day, owner_id=owner_id, questions=0, conversations={}),
+                    )
+                    rollup["questions"] += count
+                    rollup["conversations"][conversation_id] = count
+
+            # The rollups first, a failure before the high-water mark moves means these rows are read again
+            if recounted:
+                self.usage_rollup_dao.upsert(list(recounted.values()))
+            if newest is not None and newest != high_water_mark:
+                if not self.usage_rollup_dao.set_high_water_mark(newest, etag):
+                    # Another worker refreshed meanwhile and its mark stands, the recounts did not add anything twice
+                    logger.info("Usage rollups high-water mark moved by another refresh, leaving it")
+            logger.info(
+                "Usage rollups refreshed with %s chat rows (%s questions in %s conversations)",
+                len(rows), questions, len(conversation_ids),
+            )
+            return questions
+
+    def rollups(self) -> list[DailyUserRollup]:
+        return self.usage_rollup_dao.all()
+
+    def high_water_mark(self) -> datetime | None:
+        return self.usage_rollup_dao.get_high_water_mark()[0]
@@ -0,0 +1,76 @@
+from datetime import datetime
+from typing import cast
+from unittest.mock import MagicMock
+
+from src.dao.chat_table_dao import ChatTableDaoInterface
+from src.entity.table_row_entity import ChatTableRow, TableRowMetadata
+from src.repository.chat_row_loader import ChatRowLoader
+from src.repository.conversation_repository import ConversationRepository
+from src.repository.user_repository import UserRepository
+
+
+def _row(conversation_id: str, row_key: str, timestamp: str, oid: str, username: str, question: bool) -> ChatTableRow:
+    return ChatTableRow(
+        metadata=TableRowMetadata(timestamp=datetime.fromisoformat(timestamp)),
+        Question="Hello?" if question else None,
+        Answer=None if question else "Hi!",
+        oid=oid,
+        PartitionKey=conversation_id,
+        RowKey=row_key,
+        preferred_username=username,
+    )
+
+
+ROWS = [
+    _row("a", "2", "2024-05-01T10:01:00+00:00", "1", "user1", False),
+    _row("a", "1", "2024-05-01T10:00:00+00:00", "1", "user1", True),
+    _row("b", "1", "2024-05-03T08:00:00+00:00", "2", "user2", True),
+    _row("c", "1", "2024-04-20T08:00:00+00:00", "1", "old-name", True),
+    _row("d", "1", "2024-06-01T08:00:00+00:00", "1", "new-name", True),
+    ChatTableRow(RowKey="3", preferred_username="user1"),
+    _row("b", "2", "2024-05-03T08:00:05+00:00", "2", "user2", False),
+]
+
+
+def _repositories(loader: ChatRowLoader) -> tuple[ConversationRepository, UserRepository, MagicMock]:
+    mock_instance = MagicMock()
+    mock_instance.all.return_value = ROWS
+    dao = cast(ChatTableDaoInterface, mock_instance)
+    return ConversationRepository(dao, loader), UserRepository(dao, loader), mock_instance
+
+
+def test_users_are_collated_from_the_questions():
+    _, user_repository, _ = _repositories(ChatRowLoader(workers=1))
+    users = {user["user_id"]: user for user in user_repository.list_users()}
+
+    assert users["1"] == {
+        "user_id": "1",
+        "username": "new-name",
+        "created_at": "2024-04-20T08:00:00+00:00",
+        "last_message_at": "2024-06-01T08:00:00+00:00",
+    }
+    assert users["2"]["username"] == "user2"
+
+
+def test_parallel_mapping_matches_the_single_process_mapping():
+    loader = ChatRowLoader(workers=2, chunk_rows=2, parallel_min_rows=0)
+    try:
+        conversation_repository, user_repository, _ = _repositories(loader)
+        inline_conversations, inline_users, _ = _repositories(ChatRowLoader(workers=1))
+
+        assert conversation_repository.list_conversations() == inline_conversations.list_conversations()
+        assert user_repository.list_users() == inline_users.list_users()
+    finally:
+        loader.shutdown()
+
+
+def test_a_snapshot_is_mapped_once_for_both_repositories():
+    loader = ChatRowLoader(workers=1)
+    conversation_repository, user_repository, _ = _repositories(loader)
+
+    first = loader.load(ROWS)
+    conversation_repository.load_store()
+    user_repository.list_users()
+
+    assert loader.load(ROWS) is first
+    assert loader.load(list(ROWS)) is not first
@@ -252,3 +252,56 @@ def test_messages_are_ordered_chronologically():
     assert conversations[0]["messages"][1]["content"] == "Hi there!"
     assert conversations[0]["messages"][2]["content"] == "How are you?"
     assert conversations[0]["messages"][3]["content"] == "I'm good, thanks!"
+
+
+def test_store_keeps_conversations_in_columns():
+    mock_instance = MagicMock()
+    mock_instance.all.return_value = [
+        ChatTableRow(
+            metadata=TableRowMetadata(timestamp=datetime.fromisoformat("2023-10-01T10:05:00+00:00")),
+            Question=None,
+            Answer="Hi there!",
+            oid="1",
+            PartitionKey="a",
+            RowKey="2",
+            preferred_username="user1",
+        ),
+        ChatTableRow(
+            metadata=TableRowMetadata(timestamp=datetime.fromisoformat("2023-10-02T08:00:00+00:00")),
+            Question="Bonjour?",
+            Answer=None,
+            oid="2",
+            PartitionKey="b",
+            RowKey="1",
+            preferred_username="user2",
+        ),
+        ChatTableRow(
+            metadata=TableRowMetadata(timestamp=datetime.fromisoformat("2023-10-01T10:00:00.250000+00:00")),
+            Question="Hello?",
+            Answer=None,
+            oid="1",
+            PartitionKey="a",
+            RowKey="1",
+            preferred_username="user1",
+        ),
+    ]
+    mock_instance = cast(ChatTableDaoInterface, mock_instance)
+    conversation_repository = ConversationRepository(mock_instance)
+    store = conversation_repository.load_store()
+
+    assert store.conversation_ids == ["a", "b"]
+    assert list(store.offsets) == [0, 2, 3]
+    assert store.owners == ["1", "2"]
+    assert list(store.owner_codes) == [0, 0, 1]
+    assert list(store.senders) == [1, 0, 1]
+    assert store.timestamps[0] == 1696154400250000
+
+    conversation = store.conversation(0)
+    assert conversation["created_at"] == "2023-10-01T10:05:00+00:00"
+    assert [message["content"] for message in conversation["messages"]] == ["Hello?", "Hi there!"]
+    assert conversation["messages"][0]["created_at"] == "2023-10-01T10:00:00.250000+00:00"
+    assert store.to_entities() == conversation_repository.list_conversations()
+
+    without_content = conversation_repository.load_store(keep_content=False)
+    assert without_content.contents is None
+    assert without_content.conversation(1)["messages"][0]["content"] == ""
@@ -0,0 +1,89 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Optional
+
+import requests
+
+from tools.archibus.archibus_client import ArchibusClient
+
+__all__ = ["MAX_COMBINATIONS", "MAX_DAYS", "booking_dates", "fetch_vacant_rooms", "search_availability"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Upper bounds of a single search, so one tool call cannot flood the Archibus API
+MAX_COMBINATIONS = int(os.getenv("ARCHIBUS_SEARCH_MAX_COMBINATIONS", "40"))
+MAX_DAYS = 14
+_ROOMS_PER_RESULT = 5
+_ROOM_ID_FIELDS = ("rmId", "roomId", "id")
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ARCHIBUS_SEARCH_WORKERS", "6")),
+                               thread_name_prefix="archibus-search")
+
+def booking_dates(start_date: str, end_date: Optional[str] = None) -> list[str]:
+    """
+    Every date (YYYY-MM-DD) from `start_date` to `end_date` included, at most MAX_DAYS of them.
+
+    Raises a ValueError if a date is invalid or the range is reversed.
+    """
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date) if end_date else start
+    if end < start:
+        raise ValueError("The end date is before the start date")
+    days = min((end - start).days + 1, MAX_DAYS)
+    return [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
+
+def fetch_vacant_rooms(client: ArchibusClient, building_id: str, floor_id: str, booking_date: str) -> list[dict]:
+    """The vacant rooms of a floor for a date (the only part of a room search that is not cached)."""
+    uri = f"/reservations/buildings/{building_id}/vacant/{floor_id}?bookingDate={booking_date}"
+    return client.request(uri, label="GET /reservations/vacant").json()
+
+def _room_id(room):
+    if isinstance(room, dict):
+        return next((room[field] for field in _ROOM_ID_FIELDS if room.get(field)), room)
+    return room
+
+def search_availability(client: ArchibusClient, building_id: str, floor_ids: list[str], dates: list[str],
+                        max_results: int = 10) -> dict:
+    """
+    Look up the vacant rooms of every (floor, date) combination concurrently and rank them.
+
+    Combinations are searched date first (the earliest dates matter most) and capped at MAX_COMBINATIONS.
+    Results are ranked by date, then by number of vacant rooms, and only list the first room ids of each
+    combination so the summary stays small for the model.
+    """
+    combinations = [(booking_date, floor_id) for booking_date in dates for floor_id in floor_ids]
+    truncated = len(combinations) > MAX_COMBINATIONS
+    combinations = combinations[:MAX_COMBINATIONS]
+
+    def search(combination):
+        booking_date, floor_id = combination
+        try:
+            return combination, fetch_vacant_rooms(client, building_id, floor_id, booking_date), None
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Unable to fetch the vacant rooms of floor %s on %s: %s", floor_id, booking_date, e)
+            return combination, None, str(e)
+
+    results = []
+    errors = []
+    for (booking_date, floor_id), rooms, error in _executor.map(search, combinations):
+        if error is not None:
+            errors.append({"date": booking_date, "floorId": floor_id})
+        elif rooms:
+            results.append({
+                "date": booking_date,
+                "floorId": floor_id,
+                "vacantRooms": len(rooms),
+                "rooms": [_room_id(room) for room in rooms[:_ROOMS_PER_RESULT]],
+            })
+
+    results.sort(key=lambda result: (result["date"], -result["vacantRooms"], result["floorId"]))
+    return {
+        "buildingId": building_id,
+        "searched": len(combinations),
+        "truncated": truncated,
+        "results": results[:max_results],
+        "errors": errors,
+    }
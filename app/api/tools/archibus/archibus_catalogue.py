@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import requests
+
+from tools.archibus.archibus_client import ArchibusClient, get_archibus_client
+
+__all__ = ["ArchibusCatalogue", "get_catalogue"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+_CATALOGUE_TTL_SECS = float(os.getenv("ARCHIBUS_CATALOGUE_TTL_SECS", "3600"))
+_WARMUP = os.getenv("ARCHIBUS_CATALOGUE_WARMUP", "true").lower() == "true"
+# Buildings whose floors are loaded at startup, all the buildings listed by the API when empty
+_WARMUP_BUILDINGS = [building.strip() for building in os.getenv("ARCHIBUS_WARMUP_BUILDINGS", "").split(",")
+                     if building.strip()]
+
+# Columns that may hold the id of a building in the /buildings response
+_BUILDING_ID_FIELDS = ("blId", "buildingId", "id")
+
+@dataclass(frozen=True)
+class _Entry:
+    """A cached response, its ETag (if the API sent one) and when it was last (re)validated."""
+    value: Any
+    etag: Optional[str]
+    checked_at: float
+
+class ArchibusCatalogue:
+    """
+    Cache of the Archibus catalogue: buildings, floors of each building and floor plan file names.
+
+    These hardly ever change, so responses are served from memory for `ttl` seconds. Past that they are
+    revalidated with their ETag (If-None-Match, a 304 keeps the cached value) or fetched again when the API
+    sent none. When the API cannot be reached the stale value is served rather than failing the booking flow.
+    """
+
+    def __init__(self, client: ArchibusClient, ttl: float = _CATALOGUE_TTL_SECS):
+        self.client = client
+        self.ttl = ttl
+        self._entries: dict[str, _Entry] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _get(self, uri: str, label: str):
+        entry = self._entries.get(uri)
+        if entry is not None and time.monotonic() - entry.checked_at < self.ttl:
+            return entry.value
+
+        headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else None
+        try:
+            response = self.client.request(uri, label=label, headers=headers)
+        except requests.RequestException as e:
+            if entry is None:
+                raise
+            logger.warning("Unable to revalidate %s, serving the cached catalogue: %s", label, e)
+            return entry.value
+
+        if response.status_code == 304 and entry is not None:
+            value = entry.value
+        else:
+            value = response.json()
+        self._entries[uri] = _Entry(value, response.headers.get("ETag"), time.monotonic())
+        return value
+
+    def buildings(self) -> list[dict]:
+        """Every building of the API."""
+        return self._get("/buildings", label="GET /buildings")
+
+    def floors(self, building_id: str) -> list[dict]:
+        """The floors of a building, with their floor plan file name (floorPlanURL)."""
+        return self._get(f"/buildings/{building_id}/floors", label="GET /buildings/floors")
+
+    def floor_plan(self, building_id: str, floor_id: str) -> Optional[str]:
+        """The floor plan file name of a floor, None if the floor has none."""
+        for floor in self.floors(building_id):
+            if floor.get("flId") == floor_id:
+                return floor.get("floorPlanURL")
+        return None
+
+    def warm_up(self, building_ids: Optional[list[str]] = None):
+        """Load the floors of `building_ids` (every building when None) so the first conversations hit the cache."""
+        if not building_ids:
+            building_ids = [next((building[field] for field in _BUILDING_ID_FIELDS if building.get(field)), None)
+                            for building in self.buildings()]
+        loaded = 0
+        for building_id in filter(None, building_ids):
+            try:
+                self.floors(building_id)
+                loaded += 1
+            except requests.RequestException as e:
+                logger.warning("Unable to load the floors of building %s: %s", building_id, e)
+        logger.info("Archibus catalogue warmed up with the floors of %s buildings", loaded)
+
+    def start_warm_up(self, building_ids: Optional[list[str]] = None):
+        """Run `warm_up` once, in a daemon thread."""
+        if self._thread is not None:
+            return
+
+        def run():
+            try:
+                self.warm_up(building_ids)
+            except Exception as e: # pylint: disable=broad-except
+                logger.error("Unable to warm up the Archibus catalogue: %s", e)
+
+        self._thread = threading.Thread(target=run, name="archibus-catalogue-warm-up", daemon=True)
+        self._thread.start()
+
+_catalogue: Optional[ArchibusCatalogue] = None
+_catalogue_lock = threading.Lock()
+
+def get_catalogue() -> ArchibusCatalogue:
+    """
+    Return the process wide catalogue, its warm up (ARCHIBUS_CATALOGUE_WARMUP) is started on the first call.
+    """
+    global _catalogue # pylint: disable=global-statement
+    with _catalogue_lock:
+        if _catalogue is None:
+            _catalogue = ArchibusCatalogue(get_archibus_client())
+            if _WARMUP:
+                _catalogue.start_warm_up(_WARMUP_BUILDINGS)
+    return _catalogue
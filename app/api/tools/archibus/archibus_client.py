@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+__all__ = ["ArchibusClient", "get_archibus_client"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+api_url = str(os.getenv("ARCHIBUS_API_URL", "http://archibusapi-dev.hnfpejbvhhbqenhy.canadacentral.azurecontainer.io/api/v1"))
+api_username = str(os.getenv("ARCHIBUS_API_USERNAME"))
+api_password = str(os.getenv("ARCHIBUS_API_PASSWORD"))
+
+_CONNECT_TIMEOUT_SECS = float(os.getenv("ARCHIBUS_CONNECT_TIMEOUT_SECS", "5"))
+_READ_TIMEOUT_SECS = float(os.getenv("ARCHIBUS_READ_TIMEOUT_SECS", "30"))
+_RETRIES = int(os.getenv("ARCHIBUS_RETRIES", "3"))
+_RETRY_BACKOFF_SECS = float(os.getenv("ARCHIBUS_RETRY_BACKOFF_SECS", "0.5"))
+_POOL_SIZE = int(os.getenv("ARCHIBUS_POOL_SIZE", "10"))
+
+# Status codes worth retrying, the API or its gateway is restarting or overloaded
+_RETRY_STATUSES = (429, 502, 503, 504)
+
+class ArchibusClient:
+    """
+    Client of the Archibus API shared by every Archibus tool and the booking route.
+
+    A single `requests.Session` keeps the connections (up to `pool_size`) and any session cookie set by the API
+    alive between calls, so a booking flow only pays the connection setup once. Every request has a connect and
+    a read timeout. GET requests are retried with an exponential backoff on connection errors and on
+    429/502/503/504, POST requests are not retried since a booking must not be made twice.
+    """
+
+    def __init__(self, base_url: str = api_url, username: str = api_username, password: str = api_password,
+                 connect_timeout: float = _CONNECT_TIMEOUT_SECS, read_timeout: float = _READ_TIMEOUT_SECS,
+                 retries: int = _RETRIES, backoff: float = _RETRY_BACKOFF_SECS, pool_size: int = _POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        self.session.headers.update({"Accept": "application/json"})
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                      status_forcelist=_RETRY_STATUSES, allowed_methods=frozenset({"GET"}),
+                      raise_on_status=False, respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._metrics: dict[str, dict] = {}
+        self._metrics_lock = threading.Lock()
+
+    def request(self, uri: str, payload=None, label: Optional[str] = None,
+                headers: Optional[dict] = None) -> requests.Response:
+        """
+        GET `uri` (relative to the API url), or POST the JSON `payload` to it when there is one.
+
+        Raises an HTTPError when the API answers with an error status (once the retries are exhausted).
+        `label` names the call in the metrics, it defaults to the method and the first segment of `uri`
+        (never the whole uri, it can hold user names).
+        """
+        method = "POST" if payload else "GET"
+        label = label or f"{method} /{uri.lstrip('/').split('/')[0].split('?')[0]}"
+        if payload:
+            headers = {**(headers or {}), "Accept": "*/*", "Content-Type": "application/json"}
+
+        logger.debug(self.base_url + uri)
+        start_time = time.time()
+        try:
+            response = self.session.request(method, self.base_url + uri, data=payload, headers=headers,
+                                            timeout=self.timeout)
+        except requests.RequestException:
+            self._record(label, time.time() - start_time, status=None)
+            raise
+        retries = getattr(response.raw, "retries", None)
+        self._record(label, time.time() - start_time, status=response.status_code,
+                     retries=len(retries.history) if retries else 0)
+        response.raise_for_status()  # This will raise an HTTPError if the HTTP request returned an unsuccessful status code
+        return response
+
+    def _record(self, label: str, execution_time: float, status: Optional[int], retries: int = 0):
+        duration_ms = execution_time * 1000
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(label, {"count": 0, "errors": 0, "retries": 0, "total_ms": 0.0,
+                                                       "max_ms": 0.0, "statuses": {}})
+            metrics["count"] += 1
+            metrics["errors"] += int(status is None or status >= 400)
+            metrics["retries"] += retries
+            metrics["total_ms"] += duration_ms
+            metrics["max_ms"] = max(metrics["max_ms"], duration_ms)
+            status_key = str(status) if status is not None else "connection_error"
+            metrics["statuses"][status_key] = metrics["statuses"].get(status_key, 0) + 1
+
+    def metrics(self) -> dict:
+        """Count, errors, retries, latency and status codes of the calls, per label."""
+        with self._metrics_lock:
+            return {label: {**metrics, "statuses": dict(metrics["statuses"]),
+                            "avg_ms": round(metrics["total_ms"] / metrics["count"], 3),
+                            "total_ms": round(metrics["total_ms"], 3), "max_ms": round(metrics["max_ms"], 3)}
+                    for label, metrics in self._metrics.items()}
+
+    def reset_metrics(self):
+        """Drop every metric."""
+        with self._metrics_lock:
+            self._metrics.clear()
+
+_client: Optional[ArchibusClient] = None
+_client_lock = threading.Lock()
+
+def get_archibus_client() -> ArchibusClient:
+    """Return the process wide Archibus client (shared session and metrics)."""
+    global _client # pylint: disable=global-statement
+    with _client_lock:
+        if _client is None:
+            _client = ArchibusClient()
+    return _client
@@ -1,9 +1,12 @@
 import json
 import logging
-import os
 from datetime import datetime
+from typing import Optional
 
 import requests
+from tools.archibus.archibus_availability import booking_dates, search_availability
+from tools.archibus.archibus_catalogue import get_catalogue
+from tools.archibus.archibus_client import get_archibus_client
 from utils.decorators import tool_metadata
 
 logger = logging.getLogger(__name__)
@@ -12,12 +15,12 @@ __all__ = ["make_api_call",
            "get_user_bookings",
            "get_floors",
            "get_available_rooms",
+           "search_available_rooms",
            "get_floor_plan",
            "get_current_date"]
 
-api_url = str(os.getenv("ARCHIBUS_API_URL", "http://archibusapi-dev.hnfpejbvhhbqenhy.canadacentral.azurecontainer.io/api/v1"))
-api_username = str(os.getenv("ARCHIBUS_API_USERNAME"))
-api_password = str(os.getenv("ARCHIBUS_API_PASSWORD"))
+# Buildings, floors and floor plans, cached and revalidated in the background (see ArchibusCatalogue)
+catalogue = get_catalogue()
 
 @tool_metadata({
     "type": "function",
@@ -46,7 +49,7 @@ def get_user_bookings(firstName: str = "", lastName: str = ""):
 
     try:
         uri = f"/reservations/creator/{lastName.upper()},%20{firstName.upper()}"
-        response = make_api_call(uri)
+        response = make_api_call(uri, label="GET /reservations/creator")
         filtered_response_json = json.loads(response.text)[-10:] # take last 10 items (API might be returning duplicates?)
         pretty_response = json.dumps(filtered_response_json, indent=4)
         logger.debug(f"Reservations: {pretty_response}")
@@ -78,14 +81,10 @@ def get_user_bookings(firstName: str = "", lastName: str = ""):
   })
 def get_floors(buildingId: str):
     try:
-        uri = f"/buildings/{buildingId}/floors"
-        response = make_api_call(uri)
-        response_json = json.loads(response.text)
-        pretty_response = json.dumps(response_json, indent=4)
-        logger.debug(pretty_response)
-        logger.debug(f"Response status code: {response.status_code}")
-        return response.json()  
-    except requests.HTTPError as e:
+        floors = catalogue.floors(buildingId)
+        logger.debug(json.dumps(floors, indent=4))
+        return floors
+    except requests.RequestException as e:
         msg = f"An error occurred while trying to fetch floors for the building {buildingId}."
         logger.error(msg)
         return msg
@@ -116,12 +115,17 @@ def get_floors(buildingId: str):
     }
   })
 def get_available_rooms(buildingId: str, floorId: str, bookingDate: str):
-    floor_plan_file_name = get_floor_plan(buildingId=buildingId, floorId=floorId)
+    # Only the reservations are fetched, the floor plan comes from the catalogue cache
+    try:
+        floor_plan_file_name = catalogue.floor_plan(buildingId, floorId)
+    except requests.RequestException as e:
+        logger.warning("Floor plan unavailable for floor %s of building %s: %s", floorId, buildingId, e)
+        floor_plan_file_name = None
     logger.debug(f"FILE NAME: {floor_plan_file_name}")
 
     try:
         uri = f"/reservations/buildings/{buildingId}/vacant/{floorId}?bookingDate={bookingDate}"
-        response = make_api_call(uri)
+        response = make_api_call(uri, label="GET /reservations/vacant")
         response_json = json.loads(response.text)
         filtered_rooms = response_json[:10]
         pretty_response = json.dumps(filtered_rooms, indent=4)
@@ -138,12 +142,70 @@ def get_available_rooms(buildingId: str, floorId: str, bookingDate: str):
             result["floorPlan"] = floor_plan_file_name
 
         return result
-    except requests.HTTPError as e:
+    except requests.RequestException as e:
         msg = f"An error occurred while trying to fetch rooms for the given floor {floorId} and building {buildingId}."
         logger.error(msg)
         return msg
 
 
+@tool_metadata({
+    "type": "function",
+    "function": {
+        "name": "search_available_rooms",
+        "description": "Searches the vacant rooms or workspaces of a building across several floors and/or several dates in a single call, and returns a ranked summary (earliest date first, then the floors with the most vacant rooms). Use this method instead of calling get_available_rooms again and again when the user is flexible on the floor or the date, e.g. 'any floor', 'sometime next week'. DO NOT USE THE BUILDING ADDRESS OR NAME AS THE BUILDINGID.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "buildingId": {
+                    "type": "string",
+                    "description": "A string indicating the ID of the building."
+                },
+                "startDate": {
+                    "type": "string",
+                    "description": "The first date to search, formatted like YYYY-MM-DD."
+                },
+                "endDate": {
+                    "type": "string",
+                    "description": "Optional. The last date to search (included), formatted like YYYY-MM-DD. At most 14 days are searched."
+                },
+                "floorIds": {
+                    "type": "array",
+                    "description": "Optional. The IDs of the floors to search, every floor of the building when omitted.",
+                    "items": {
+                        "type": "string"
+                    }
+                },
+                "maxResults": {
+                    "type": "integer",
+                    "description": "Optional. The number of floor and date combinations to return, 10 by default."
+                }
+            },
+            "required": ["buildingId", "startDate"]
+        }
+    }
+  })
+def search_available_rooms(buildingId: str, startDate: str, endDate: Optional[str] = None,
+                           floorIds: Optional[list[str]] = None, maxResults: int = 10):
+    """
+    Search the vacant rooms of a building over floors and dates, the combinations are queried concurrently
+    (see archibus_availability.search_availability).
+    """
+    try:
+        dates = booking_dates(startDate, endDate)
+    except ValueError as e:
+        return f"Invalid dates, use the YYYY-MM-DD format: {e}"
+
+    if not floorIds:
+        try:
+            floorIds = [floor.get("flId") for floor in catalogue.floors(buildingId) if floor.get("flId")]
+        except requests.RequestException:
+            msg = f"An error occurred while trying to fetch floors for the building {buildingId}."
+            logger.error(msg)
+            return msg
+
+    return search_availability(get_archibus_client(), buildingId, floorIds, dates, max_results=maxResults)
+
+
 @tool_metadata({
     "type": "function",
     "function": {
@@ -167,15 +229,7 @@ def get_available_rooms(buildingId: str, floorId: str, bookingDate: str):
   })
 def get_floor_plan(buildingId: str, floorId: str):
     try:
-        uri = f"/buildings/{buildingId}/floors"
-        response = make_api_call(uri)
-        response_json = json.loads(response.text)
-        target_floor_blob_name = None
-
-        for floor in response_json:
-            if floor.get('flId') == floorId:
-                target_floor_blob_name = floor.get('floorPlanURL')
-                break
+        target_floor_blob_name = catalogue.floor_plan(buildingId, floorId)
 
         if target_floor_blob_name:
             return target_floor_blob_name
@@ -183,7 +237,7 @@ def get_floor_plan(buildingId: str, floorId: str):
             logger.error(f"Floor plan URL not found for floorId: {floorId}")
             return None
 
-    except requests.HTTPError as e:
+    except requests.RequestException as e:
         msg = f"Error occurred during the request to retrieve floors: {e}"
         logger.error(msg)
         return msg
@@ -255,20 +309,9 @@ def get_current_date():
     return "Formatted date and time:" + current_date_time.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def make_api_call(uri: str, payload=None) -> requests.Response:
-    auth = (api_username, api_password)
-
-    headers = {
-        'Accept': 'application/json'
-    }
-
-    if payload:
-        headers['Accept'] = '*/*'
-        headers['Content-Type'] = 'application/json'
-        response = requests.post(api_url + uri, headers=headers, auth=auth, data=payload)
-    else:
-        response = requests.get(api_url + uri, headers=headers, auth=auth)
-
-    logger.debug(api_url + uri)
-    response.raise_for_status()  # This will raise an HTTPError if the HTTP request returned an unsuccessful status code
-    return response
\ No newline at end of file
+def make_api_call(uri: str, payload=None, label: Optional[str] = None) -> requests.Response:
+    """
+    Call the Archibus API through the shared client (pooled session, timeouts, retries and metrics),
+    see ArchibusClient.request.
+    """
+    return get_archibus_client().request(uri, payload, label=label)
@@ -0,0 +1,154 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from tools.archibus import archibus_functions
+from tools.archibus.archibus_catalogue import ArchibusCatalogue
+from tools.archibus.archibus_client import ArchibusClient
+
+FLOORS = [{"flId": "T404", "floorPlanURL": "HQ-T404.svg"}, {"flId": "T405", "floorPlanURL": None}]
+BUILDINGS = [{"blId": "HQ", "name": "Headquarters"}, {"blId": "EAST", "name": "East"}]
+
+
+class CatalogueStub(BaseHTTPRequestHandler):
+    """Archibus stub that sends ETags and answers 304 when the client already has the current version."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.server.requests.append(self.path)
+        if self.server.down:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/api/v1/reservations/"):
+            body = [{"roomId": "W037"}]
+        elif self.path == "/api/v1/buildings":
+            body = BUILDINGS
+        else:
+            body = FLOORS
+        etag = f'"{self.server.version}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CatalogueStub)
+    server.requests = []
+    server.version = 1
+    server.down = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    return ArchibusClient(base_url=f"http://127.0.0.1:{server.server_port}/api/v1", retries=0)
+
+
+@pytest.fixture
+def catalogue(client):
+    return ArchibusCatalogue(client, ttl=3600)
+
+
+def test_floors_are_served_from_the_cache(catalogue, server):
+    assert catalogue.floors("HQ") == FLOORS
+    assert catalogue.floor_plan("HQ", "T404") == "HQ-T404.svg"
+    assert catalogue.floor_plan("HQ", "T999") is None
+
+    assert server.requests == ["/api/v1/buildings/HQ/floors"]
+
+
+def test_expired_entries_are_revalidated_with_their_etag(catalogue, client, server):
+    catalogue.floors("HQ")
+    catalogue.ttl = 0
+
+    assert catalogue.floors("HQ") == FLOORS
+    assert client.metrics()["GET /buildings/floors"]["statuses"] == {"200": 1, "304": 1}
+
+    server.version = 2
+    assert catalogue.floors("HQ") == FLOORS
+    assert client.metrics()["GET /buildings/floors"]["statuses"] == {"200": 2, "304": 1}
+
+
+def test_stale_entries_are_served_when_the_api_is_down(catalogue, server):
+    catalogue.floors("HQ")
+    catalogue.ttl = 0
+    server.down = True
+
+    assert catalogue.floors("HQ") == FLOORS
+    with pytest.raises(requests.HTTPError):
+        catalogue.floors("EAST")
+
+
+def test_warm_up_loads_the_floors_of_every_building(catalogue, server):
+    catalogue.warm_up()
+
+    assert server.requests == ["/api/v1/buildings", "/api/v1/buildings/HQ/floors", "/api/v1/buildings/EAST/floors"]
+
+
+def test_available_rooms_only_fetch_the_reservations(catalogue, client, server, monkeypatch):
+    monkeypatch.setattr(archibus_functions, "catalogue", catalogue)
+    monkeypatch.setattr(archibus_functions, "get_archibus_client", lambda: client)
+    catalogue.warm_up(["HQ"])
+    server.requests.clear()
+
+    first = archibus_functions.get_available_rooms("HQ", "T404", "2025-01-10")
+    second = archibus_functions.get_available_rooms("HQ", "T404", "2025-01-11")
+
+    assert first == {"rooms": [{"roomId": "W037"}], "floorPlan": "HQ-T404.svg"}
+    assert second["floorPlan"] == "HQ-T404.svg"
+    assert all(path.startswith("/api/v1/reservations/buildings/HQ/vacant/T404") for path in server.requests)
+    assert len(server.requests) == 2
+
+
+def test_search_available_rooms_covers_floors_and_dates(catalogue, client, server, monkeypatch):
+    monkeypatch.setattr(archibus_functions, "catalogue", catalogue)
+    monkeypatch.setattr(archibus_functions, "get_archibus_client", lambda: client)
+
+    summary = archibus_functions.search_available_rooms("HQ", "2025-01-10", "2025-01-12")
+
+    assert summary["searched"] == 6
+    assert summary["truncated"] is False
+    assert [(result["date"], result["floorId"]) for result in summary["results"]] == [
+        ("2025-01-10", "T404"), ("2025-01-10", "T405"), ("2025-01-11", "T404"), ("2025-01-11", "T405"),
+        ("2025-01-12", "T404"), ("2025-01-12", "T405")]
+    assert summary["results"][0]["rooms"] == ["W037"]
+    # The floors come from the catalogue, only the reservations are fetched for each combination
+    assert len([path for path in server.requests if "/vacant/" in path]) == 6
+
+
+def test_search_available_rooms_is_bounded(catalogue, client, server, monkeypatch):
+    monkeypatch.setattr(archibus_functions, "catalogue", catalogue)
+    monkeypatch.setattr(archibus_functions, "get_archibus_client", lambda: client)
+    floors = [f"F{number}" for number in range(10)]
+
+    summary = archibus_functions.search_available_rooms("HQ", "2025-01-01", "2025-03-01", floorIds=floors,
+                                                        maxResults=3)
+
+    assert summary["searched"] == 40
+    assert summary["truncated"] is True
+    assert len(summary["results"]) == 3
+    assert "Invalid dates" in archibus_functions.search_available_rooms("HQ", "10/01/2025")
@@ -0,0 +1,114 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from tools.archibus.archibus_client import ArchibusClient
+
+
+class ArchibusStub(BaseHTTPRequestHandler):
+    """Keep-alive stub of the Archibus API, `failures` tells how many 503 to send before answering."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _answer(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.server.requests.append(("GET", self.path, self.client_address[1], self.headers.get("Authorization")))
+        if self.server.failures:
+            self.server.failures -= 1
+            self._answer(503, {"error": "unavailable"})
+            return
+        self._answer(200, [{"flId": "T404", "floorPlanURL": "plan.svg"}])
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(("POST", self.path, self.client_address[1], body))
+        if self.server.failures:
+            self.server.failures -= 1
+            self._answer(503, {"error": "unavailable"})
+            return
+        self._answer(200, {"booked": True})
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ArchibusStub)
+    server.requests = []
+    server.failures = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    return ArchibusClient(base_url=f"http://127.0.0.1:{server.server_port}/api/v1", username="user",
+                          password="password", retries=2, backoff=0)
+
+
+def test_connections_are_reused(client, server):
+    for _ in range(3):
+        assert client.request("/buildings/HQ/floors").json()[0]["flId"] == "T404"
+
+    assert len({port for _, _, port, _ in server.requests}) == 1
+    assert server.requests[0][3] == "Basic " + base64.b64encode(b"user:password").decode()
+
+
+def test_transient_errors_are_retried(client, server):
+    server.failures = 2
+
+    response = client.request("/buildings/HQ/floors", label="GET /buildings/floors")
+
+    assert response.status_code == 200
+    assert len(server.requests) == 3
+    metrics = client.metrics()["GET /buildings/floors"]
+    assert metrics["count"] == 1
+    assert metrics["retries"] == 2
+    assert metrics["statuses"] == {"200": 1}
+
+
+def test_errors_are_raised_once_retries_are_exhausted(client, server):
+    server.failures = 5
+
+    with pytest.raises(requests.HTTPError):
+        client.request("/buildings/HQ/floors")
+
+    assert len(server.requests) == 3
+    assert client.metrics()["GET /buildings"]["errors"] == 1
+
+
+def test_bookings_are_not_retried(client, server):
+    server.failures = 1
+
+    with pytest.raises(requests.HTTPError):
+        client.request("/reservations/", json.dumps({"roomId": "W037"}))
+
+    assert len(server.requests) == 1
+    assert client.metrics()["POST /reservations"]["statuses"] == {"503": 1}
+
+
+def test_default_label_does_not_hold_the_uri():
+    client = ArchibusClient(base_url="http://127.0.0.1:9", retries=0, connect_timeout=0.5)
+
+    with pytest.raises(requests.ConnectionError):
+        client.request("/reservations/creator/SMITH,%20JOHN")
+
+    metrics = client.metrics()
+    assert list(metrics) == ["GET /reservations"]
+    assert metrics["GET /reservations"]["errors"] == 1
+    assert metrics["GET /reservations"]["statuses"] == {"connection_error": 1}
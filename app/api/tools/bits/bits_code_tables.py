@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+__all__ = ["CodeTable", "CodeTableCache", "get_code_tables", "STATUSES", "ORGANIZATIONS", "ORGANIZATION_QUERY"]
+
+_REFRESH_SECS = int(os.getenv("BITS_CODE_TABLES_REFRESH_SECS", "3600"))
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STATUSES = "statuses"
+ORGANIZATIONS = "organizations"
+
+@dataclass(frozen=True)
+class CodeTable:
+    """Definition of a code table: the query that loads it and an optional warm start file."""
+    name: str
+    query: str
+    fallback_file: Optional[str] = None
+
+# BR_STATUSES (Active == True), with distinct DISP_STATUS_EN since we dont want duplicates
+STATUSES_QUERY = """
+WITH DistinctStatus AS (
+    SELECT DISP_STATUS_EN, MIN(STATUS_ID) AS MinStatusID
+    FROM [EDR_CARZ].[DIM_BITS_STATUS]
+    WHERE BR_ACTIVE_EN = 'Active'
+    GROUP BY DISP_STATUS_EN
+)
+SELECT
+    t.STATUS_ID,
+    ds.DISP_STATUS_EN AS NAME_EN,
+    t.DISP_STATUS_FR AS NAME_FR,
+    t.BITS_PHASE_EN AS PHASE_EN,
+    t.BITS_PHASE_FR AS PHASE_FR
+FROM
+    DistinctStatus AS ds
+JOIN
+    [EDR_CARZ].[DIM_BITS_STATUS] AS t
+ON
+    ds.DISP_STATUS_EN = t.DISP_STATUS_EN AND ds.MinStatusID = t.STATUS_ID
+WHERE
+    t.BR_ACTIVE_EN = 'Active';
+"""
+
+ORGANIZATION_QUERY = """
+SELECT GC_ORG_NAME_EN, GC_ORG_NAME_FR, ORG_SHORT_NAME, ORG_ACRN_EN, ORG_ACRN_FR, ORG_ACRN_BIL, ORG_WEBSITE
+FROM EDR_CARZ.DIM_GC_ORGANIZATION
+"""
+
+DEFAULT_TABLES = (
+    CodeTable(STATUSES, STATUSES_QUERY, os.path.join(_SCRIPT_DIR, "bits_statuses.json")),
+    CodeTable(ORGANIZATIONS, ORGANIZATION_QUERY),
+)
+
+class _TableSnapshot:
+    """Rows of a code table, never modified once built."""
+
+    def __init__(self, rows: list[dict], origin: str):
+        self.rows = rows
+        self.origin = origin
+        self.loaded_at = time.time()
+
+class CodeTableCache:
+    """
+    In memory cache of the BITS code tables (statuses, organizations).
+
+    Every table is loaded from `source` (a DatabaseConnection) and refreshed in the background, each refresh builds
+    a new snapshot of the table that replaces the previous one in a single assignment, so readers never see a
+    partially loaded table and never wait on the database. Tables with a `fallback_file` are warm started
+    from it and keep serving it if the database cannot be reached. With a `refresh_interval`, the background
+    refresh starts on the first read rather than on creation.
+    """
+
+    def __init__(self, source, tables=DEFAULT_TABLES, refresh_interval: Optional[int] = None):
+        self.source = source
+        self.tables = {table.name: table for table in tables}
+        self.refresh_interval = refresh_interval
+        self._snapshots: dict[str, _TableSnapshot] = {}
+        self._listeners: dict[str, list[Callable[[], None]]] = {}
+        self._refresh_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.warm_start()
+
+    def warm_start(self):
+        """Load the tables that have a fallback file, so they can be served before the first refresh."""
+        for table in self.tables.values():
+            if table.fallback_file and os.path.exists(table.fallback_file):
+                with open(table.fallback_file, 'r', encoding='utf-8') as f:
+                    self._swap(table, json.load(f), origin="file")
+                self._notify(table.name)
+
+    def refresh(self, name: Optional[str] = None):
+        """
+        Reload one table (or all of them) from the database.
+
+        A table that fails to load keeps its current snapshot.
+        """
+        refreshed = []
+        with self._refresh_lock:
+            for table in self.tables.values():
+                if name and table.name != name:
+                    continue
+                try:
+                    start_time = time.time()
+                    rows = list(self.source.iter_rows(table.query))
+                    self._swap(table, rows, origin="database")
+                    refreshed.append(table.name)
+                    logger.info("Code table %s loaded with %s rows in %s seconds",
+                                table.name, len(rows), time.time() - start_time)
+                except Exception as e: # pylint: disable=broad-except
+                    logger.error("Unable to refresh code table %s, keeping the current one: %s", table.name, e)
+
+        # Listeners are only called once the lock is released, they may read any table
+        for table_name in refreshed:
+            self._notify(table_name)
+
+    def _swap(self, table: CodeTable, rows: list[dict], origin: str):
+        snapshots = dict(self._snapshots)
+        snapshots[table.name] = _TableSnapshot(rows, origin)
+        self._snapshots = snapshots
+
+    def _notify(self, name: str):
+        for listener in self._listeners.get(name, []):
+            try:
+                listener()
+            except Exception as e: # pylint: disable=broad-except
+                logger.error("Code table %s listener failed: %s", name, e)
+
+    def subscribe(self, name: str, listener: Callable[[], None]):
+        """Call `listener` every time the table is reloaded."""
+        self._listeners.setdefault(name, []).append(listener)
+
+    def is_loaded(self, name: str) -> bool:
+        """Check if the table was loaded at least once (from its file or the database)."""
+        return name in self._snapshots
+
+    def loaded_rows(self, name: str) -> Optional[list[dict]]:
+        """All the rows of a table if it is loaded, None otherwise (never queries the database)."""
+        self._ensure_refreshing()
+        snapshot = self._snapshots.get(name)
+        return snapshot.rows if snapshot else None
+
+    def rows(self, name: str) -> list[dict]:
+        """All the rows of a table, empty until it is first loaded (never queries the database)."""
+        rows = self.loaded_rows(name)
+        return rows if rows is not None else []
+
+    def _ensure_refreshing(self):
+        if self.refresh_interval is not None and self._thread is None:
+            self.start_background_refresh(self.refresh_interval)
+
+    def start_background_refresh(self, interval: int = _REFRESH_SECS):
+        """Refresh every table now and then every `interval` seconds, in a daemon thread."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="bits-code-tables-refresh",
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self, interval: int):
+        while True:
+            self.refresh()
+            time.sleep(interval)
+
+_code_tables: Optional[CodeTableCache] = None
+_code_tables_lock = threading.Lock()
+
+def get_code_tables(source) -> CodeTableCache:
+    """
+    Return the process wide code tables, loaded from `source` (a DatabaseConnection).
+
+    The cache is warm started from the bundled files, its background refresh from the database starts on the
+    first read.
+    """
+    global _code_tables # pylint: disable=global-statement
+    with _code_tables_lock:
+        if _code_tables is None:
+            _code_tables = CodeTableCache(source, refresh_interval=_REFRESH_SECS)
+    return _code_tables
@@ -1,12 +1,18 @@
 import json
 import logging
 import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from pydantic import ValidationError
+from tools.bits.bits_code_tables import ORGANIZATIONS, STATUSES, get_code_tables
 from tools.bits.bits_fields import BRFields
 from tools.bits.bits_models import BRQuery, BRSelectFields
-from tools.bits.bits_statuses_cache import StatusesCache
-from tools.bits.bits_utils import BRQueryBuilder, DatabaseConnection
+from tools.bits.bits_org_index import get_organization_index
+from tools.bits.bits_replica import get_replica
+from tools.bits.bits_utils import TARGET_REPLICA, BRQueryBuilder, DatabaseConnection, decode_cursor
 from utils.decorators import tool_metadata
 
 logger = logging.getLogger(__name__)
@@ -15,10 +21,30 @@ logger.setLevel(logging.INFO)
 db = DatabaseConnection(os.getenv("BITS_DB_SERVER", "missing.domain"),
                         os.getenv("BITS_DB_USERNAME", "missing.username"),
                         os.getenv("BITS_DB_PWD", "missing.password"),
-                        os.getenv("BITS_DB_DATABASE", "missing.dbname"))
+                        os.getenv("BITS_DB_DATABASE", "missing.dbname"),
+                        cache_size=int(os.getenv("BITS_QUERY_CACHE_SIZE", "256")),
+                        cache_max_rows=int(os.getenv("BITS_QUERY_CACHE_MAX_ROWS", "10000")),
+                        snapshot_ttl=float(os.getenv("BITS_SNAPSHOT_PROBE_TTL", "60")),
+                        pool_size=int(os.getenv("BITS_DB_POOL_SIZE", "4")),
+                        pool_max_idle=float(os.getenv("BITS_DB_POOL_MAX_IDLE", "300")))
 
 query_builder = BRQueryBuilder()
 
+# Optional local replica of the latest BR snapshot (only when BITS_REPLICA_PATH is set)
+replica = get_replica(db, query_builder)
+
+# Large BR lists are looked up in chunks, concurrently, instead of a single huge IN clause
+BR_CHUNK_SIZE = int(os.getenv("BITS_BR_CHUNK_SIZE", "200"))
+_chunk_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BITS_BR_CHUNK_WORKERS", "4")),
+                                     thread_name_prefix="bits-br-chunk")
+
+# Fields holding organization names, filters on them are turned into exact matches when the value is a known organization
+ORG_NAME_FIELDS = {"RPT_GC_ORG_NAME_EN", "RPT_GC_ORG_NAME_FR"}
+
+# Code tables (statuses, organizations), refreshed in the background once first read
+code_tables = get_code_tables(db)
+org_index = get_organization_index(code_tables)
+
 # pylint: disable=line-too-long
 @tool_metadata({
     "type": "function",
@@ -41,12 +67,103 @@ query_builder = BRQueryBuilder()
     }
   })
 # pylint: enable=line-too-long
-def get_br_information(br_numbers: list[int]):
+def get_br_information(br_numbers: list[int], page_size: Optional[int] = None, cursor: Optional[str] = None):
     """
     gets br information
+
+    page_size and cursor are optional and allow to page through large lists of BRs (keyset pagination),
+    the cursor of the next page is returned in the metadata (next_cursor).
+
+    Without paging, lists longer than BR_CHUNK_SIZE are split in chunks that are queried concurrently.
+    """
+    if not page_size and not cursor and len(br_numbers) > BR_CHUNK_SIZE:
+        return _chunked_br_information(br_numbers)
+    query_args, params = _br_information_query(br_numbers, page_size, cursor)
+    return _execute_br_query(query_args, params, page_size, label="get_br_information")
+
+def _chunked_br_information(br_numbers: list[int]):
     """
-    query = query_builder.get_br_query(len(br_numbers), active=False, show_all=True) #BRs here do not need to be active to be returned
-    return db.execute_query(query, *br_numbers)
+    Look up a large list of BRs as several bounded queries and merge the results.
+
+    The merged BRs keep the order of a single query (BR_NMBR DESC) and the metadata
+    lists the size, result count and execution time of every chunk.
+    """
+    start_time = time.time()
+    # A single IN clause returns each BR once, so duplicates must not end up in two chunks
+    unique_br_numbers = {}
+    for br_number in br_numbers:
+        unique_br_numbers.setdefault(int(br_number), br_number)
+    br_numbers = list(unique_br_numbers.values())
+    chunks = [br_numbers[i:i + BR_CHUNK_SIZE] for i in range(0, len(br_numbers), BR_CHUNK_SIZE)]
+    results = list(_chunk_executor.map(
+        lambda chunk: _execute_br_query(*_br_information_query(chunk, None, None), label="get_br_information"),
+        chunks))
+
+    brs = [br for result in results for br in result["br"]]
+    brs.sort(key=lambda br: int(br["BR_NMBR"]), reverse=True)
+    extraction_dates = [r["metadata"]["extraction_date"] for r in results if r["metadata"]["extraction_date"]]
+    return {
+        "br": brs,
+        "metadata": {
+            "execution_time": time.time() - start_time,
+            "results": len(brs),
+            "total_rows": len(brs),
+            "extraction_date": extraction_dates[0] if extraction_dates else None,
+            "chunks": [{
+                "size": len(chunk),
+                "results": result["metadata"]["results"],
+                "execution_time": result["metadata"]["execution_time"],
+            } for chunk, result in zip(chunks, results)],
+        }
+    }
+
+def stream_br_information(br_numbers: list[int], page_size: Optional[int] = None, cursor: Optional[str] = None):
+    """
+    Same as get_br_information but yields the JSON response in chunks (see DatabaseConnection.stream_query)
+    """
+    query_args, params = _br_information_query(br_numbers, page_size, cursor)
+    return _execute_br_query(query_args, params, page_size, stream=True, label="get_br_information")
+
+def _br_information_query(br_numbers: list[int], page_size: Optional[int], cursor: Optional[str]):
+    """Build the query arguments and parameters for get_br_information, raises a ValueError if the cursor is invalid"""
+    after = decode_cursor(cursor) if cursor else None
+    query_args = {
+        "br_number_count": len(br_numbers),
+        "limit": bool(page_size),
+        "active": False, #BRs here do not need to be active to be returned
+        "show_all": True,
+        "after_cursor": after is not None,
+    }
+    params = list(br_numbers)
+    if after is not None:
+        params.append(after)
+    if page_size:
+        params.append(page_size)
+    return query_args, params
+
+def _execute_br_query(query_args: dict, params: list, page_size: Optional[int] = None, stream: bool = False,
+                      label: Optional[str] = None):
+    """
+    Run a BR query against the local replica when it is available, falling back to the live database.
+
+    query_args are the arguments of BRQueryBuilder.get_br_query, the parameters order is the same for both targets.
+    The replica only holds the latest snapshot, so queries that are not restricted to it always go to the live database.
+    label names the query in the BITS query metrics.
+    """
+    in_snapshot = query_args.get("show_all") or query_args.get("active", True)
+    if in_snapshot and replica is not None and replica.is_ready():
+        try:
+            replica_query = query_builder.get_br_query(**query_args, target=TARGET_REPLICA)
+            if stream:
+                return replica.stream_query(replica_query, *params, page_size=page_size, query_label=label)
+            return replica.execute_query(replica_query, *params, page_size=page_size, query_label=label)
+        except sqlite3.Error as e:
+            logger.warning("BR replica query failed, falling back to the live database: %s", e)
+
+    query = query_builder.get_br_query(**query_args)
+    if stream:
+        return db.stream_query(query, *params, page_size=page_size, query_label=label)
+    return db.execute_query(query, *params, page_size=page_size, query_label=label)
 
 # pylint: disable=line-too-long
 @tool_metadata({
@@ -64,6 +181,10 @@ def get_br_information(br_numbers: list[int]):
                 "select_fields": {
                     "type": "string",
                     "description": "A stringified JSON object that match the BRSelectFields model.",
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "Optional. The metadata.next_cursor value of a previous search_br_by_fields call, to retrieve the next page of results for the same query.",
                 }
             },
             "required": ["br_query", "select_fields"]
@@ -71,7 +192,7 @@ def get_br_information(br_numbers: list[int]):
     }
   })
 # pylint: enable=line-too-long
-def search_br_by_fields(br_query: str, select_fields: str):
+def search_br_by_fields(br_query: str, select_fields: str, cursor: Optional[str] = None):
     """
     search_br_by_field
 
@@ -82,36 +203,81 @@ def search_br_by_fields(br_query: str, select_fields: str):
         logger.info("Valided query: %s", user_query)
 
         fields: BRSelectFields = BRSelectFields.model_validate_json(select_fields)
-        fields = query_builder.ensure_query_fields_present_in_select(user_query.query_filters, fields)
+        query_args, query_params, fields = prepare_search_query(user_query, fields, cursor)
         logger.info("Valided select fields (after filtering): %s", select_fields)
 
-        # Prepare the SQL statement for this request.
-        sql_query = query_builder.get_br_query(limit=bool(user_query.limit),
-                                            br_filters=user_query.query_filters,
-                                            active=user_query.active,
-                                            select_fields=fields,)
-
-        # Build query parameters dynamically, #1 statuses, #2 all other fields, #3 limit
-        query_params = []
-        for query_filter in user_query.query_filters:
-            if query_filter.is_date():
-                query_params.append(query_filter.value)
-            else:
-                query_params.append(f"%{query_filter.value}%")
-        query_params.append(user_query.limit)
-        result = db.execute_query(sql_query, *query_params)
+        result = _execute_br_query(query_args, query_params, page_size=user_query.limit,
+                                   label=search_label(user_query))
         # Append the original query to the result
         result["brquery"] = user_query.model_dump()
         result["brselect"] = fields.model_dump()
         return result
 
-    except (json.JSONDecodeError, ValidationError) as e:
+    except (json.JSONDecodeError, ValidationError, ValueError) as e:
         # Handle validation errors
         logger.error("Validation failed!")
         return {
             "error": str(e)
             }
 
+def prepare_search_query(user_query: BRQuery, fields: BRSelectFields, cursor: Optional[str] = None):
+    """
+    Build the query arguments (see BRQueryBuilder.get_br_query) and the parameters for a BR search.
+
+    Returns the query arguments, the parameters and the select fields (with the filtered fields added to them).
+    Raises a ValueError if the cursor is invalid.
+    """
+    fields = query_builder.ensure_query_fields_present_in_select(user_query.query_filters, fields)
+    after = decode_cursor(cursor) if cursor else None
+
+    # Prepare the SQL statement arguments for this request.
+    query_args = {
+        "limit": bool(user_query.limit),
+        "br_filters": user_query.query_filters,
+        "active": user_query.active,
+        "select_fields": fields,
+        "after_cursor": after is not None,
+    }
+
+    # Build query parameters dynamically, #1 statuses, #2 all other fields, #3 cursor, #4 limit
+    query_params = []
+    for query_filter in user_query.query_filters:
+        if query_filter.name in ORG_NAME_FIELDS:
+            _resolve_organization_filter(query_filter)
+        if query_filter.is_date() or query_filter.is_exact():
+            query_params.append(query_filter.value)
+        else:
+            query_params.append(f"%{query_filter.value}%")
+    if after is not None:
+        query_params.append(after)
+    if user_query.limit:
+        query_params.append(user_query.limit)
+    return query_args, query_params, fields
+
+def search_label(user_query: BRQuery) -> str:
+    """Name of a search in the query metrics: the filtered fields and operators, never the values."""
+    filters = sorted(f"{query_filter.name}{query_filter.operator}" for query_filter in user_query.query_filters)
+    return f"search_br_by_fields[{','.join(filters)}]"
+
+def _resolve_organization_filter(query_filter):
+    """Make an organization name filter an exact match when its value is a known organization name."""
+    try:
+        # The filtered field tells which language the name must be in (RPT_GC_ORG_NAME_EN or RPT_GC_ORG_NAME_FR)
+        name = org_index.canonical_name(query_filter.value, language=query_filter.name[-2:])
+    except Exception as e: # pylint: disable=broad-except
+        logger.warning("Organization index unavailable, keeping a LIKE filter: %s", e)
+        return
+    if name:
+        query_filter.set_exact_value(name)
+
+def stream_search_br_by_fields(user_query: BRQuery, fields: BRSelectFields, cursor: Optional[str] = None):
+    """
+    Streaming version of search_br_by_fields, used by the API to export large search results.
+    """
+    query_args, query_params, _ = prepare_search_query(user_query, fields, cursor)
+    return _execute_br_query(query_args, query_params, page_size=user_query.limit, stream=True,
+                             label=search_label(user_query))
+
 # pylint: disable=line-too-long
 @tool_metadata({
     "type": "function",
@@ -129,38 +295,43 @@ def search_br_by_fields(br_query: str, select_fields: str):
 def get_br_statuses_and_phases():
     """
     This will retreive the code table BR_STATUSES (Active == True)
-        (and distinct DISP_STATUS_EN, since we dont want duplicates)
-
-    WITH DistinctStatus AS (
-        SELECT DISP_STATUS_EN, MIN(STATUS_ID) AS MinStatusID
-        FROM [EDR_CARZ].[DIM_BITS_STATUS]
-        WHERE BR_ACTIVE_EN = 'Active'
-        GROUP BY DISP_STATUS_EN
-    )
-    SELECT
-        t.STATUS_ID,
-        ds.DISP_STATUS_EN AS NAME_EN,
-        t.DISP_STATUS_FR AS NAME_FR,
-        t.BITS_PHASE_EN AS PHASE_EN,
-        t.BITS_PHASE_FR AS PHASE_FR
-    FROM
-        DistinctStatus AS ds
-    JOIN
-        [EDR_CARZ].[DIM_BITS_STATUS] AS t
-    ON
-        ds.DISP_STATUS_EN = t.DISP_STATUS_EN AND ds.MinStatusID = t.STATUS_ID
-    WHERE
-        t.BR_ACTIVE_EN = 'Active';
-    """
-    return { "statuses": StatusesCache.get_statuses() }
+        (and distinct DISP_STATUS_EN, since we dont want duplicates), served from the code tables cache.
+        See bits_code_tables.STATUSES_QUERY
+    """
+    return { "statuses": code_tables.rows(STATUSES) }
+
 
+# pylint: disable=line-too-long
+@tool_metadata({
+    "type": "function",
+    "function": {
+        "name": "find_organization_names",
+        "description": "Use this function to find the exact value of the RPT_GC_ORG_NAME_EN or RPT_GC_ORG_NAME_FR fields (also refered to as clients) from an organization name, part of a name or an acronym. Returns the best candidates, best first. Example: Search for BRs with clients PC. You would call it with PC, get Parks Canada and search for RPT_GC_ORG_NAME_EN = Parks Canada.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "description": "The organization name, part of the name or acronym (english or french) the user is refering to."
+                }
+            },
+            "required": ["name"]
+      }
+    }
+  })
+# pylint: enable=line-too-long
+def find_organization_names(name: str, limit: int = 5):
+    """
+    Look up the organizations matching a name or an acronym in the local organization index.
+    """
+    return {"org_names": org_index.search(name, limit=limit)}
 
 # pylint: disable=line-too-long
 @tool_metadata({
     "type": "function",
     "function": {
         "name": "get_organization_names",
-        "description": "Use this function to list all organization and get a proper value for the RPT_GC_ORG_NAME_EN or RPT_GC_ORG_NAME_FR fields which are also refered to as clients. This can be invoked when a user is searching for BRs by a client name but is using the acronym. Example: Search for BRs with clients PC. You would resolve it to Parks Canada and search for RPT_GC_ORG_NAME_EN = Parks Canada.",
+        "description": "Use this function to list ALL the organizations (large response). Only use it when find_organization_names did not return the organization the user is refering to.",
         "parameters": {
             "type": "object",
             "properties": {},
@@ -171,14 +342,11 @@ def get_br_statuses_and_phases():
 # pylint: enable=line-too-long
 def get_organization_names():
     """
-    This will retreive organization so AI can look them up.
-    """
-    query = """
-    SELECT GC_ORG_NAME_EN, GC_ORG_NAME_FR, ORG_SHORT_NAME, ORG_ACRN_EN, ORG_ACRN_FR, ORG_ACRN_BIL, ORG_WEBSITE
-    FROM EDR_CARZ.DIM_GC_ORGANIZATION
+    This will retreive organization so AI can look them up, served from the code tables cache.
+        See bits_code_tables.ORGANIZATION_QUERY
     """
-
-    return db.execute_query(query, result_key="org_names")
+    org_names = code_tables.rows(ORGANIZATIONS)
+    return {"org_names": org_names, "metadata": {"results": len(org_names)}}
 
 # pylint: disable=line-too-long
 @tool_metadata({
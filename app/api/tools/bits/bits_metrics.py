@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+__all__ = ["QueryMetrics", "query_metrics", "query_shape"]
+
+# Queries slower than that are kept in the slow query log (and logged as warnings)
+_SLOW_QUERY_MS = float(os.getenv("BITS_SLOW_QUERY_MS", "2000"))
+_SLOW_QUERY_LOG_SIZE = int(os.getenv("BITS_SLOW_QUERY_LOG_SIZE", "100"))
+# Past that many distinct shapes, new ones are counted under a single "other" shape
+_MAX_SHAPES = int(os.getenv("BITS_METRICS_MAX_SHAPES", "500"))
+
+# Upper bounds (milliseconds) of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_OTHER_SHAPE = "other"
+_SHAPE_TEXT_LENGTH = 300
+
+# IN (%s, %s, ...) and IN (?, ?, ...) lists are the same shape whatever their length
+_IN_LIST = re.compile(r"IN\s*\(\s*(%s|\?)(\s*,\s*(%s|\?))*\s*\)", re.IGNORECASE)
+
+def query_shape(query: str) -> tuple[str, str]:
+    """
+    The shape of a query: its text with whitespace collapsed and parameter lists folded, and a short hash of it.
+
+    Queries are always parameterized, so the shape never holds any value.
+    """
+    text = _IN_LIST.sub("IN (...)", " ".join(query.split()))
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12], text
+
+@dataclass
+class _ShapeStats:
+    """Counters of a single query shape."""
+    text: str
+    source: str
+    label: Optional[str] = None
+    count: int = 0
+    errors: int = 0
+    cache_hits: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    max_rows: int = 0
+    payload_bytes: int = 0
+    max_payload_bytes: int = 0
+    buckets: list = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the percentile (the max for the unbounded bucket)."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, hits in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += hits
+            if seen >= target:
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def as_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "source": self.source,
+            "query": self.text[:_SHAPE_TEXT_LENGTH],
+            "count": self.count,
+            "errors": self.errors,
+            "cache_hits": self.cache_hits,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "latency_buckets_ms": dict(zip([*map(str, LATENCY_BUCKETS_MS), "+inf"], self.buckets)),
+            "rows": self.rows,
+            "max_rows": self.max_rows,
+            "payload_bytes": self.payload_bytes,
+            "max_payload_bytes": self.max_payload_bytes,
+        }
+
+class QueryMetrics:
+    """
+    In process metrics of the BITS queries, grouped by query shape (see `query_shape`).
+
+    Every executed query adds its latency to the histogram of its shape along with the rows and bytes it returned.
+    Queries slower than `slow_query_ms` also go in a bounded slow query log, which records the shape hash and the
+    parameter types but never the parameter values (they can hold user input).
+    """
+
+    def __init__(self, slow_query_ms: float = _SLOW_QUERY_MS, slow_log_size: int = _SLOW_QUERY_LOG_SIZE,
+                 max_shapes: int = _MAX_SHAPES):
+        self.slow_query_ms = slow_query_ms
+        self.max_shapes = max_shapes
+        self._shapes: dict[str, _ShapeStats] = {}
+        self._slow_queries: deque = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def _stats(self, query: str, source: str, label: Optional[str]) -> tuple[str, _ShapeStats]:
+        """Stats of the shape of `query`, the lock must be held."""
+        shape, text = query_shape(query)
+        stats = self._shapes.get(shape)
+        if stats is None:
+            if len(self._shapes) >= self.max_shapes:
+                shape, text, source, label = _OTHER_SHAPE, "", "", None
+                stats = self._shapes.get(shape)
+            if stats is None:
+                stats = self._shapes[shape] = _ShapeStats(text=text, source=source)
+        if label:
+            stats.label = label
+        return shape, stats
+
+    def record(self, query: str, args: tuple, execution_time: float, rows: int = 0, payload_bytes: int = 0,
+               source: str = "live", label: Optional[str] = None, failed: bool = False):
+        """Record an executed query, `execution_time` is in seconds."""
+        duration_ms = execution_time * 1000
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if duration_ms <= bound),
+                      len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            shape, stats = self._stats(query, source, label)
+            stats.count += 1
+            stats.errors += int(failed)
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.buckets[bucket] += 1
+            stats.rows += rows
+            stats.max_rows = max(stats.max_rows, rows)
+            stats.payload_bytes += payload_bytes
+            stats.max_payload_bytes = max(stats.max_payload_bytes, payload_bytes)
+
+        if duration_ms >= self.slow_query_ms:
+            entry = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "shape": shape,
+                "label": label,
+                "source": source,
+                "duration_ms": round(duration_ms, 3),
+                "rows": rows,
+                "payload_bytes": payload_bytes,
+                "failed": failed,
+                "param_types": [type(arg).__name__ for arg in args],
+            }
+            self._slow_queries.append(entry)
+            logger.warning("Slow BITS query %s (%s) took %s ms for %s rows, param types: %s",
+                           shape, label, entry["duration_ms"], rows, entry["param_types"])
+
+    def record_cache_hit(self, query: str, source: str = "live", label: Optional[str] = None):
+        """Record a query served from the query cache (not part of the latency histogram)."""
+        with self._lock:
+            _, stats = self._stats(query, source, label)
+            stats.cache_hits += 1
+
+    def snapshot(self) -> dict:
+        """The metrics of every shape, slowest (p95) first, and the slow query log, newest first."""
+        with self._lock:
+            shapes = {shape: stats.as_dict() for shape, stats in self._shapes.items()}
+            slow_queries = list(reversed(self._slow_queries))
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "shapes": dict(sorted(shapes.items(), key=lambda item: -(item[1]["p95_ms"] or 0))),
+            "slow_queries": slow_queries,
+        }
+
+    def reset(self):
+        """Drop every metric."""
+        with self._lock:
+            self._shapes.clear()
+            self._slow_queries.clear()
+
+# Process wide metrics, shared by the live database and the replica
+query_metrics = QueryMetrics()
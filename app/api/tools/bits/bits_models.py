@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 
 from tools.bits.bits_fields import BRFields
 
@@ -7,6 +7,8 @@ class BRQueryFilter(BaseModel):
     name: str = Field(..., description="Name of the database field", )
     value: str = Field(..., description="Value of the field")
     operator: str = Field(..., description="Operator, must be one of '=', '<', '>', '<=' or '>=' or '!='")
+    # Set when the value was resolved to an exact database value, the filter then uses = instead of LIKE
+    _exact: bool = PrivateAttr(default=False)
 
     # Validator for the 'operator' field
     @field_validator("operator")
@@ -30,6 +32,15 @@ class BRQueryFilter(BaseModel):
         """Check if the field is a date."""
         return str(self.name).endswith("_DATE")
 
+    def set_exact_value(self, value: str):
+        """Replace the value by the exact database value, the filter will be an equality instead of a LIKE."""
+        self.value = value
+        self._exact = self.operator in ("=", "!=")
+
+    def is_exact(self) -> bool:
+        """Check if the filter is an exact match (see set_exact_value)."""
+        return self._exact
+
     def to_label_dict(self):
         """Return a dict with en/fr labels instead of the raw name."""
         field_info = BRFields.valid_search_fields_filterable.get(self.name, {})
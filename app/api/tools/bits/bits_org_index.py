@@ -0,0 +1,190 @@
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+
+from tools.bits.bits_code_tables import ORGANIZATIONS, CodeTableCache
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+__all__ = ["OrganizationIndex", "get_organization_index"]
+
+# After a failed load, lookups do not try to load the index again for that many seconds
+_RETRY_AFTER_SECS = int(os.getenv("BITS_ORG_INDEX_RETRY_SECS", "60"))
+
+_NAME_COLUMNS = ("GC_ORG_NAME_EN", "GC_ORG_NAME_FR", "ORG_SHORT_NAME")
+_ACRONYM_COLUMNS = ("ORG_ACRN_EN", "ORG_ACRN_FR", "ORG_ACRN_BIL")
+# Returned to the model, ORG_WEBSITE is left out to keep the payload small
+_RESULT_COLUMNS = ("GC_ORG_NAME_EN", "GC_ORG_NAME_FR", "ORG_ACRN_EN", "ORG_ACRN_FR")
+# Words that do not help telling organizations apart
+_STOP_WORDS = {"of", "the", "and", "for", "de", "du", "des", "la", "le", "les", "et", "l", "d"}
+
+def normalize(text: Optional[str]) -> str:
+    """Lower case, accents and punctuation removed, single spaces."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+def _tokens(text: str) -> set:
+    return {token for token in text.split() if token not in _STOP_WORDS}
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class _Snapshot:
+    """Immutable state of the index, replaced as a whole on refresh."""
+
+    def __init__(self, rows: Iterable[dict]):
+        self.organizations = []
+        self.names = []  # (organization index, normalized name, trigrams, tokens)
+        self.acronyms = defaultdict(set)
+        self.exact_names = {}  # normalized EN/FR name -> organization index
+        self.trigram_postings = defaultdict(set)
+        self.token_postings = defaultdict(set)
+
+        for row in rows:
+            org_id = len(self.organizations)
+            self.organizations.append({column: row.get(column) for column in _RESULT_COLUMNS})
+            for column in _ACRONYM_COLUMNS:
+                acronym = normalize(row.get(column)).replace(" ", "")
+                if acronym:
+                    self.acronyms[acronym].add(org_id)
+            for column in _NAME_COLUMNS:
+                name = normalize(row.get(column))
+                if not name:
+                    continue
+                if column != "ORG_SHORT_NAME":
+                    self.exact_names[name] = org_id
+                name_id = len(self.names)
+                trigrams, tokens = _trigrams(name), _tokens(name)
+                self.names.append((org_id, name, trigrams, tokens))
+                for trigram in trigrams:
+                    self.trigram_postings[trigram].add(name_id)
+                for token in tokens:
+                    self.token_postings[token].add(name_id)
+
+class OrganizationIndex:
+    """
+    In memory fuzzy index of the GC organizations (`DIM_GC_ORGANIZATION`).
+
+    Names (EN, FR and short name) are matched with trigrams and tokens, acronyms (EN, FR and bilingual)
+    are matched exactly. The index is rebuilt from `loader` on `refresh` and swapped atomically. Lookups made
+    before it is built try to build it themselves, at most once every `retry_after` seconds when the loader
+    fails, and get no match in the meantime.
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[dict]], retry_after: float = _RETRY_AFTER_SECS):
+        self.loader = loader
+        self.retry_after = retry_after
+        self.loaded_at: Optional[float] = None
+        self._failed_at: Optional[float] = None
+        self._snapshot = _Snapshot([])
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self):
+        """Reload the organizations and swap the index."""
+        with self._refresh_lock:
+            self._load()
+
+    def _load(self):
+        start_time = time.time()
+        snapshot = _Snapshot(self.loader())
+        self._snapshot = snapshot
+        self.loaded_at = time.time()
+        logger.info("Organization index loaded with %s organizations in %s seconds",
+                    len(snapshot.organizations), self.loaded_at - start_time)
+
+    def ensure_loaded(self):
+        """Load the index on first use, unless the last attempt failed less than `retry_after` seconds ago."""
+        if self.loaded_at is not None or self._recently_failed():
+            return
+        with self._refresh_lock:
+            if self.loaded_at is not None or self._recently_failed():
+                return
+            try:
+                self._load()
+            except Exception as e: # pylint: disable=broad-except
+                self._failed_at = time.monotonic()
+                logger.error("Unable to load the organization index, retrying in %s seconds: %s", self.retry_after, e)
+
+    def _recently_failed(self) -> bool:
+        return self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_after
+
+    def search(self, text: str, limit: int = 5) -> list[dict]:
+        """
+        Return the `limit` organizations that best match `text` (a name, part of a name or an acronym),
+        best match first, with a `score` between 0 and 1.
+        """
+        self.ensure_loaded()
+        snapshot = self._snapshot
+        query = normalize(text)
+        if not query:
+            return []
+
+        scores = defaultdict(float)
+        for org_id in snapshot.acronyms.get(query.replace(" ", ""), ()):
+            scores[org_id] = 1.0
+
+        query_trigrams, query_tokens = _trigrams(query), _tokens(query)
+        candidates = set()
+        for token in query_tokens:
+            candidates |= snapshot.token_postings.get(token, set())
+        for trigram in query_trigrams:
+            candidates |= snapshot.trigram_postings.get(trigram, set())
+
+        for name_id in candidates:
+            org_id, name, trigrams, tokens = snapshot.names[name_id]
+            if name == query:
+                score = 1.0
+            else:
+                similarity = len(query_trigrams & trigrams) / len(query_trigrams | trigrams)
+                coverage = len(query_tokens & tokens) / len(query_tokens) if query_tokens else 0
+                score = min(0.99, 0.6 * similarity + 0.4 * coverage)
+            scores[org_id] = max(scores[org_id], score)
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{**snapshot.organizations[org_id], "score": round(score, 3)} for org_id, score in best]
+
+    def canonical_name(self, value: str, language: str = "EN") -> Optional[str]:
+        """
+        The organization name, in `language` (EN or FR) and as stored in the database, if `value` is the
+        english or french name of an organization (case and accents insensitive).
+        """
+        self.ensure_loaded()
+        snapshot = self._snapshot
+        org_id = snapshot.exact_names.get(normalize(value))
+        if org_id is None:
+            return None
+        return snapshot.organizations[org_id].get(f"GC_ORG_NAME_{language.upper()}")
+
+_index: Optional[OrganizationIndex] = None
+_index_lock = threading.Lock()
+
+def get_organization_index(code_tables: CodeTableCache) -> OrganizationIndex:
+    """
+    Return the process wide organization index, built from the organizations code table.
+
+    The index is rebuilt every time the code table is refreshed (in the background), it never queries the
+    database itself: until the code table is loaded, lookups get no match.
+    """
+    global _index # pylint: disable=global-statement
+
+    def load_organizations():
+        rows = code_tables.loaded_rows(ORGANIZATIONS)
+        if rows is None:
+            raise LookupError("The organizations code table is not loaded yet")
+        return rows
+
+    with _index_lock:
+        if _index is None:
+            _index = OrganizationIndex(load_organizations)
+            code_tables.subscribe(ORGANIZATIONS, _index.refresh)
+    return _index
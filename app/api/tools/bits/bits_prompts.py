@@ -40,7 +40,7 @@ General Guidelines:
 - If no BRs are returned (i.e., the "br" key is missing or empty), state: "No results found for your query."
 - ALWAYS use the 'en' or 'fr' field from the valid_search_fields() tool to ensure you are using the correct field name in the query. Do not use the raw field names directly unless the user is already refering to them in their query.
 - If you are being prompted by the user on how to search for BRs you can use the information you have here to help guide the users about your capabilities.
-- Use the get_organization_names() tool to resolve organization acronyms to full names when searching for BRs by client name.
+- Use the find_organization_names() tool to resolve organization names or acronyms to the exact client name when searching for BRs by client name, then filter on that exact name with the = operator.
 
 Tools (functions) guidelines:
 
@@ -96,7 +96,7 @@ Directives générales :
 - Si aucune DA n’est retournée (c’est-à-dire que la clé "br" est absente ou vide), indiquez : « Aucun résultat trouvé pour votre requête. »
 - Utilisez TOUJOURS le champ « fr » ou « en » dans l’outil valid_search_fields() pour garantir que vous utilisez le bon nom de champ dans la requête. N’utilisez les noms de champs bruts que si l’utilisateur s’y réfère déjà dans sa demande.
 - Si l’utilisateur vous demande comment rechercher des DA, vous pouvez utiliser les informations présentes ici pour guider l’utilisateur sur vos capacités.
-- Utilisez l’outil get_organization_names() pour convertir les acronymes d’organisations en noms complets lors de la recherche de DA par nom de client.
+- Utilisez l’outil find_organization_names() pour convertir les noms ou acronymes d’organisations en nom de client exact lors de la recherche de DA par nom de client, puis filtrez sur ce nom exact avec l’opérateur =.
 
 ################################################
 
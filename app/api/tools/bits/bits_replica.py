@@ -0,0 +1,232 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, Optional
+
+from tools.bits.bits_fields import BRFields
+from tools.bits.bits_utils import (DEFAULT_FETCH_SIZE, REPLICA_TABLE, TARGET_REPLICA, BRQueryBuilder,
+                                   DatabaseConnection, measured_result, measured_stream, serialize_value)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+__all__ = ["BRSnapshotReplica", "get_replica"]
+
+_REPLICA_PATH = os.getenv("BITS_REPLICA_PATH")
+_REPLICA_REFRESH_SECS = int(os.getenv("BITS_REPLICA_REFRESH_SECS", "900"))
+
+_STAGING_TABLE = f"{REPLICA_TABLE}_staging"
+_META_TABLE = "replica_meta"
+_INSERT_BATCH_SIZE = 1000
+
+class BRSnapshotReplica:
+    """
+    Local (SQLite) read replica of the latest BITS BR snapshot.
+
+    The replica is a single flat table, one row per BR, holding every field of `BRFields.valid_search_fields`
+    for the snapshot identified by `MAX(PERIOD_END_DATE)`. It is built from the same query `get_br_information`
+    runs against the EDR database and is only refreshed when the snapshot date changes. The file can live in the
+    API container or on a shared volume so multiple workers read the same copy.
+
+    NOTE: the replica only contains BRs that are part of the latest snapshot, so searches for
+          inactive BRs that are no longer in the snapshot will still need to hit the live database.
+    """
+
+    def __init__(self, path: str, source: DatabaseConnection, query_builder: BRQueryBuilder):
+        self.path = path
+        self.source = source
+        self.query_builder = query_builder
+        self.columns = ["BR_NMBR", "EXTRACTION_DATE", "BR_ACTIVE_EN", "BR_ACTIVE_FR",
+                        *BRFields.valid_search_fields.keys()]
+        self._refresh_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._init_schema()
+        # Kept in memory so lookups do not have to read replica_meta, updated by every refresh
+        self._snapshot_date: Optional[str] = self._read_snapshot_date()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A new connection per call keeps things thread safe, WAL lets readers proceed during a refresh.
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_schema(self):
+        other_columns = ", ".join(f"{column} TEXT" for column in self.columns[1:])
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {REPLICA_TABLE} (BR_NMBR INTEGER PRIMARY KEY, {other_columns})")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {_META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+        conn.close()
+
+    def _read_snapshot_date(self, conn: Optional[sqlite3.Connection] = None) -> Optional[str]:
+        own_conn = conn is None
+        conn = conn or self._connect()
+        try:
+            row = conn.execute(f"SELECT value FROM {_META_TABLE} WHERE key = 'snapshot_date'").fetchone()
+            return row["value"] if row else None
+        finally:
+            if own_conn:
+                conn.close()
+
+    def snapshot_date(self) -> Optional[str]:
+        """Return the PERIOD_END_DATE the replica was built from, None if it was never built."""
+        return self._snapshot_date
+
+    def is_ready(self) -> bool:
+        """The replica can serve queries once it has been built at least once."""
+        return self._snapshot_date is not None
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Refresh the replica if the snapshot date of the live database changed.
+
+        The replica file can be shared by several processes: the SQLite write lock is taken first
+        (BEGIN IMMEDIATE) and the snapshot date is checked again once it is held, so only one process
+        reloads a given snapshot. Rows are streamed from the live database into a temporary (per connection)
+        staging table, then merged in the same transaction: new and modified BRs are upserted, BRs that left
+        the snapshot are removed and unchanged rows are left alone. Readers keep seeing the previous snapshot
+        until the transaction commits.
+
+        Returns True if the replica was updated.
+        """
+        with self._refresh_lock:
+            live_snapshot_date = self.source.get_snapshot_date()
+            if live_snapshot_date is None:
+                logger.warning("No snapshot date found in the live database, skipping replica refresh")
+                return False
+            if not force and live_snapshot_date == self._snapshot_date:
+                return False
+
+            conn = self._connect()
+            conn.isolation_level = None # transactions are managed explicitly below
+            try:
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                except sqlite3.OperationalError as e:
+                    logger.info("BR replica is being refreshed by another process, skipping: %s", e)
+                    return False
+
+                try:
+                    replica_snapshot_date = self._read_snapshot_date(conn)
+                    if not force and live_snapshot_date == replica_snapshot_date:
+                        # Another process already loaded this snapshot
+                        conn.execute("ROLLBACK")
+                        self._snapshot_date = replica_snapshot_date
+                        return False
+                    changed_rows = self._load(conn, live_snapshot_date)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.close()
+
+            self._snapshot_date = live_snapshot_date
+            logger.info("BR replica refreshed to snapshot %s (%s rows changed)", live_snapshot_date, changed_rows)
+            return True
+
+    def _load(self, conn: sqlite3.Connection, snapshot_date: str) -> int:
+        """Stream the live snapshot into the staging table and merge it, returns the number of rows changed."""
+        start_time = time.time()
+        query = self.query_builder.get_br_query(active=False, show_all=True)
+        column_list = ", ".join(self.columns)
+        placeholders = ", ".join(["?"] * len(self.columns))
+
+        conn.execute(f"DROP TABLE IF EXISTS temp.{_STAGING_TABLE}")
+        conn.execute(f"CREATE TEMP TABLE {_STAGING_TABLE} AS SELECT * FROM main.{REPLICA_TABLE} WHERE 0")
+        batch = []
+        for row in self.source.iter_rows(query):
+            batch.append(tuple(serialize_value(row.get(column)) for column in self.columns))
+            if len(batch) >= _INSERT_BATCH_SIZE:
+                conn.executemany(f"INSERT INTO temp.{_STAGING_TABLE} ({column_list}) VALUES ({placeholders})", batch)
+                batch = []
+        if batch:
+            conn.executemany(f"INSERT INTO temp.{_STAGING_TABLE} ({column_list}) VALUES ({placeholders})", batch)
+
+        updates = ", ".join(f"{column} = excluded.{column}" for column in self.columns[1:])
+        changed = " OR ".join(f"{REPLICA_TABLE}.{column} IS NOT excluded.{column}" for column in self.columns[1:])
+        changes_before = conn.total_changes
+        conn.execute(f"""
+            INSERT INTO main.{REPLICA_TABLE} ({column_list})
+            SELECT {column_list} FROM temp.{_STAGING_TABLE} WHERE true
+            ON CONFLICT(BR_NMBR) DO UPDATE SET {updates} WHERE {changed}
+        """)
+        conn.execute(f"""
+            DELETE FROM main.{REPLICA_TABLE}
+            WHERE BR_NMBR NOT IN (SELECT BR_NMBR FROM temp.{_STAGING_TABLE})
+        """)
+        changed_rows = conn.total_changes - changes_before
+        conn.execute(f"INSERT OR REPLACE INTO {_META_TABLE} (key, value) VALUES ('snapshot_date', ?)",
+                     (snapshot_date,))
+        conn.execute(f"DROP TABLE temp.{_STAGING_TABLE}")
+        logger.debug("BR replica snapshot %s loaded in %s seconds", snapshot_date, time.time() - start_time)
+        return changed_rows
+
+    def iter_rows(self, query, *args, batch_size=DEFAULT_FETCH_SIZE) -> Iterator[dict]:
+        """Same contract as `DatabaseConnection.iter_rows`, against the replica."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(query, args)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def execute_query(self, query, *args, result_key='br', page_size: Optional[int] = None,
+                      query_label: Optional[str] = None):
+        """Same contract as `DatabaseConnection.execute_query`, against the replica."""
+        result = measured_result(self.iter_rows(query, *args), query, args, result_key=result_key,
+                                 page_size=page_size, source=TARGET_REPLICA, query_label=query_label)
+        result['metadata']['source'] = 'replica'
+        return result
+
+    def stream_query(self, query, *args, result_key='br', page_size: Optional[int] = None,
+                     batch_size=DEFAULT_FETCH_SIZE, query_label: Optional[str] = None) -> Iterator[str]:
+        """Same contract as `DatabaseConnection.stream_query`, against the replica."""
+        return measured_stream(self.iter_rows(query, *args, batch_size=batch_size), query, args,
+                               result_key=result_key, page_size=page_size, source=TARGET_REPLICA,
+                               query_label=query_label)
+
+    def start_background_refresh(self, interval: int = _REPLICA_REFRESH_SECS):
+        """Refresh the replica now and then every `interval` seconds, in a daemon thread."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e: # pylint: disable=broad-except
+                    logger.error("Unable to refresh the BR replica: %s", e)
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=run, name="bits-replica-refresh", daemon=True)
+        self._thread.start()
+
+_replica: Optional[BRSnapshotReplica] = None
+_replica_lock = threading.Lock()
+
+def get_replica(source: DatabaseConnection, query_builder: BRQueryBuilder) -> Optional[BRSnapshotReplica]:
+    """
+    Return the process wide replica, None if BITS_REPLICA_PATH is not set.
+
+    The replica is created (and its background refresh started) on the first call.
+    """
+    global _replica # pylint: disable=global-statement
+    if not _REPLICA_PATH:
+        return None
+    with _replica_lock:
+        if _replica is None:
+            try:
+                _replica = BRSnapshotReplica(_REPLICA_PATH, source, query_builder)
+                _replica.start_background_refresh()
+            except sqlite3.Error as e:
+                logger.error("Unable to open the BR replica at %s: %s", _REPLICA_PATH, e)
+                return None
+    return _replica
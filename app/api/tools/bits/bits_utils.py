@@ -1,91 +1,399 @@
+import base64
+import binascii
+import itertools
 import json
 import logging
+import queue
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Optional
+from typing import Callable, Iterator, List, Optional
 
 import pymssql
 
 from tools.bits.bits_fields import BRFields
+from tools.bits.bits_metrics import query_metrics
 from tools.bits.bits_models import BRQueryFilter, BRSelectFields
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+DEFAULT_FETCH_SIZE = 500
+# Column used for keyset pagination, BR queries are always ordered by BR_NMBR DESC
+CURSOR_FIELD = "BR_NMBR"
+_HIDDEN_COLUMNS = {"TotalCount", "EXTRACTION_DATE", "BR_ACTIVE_EN", "BR_ACTIVE_FR"}
+
+TARGET_LIVE = "live"
+TARGET_REPLICA = "replica"
+REPLICA_TABLE = "br_snapshot"
+
+SNAPSHOT_DATE_QUERY = """
+SELECT MAX(PERIOD_END_DATE) AS PERIOD_END_DATE FROM [EDR_CARZ].[FCT_DEMAND_BR_SNAPSHOT]
+"""
+
 class DatabaseConnection:
-    """Database connection class."""
-    def __init__(self, server, username, password, database):
+    """
+    Database connection class.
+
+    When `cache_size` is set, `execute_query` results are kept in an LRU cache tied to the snapshot date
+    (`MAX(PERIOD_END_DATE)`). BITS data only changes when a new snapshot lands, so the whole cache is dropped
+    as soon as the (cached for `snapshot_ttl` seconds) snapshot date probe returns a new value.
+    The cache is also bounded by the total number of rows it holds (`cache_max_rows`), results larger than a
+    quarter of that budget are never cached.
+
+    When `pool_size` is set, up to that many idle connections are kept open and reused between queries
+    (for at most `pool_max_idle` seconds).
+    """
+    def __init__(self, server, username, password, database, cache_size: int = 0, snapshot_ttl: float = 60,
+                 pool_size: int = 0, cache_max_rows: int = 10000, pool_max_idle: float = 300):
         self.server = server
         self.username = username
         self.password = password
         self.database = database
+        self.pool_size = pool_size
+        self.pool_max_idle = pool_max_idle
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=pool_size)
+        self.cache_size = cache_size
+        self.cache_max_rows = cache_max_rows
+        self.snapshot_ttl = snapshot_ttl
+        self._cache: OrderedDict = OrderedDict()
+        self._cached_rows = 0
+        self._cache_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_date: Optional[str] = None
+        self._snapshot_checked_at = 0.0
 
     def get_conn(self):
         """Get the database connection."""
         logger.debug("requesting connection to database to --> %s", self.server)
         return pymssql.connect(server=self.server, user=self.username, password=self.password, database=self.database)  # pylint: disable=no-member
 
-    def execute_query(self, query, *args, result_key='br'):
+    def acquire_conn(self):
         """
-        Executes a query against the database
+        Get an idle connection from the pool, or a new one if there is none.
 
-        The returned content will always be in JSON format with items as column values
+        Returns the connection and whether it came from the pool. Connections idle for more than
+        `pool_max_idle` seconds are closed instead of being reused (the server may have dropped them).
         """
-        # Get the database connection
-        conn = self.get_conn()
-        cursor = conn.cursor()
+        while True:
+            try:
+                conn, released_at = self._pool.get_nowait()
+            except queue.Empty:
+                return self.get_conn(), False
+            if time.monotonic() - released_at <= self.pool_max_idle:
+                return conn, True
+            _close_quietly(conn)
+
+    def release_conn(self, conn, reusable: bool = True):
+        """
+        Give a connection back to the pool, it is closed instead when the pool is full or when
+        it is not `reusable` (query failed or its results were not fully read).
+        """
+        if reusable and self.pool_size:
+            try:
+                self._pool.put_nowait((conn, time.monotonic()))
+                return
+            except queue.Full:
+                pass
+        _close_quietly(conn)
+
+    def _execute(self, query, args):
+        """
+        Run the query on a pooled (or new) connection and return (connection, cursor).
 
+        A pooled connection that fails with an OperationalError (dropped by the server, failover, etc.)
+        is discarded and the query is retried once on a new connection.
+        """
+        conn, pooled = self.acquire_conn()
         try:
-            logger.debug("About to run this query %s \nWith those params: %s", query, args)
-            # Start timing the query execution
-            start_time = time.time()
+            cursor = conn.cursor()
+            cursor.execute(query, args)
+            return conn, cursor
+        except pymssql.OperationalError as e: # pylint: disable=no-member
+            _close_quietly(conn)
+            if not pooled:
+                raise
+            logger.warning("Pooled connection failed, retrying on a new connection: %s", e)
+        except Exception:
+            _close_quietly(conn)
+            raise
 
+        conn = self.get_conn()
+        try:
+            cursor = conn.cursor()
             cursor.execute(query, args)
-            rows = cursor.fetchall()
-
-            # End timing the query execution
-            end_time = time.time()
-            execution_time = end_time - start_time
-
-            # Log the query execution time
-            logger.info("Query executed in %s seconds", execution_time)
-
-            # Fetch column names
-            columns = [desc[0] for desc in cursor.description]
-
-            # Create a list of lists of dictionaries with one key-value pair each
-            #result = [[{columns[i]: row[i]} for i in range(len(columns))] for row in rows] # type: ignore
-            result = [{columns[i]: row[i] for i in range(len(columns))} for row in rows] # type: ignore
-            logger.debug("Found %s results!", len(result))
-
-            extraction_date = result[0].get("EXTRACTION_DATE") if result else None
-            total_count = result[0].get("TotalCount") if result else None
-
-            # Remove both TotalCount and ExtractionDate from the result if they exist
-            cleaned_result = [
-                {k: v for k, v in item.items() if k not in ["TotalCount", "EXTRACTION_DATE", "BR_ACTIVE_EN", "BR_ACTIVE_FR"]}
-                for item in result
-            ]
-
-            final_result = {
-                result_key: cleaned_result,
-                'metadata': {
-                    'execution_time': execution_time,
-                    'results': len(result),
-                    'total_rows': total_count,
-                    'extraction_date': extraction_date,
-                }
-            }
-
-            # Convert the result to JSON
-                                                    #needed for the date serialization
-            json_result = json.dumps(final_result, default=_data_serializer, indent=4)
-            return json.loads(json_result)
+            return conn, cursor
+        except Exception:
+            _close_quietly(conn)
+            raise
+
+    def iter_rows(self, query, *args, batch_size=DEFAULT_FETCH_SIZE) -> Iterator[dict]:
+        """
+        Executes a query against the database and yields each row as a dict
+
+        Rows are pulled from the server-side cursor with `fetchmany` so only `batch_size` rows
+        are held in memory at any given time. The connection goes back to the pool once the generator
+        is exhausted, it is closed if the generator is closed early by the caller or on error.
+        """
+        logger.debug("About to run this query %s \nWith those params: %s", query, args)
+        conn, cursor = self._execute(query, args)
+        exhausted = False
 
+        try:
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {columns[i]: row[i] for i in range(len(columns))}
+            exhausted = True
         finally:
-            # Ensure the connection is closed
-            conn.close()
+            # Ensure the connection is released (or closed)
+            self.release_conn(conn, reusable=exhausted)
+
+    def execute_query(self, query, *args, result_key='br', page_size: Optional[int] = None,
+                      query_label: Optional[str] = None):
+        """
+        Executes a query against the database
+
+        The returned content will always be in JSON format with items as column values
+
+        When a `page_size` is given and the page is full, a `next_cursor` token is added to the metadata
+        so the caller can request the following page (see `encode_cursor`).
+
+        Results are served from the snapshot cache when it is enabled, `metadata.cache_hit` tells if it was.
+        Every query is recorded in `query_metrics` under its shape, `query_label` names it there (tool, filters).
+        """
+        def run():
+            return measured_result(self.iter_rows(query, *args), query, args, result_key=result_key,
+                                   page_size=page_size, source=TARGET_LIVE, query_label=query_label)
+
+        if not self.cache_size:
+            return run()
+
+        try:
+            snapshot_date = self.current_snapshot_date()
+        except pymssql.Error as e: # pylint: disable=no-member
+            logger.warning("Unable to probe the snapshot date, bypassing the query cache: %s", e)
+            return run()
+
+        key = (query, args, result_key, page_size)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == snapshot_date:
+                self._cache.move_to_end(key)
+                query_metrics.record_cache_hit(query, source=TARGET_LIVE, label=query_label)
+                return _copy_result(cached[1], result_key, cache_hit=True)
+
+        result = run()
+        rows = len(result[result_key])
+        if rows > self.cache_max_rows // 4:
+            # Large exports would evict everything else, and hold a lot of memory per worker
+            return _copy_result(result, result_key, cache_hit=False)
+
+        with self._cache_lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cached_rows -= previous[2]
+            self._cache[key] = (snapshot_date, result, rows)
+            self._cached_rows += rows
+            while len(self._cache) > self.cache_size or self._cached_rows > self.cache_max_rows:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_rows -= evicted[2]
+        return _copy_result(result, result_key, cache_hit=False)
+
+    def stream_query(self, query, *args, result_key='br', page_size: Optional[int] = None,
+                     batch_size=DEFAULT_FETCH_SIZE, query_label: Optional[str] = None) -> Iterator[str]:
+        """
+        Streaming version of `execute_query`.
+
+        Yields the same JSON document `execute_query` would return, one row at a time, so large exports
+        can be sent to the client in constant memory.
+        """
+        return measured_stream(self.iter_rows(query, *args, batch_size=batch_size), query, args,
+                               result_key=result_key, page_size=page_size, source=TARGET_LIVE,
+                               query_label=query_label)
+
+    def get_snapshot_date(self) -> Optional[str]:
+        """Return the latest PERIOD_END_DATE of the BR snapshot (ISO format), this is a cheap probe."""
+        rows = list(self.iter_rows(SNAPSHOT_DATE_QUERY))
+        return serialize_value(rows[0].get("PERIOD_END_DATE")) if rows else None
+
+    def current_snapshot_date(self) -> Optional[str]:
+        """
+        Same as `get_snapshot_date` but the probe result is reused for `snapshot_ttl` seconds.
+
+        The query cache is cleared when the snapshot date changes.
+        """
+        with self._snapshot_lock:
+            now = time.monotonic()
+            if self._snapshot_checked_at and now - self._snapshot_checked_at < self.snapshot_ttl:
+                return self._snapshot_date
+
+            snapshot_date = self.get_snapshot_date()
+            if snapshot_date != self._snapshot_date:
+                if self._snapshot_date is not None:
+                    logger.info("New BR snapshot %s (was %s), clearing the query cache",
+                                snapshot_date, self._snapshot_date)
+                self.clear_cache()
+            self._snapshot_date = snapshot_date
+            self._snapshot_checked_at = now
+            return snapshot_date
+
+    def clear_cache(self):
+        """Drop every cached query result."""
+        with self._cache_lock:
+            self._cache.clear()
+            self._cached_rows = 0
+
+def _copy_result(result: dict, result_key: str, cache_hit: bool) -> dict:
+    """Copy of a cached result that callers can modify (they add keys to it) without altering the cache."""
+    copy = dict(result)
+    copy[result_key] = list(result[result_key])
+    copy['metadata'] = {**result['metadata'], 'cache_hit': cache_hit}
+    return copy
+
+def _close_quietly(conn):
+    """Close a connection that may already be broken."""
+    try:
+        conn.close()
+    except Exception as e: # pylint: disable=broad-except
+        logger.debug("Error closing connection: %s", e)
+
+def measured_result(rows: Iterator[dict], query: str, args: tuple, result_key='br', page_size: Optional[int] = None,
+                    source: str = TARGET_LIVE, query_label: Optional[str] = None) -> dict:
+    """
+    `collect_result` that records the query (latency and rows) in `query_metrics`.
+
+    The payload size is not recorded, serializing the rows a second time just to measure them can cost more than
+    the query. Streamed queries (`measured_stream`) count the bytes as they are sent.
+    """
+    start_time = time.time()
+    try:
+        result = collect_result(rows, result_key=result_key, page_size=page_size)
+    except Exception:
+        query_metrics.record(query, args, time.time() - start_time, source=source, label=query_label, failed=True)
+        raise
+    query_metrics.record(query, args, result['metadata']['execution_time'], rows=len(result[result_key]),
+                         source=source, label=query_label)
+    return result
+
+def measured_stream(rows: Iterator[dict], query: str, args: tuple, result_key='br', page_size: Optional[int] = None,
+                    source: str = TARGET_LIVE, query_label: Optional[str] = None) -> Iterator[str]:
+    """`stream_result` that records the query in `query_metrics` once the document is fully sent."""
+    def on_complete(count: int, payload_bytes: int, execution_time: float, failed: bool):
+        query_metrics.record(query, args, execution_time, rows=count, payload_bytes=payload_bytes,
+                             source=source, label=query_label, failed=failed)
+
+    return stream_result(rows, result_key=result_key, page_size=page_size, on_complete=on_complete)
+
+def collect_result(rows: Iterator[dict], result_key='br', page_size: Optional[int] = None) -> dict:
+    """
+    Consume the rows of a query and build the response returned by `execute_query`
+    (the `result_key` list along with the `metadata` block)
+    """
+    # Start timing the query execution
+    start_time = time.time()
+
+    result = []
+    extraction_date = None
+    total_count = None
+    for row in rows:
+        if not result:
+            extraction_date = serialize_value(row.get("EXTRACTION_DATE"))
+            total_count = row.get("TotalCount")
+        result.append(_clean_row(row))
+
+    # End timing the query execution
+    end_time = time.time()
+    execution_time = end_time - start_time
+
+    # Log the query execution time
+    logger.info("Query executed in %s seconds", execution_time)
+    logger.debug("Found %s results!", len(result))
+
+    metadata = {
+        'execution_time': execution_time,
+        'results': len(result),
+        'total_rows': total_count,
+        'extraction_date': extraction_date,
+    }
+    if page_size:
+        metadata['next_cursor'] = _next_cursor(result, page_size)
+
+    return {
+        result_key: result,
+        'metadata': metadata
+    }
+
+def stream_result(rows: Iterator[dict], result_key='br', page_size: Optional[int] = None,
+                  on_complete: Optional[Callable[[int, int, float, bool], None]] = None) -> Iterator[str]:
+    """
+    Streaming counterpart of `collect_result`, yields the JSON document one row at a time.
+
+    The metadata block is emitted last since the row count and the next cursor are only known
+    once the rows are exhausted. `on_complete` is called at the end (or on error) with the number of rows,
+    the number of bytes yielded, the execution time and whether the query failed.
+    """
+    start_time = time.time()
+    payload_bytes = 0
+
+    def completed(count: int, failed: bool = False):
+        if on_complete:
+            on_complete(count, payload_bytes, time.time() - start_time, failed)
+
+    # The first row is read before anything is yielded, so the first `next()` runs the query and errors
+    # (connection, SQL) are raised to the caller before the response is sent.
+    rows = iter(rows)
+    try:
+        first_row = next(rows, None)
+    except Exception:
+        completed(0, failed=True)
+        raise
+
+    chunk = '{' + json.dumps(result_key) + ': ['
+    payload_bytes += len(chunk)
+    yield chunk
+    count = 0
+    extraction_date = None
+    total_count = None
+    last_row = None
+    try:
+        for row in itertools.chain([first_row] if first_row is not None else [], rows):
+            if not count:
+                extraction_date = serialize_value(row.get("EXTRACTION_DATE"))
+                total_count = row.get("TotalCount")
+            last_row = _clean_row(row)
+            chunk = (', ' if count else '') + json.dumps(last_row)
+            payload_bytes += len(chunk)
+            yield chunk
+            count += 1
+    except Exception as e: # pylint: disable=broad-except
+        # Headers are already sent, end the document with an error so the client gets valid JSON
+        logger.error("Streamed query failed after %s rows: %s", count, e)
+        completed(count, failed=True)
+        yield '], "error": ' + json.dumps("Error while streaming the results") + '}'
+        return
+
+    execution_time = time.time() - start_time
+    logger.info("Streamed query executed in %s seconds", execution_time)
+
+    metadata = {
+        'execution_time': execution_time,
+        'results': count,
+        'total_rows': total_count,
+        'extraction_date': extraction_date,
+    }
+    if page_size:
+        metadata['next_cursor'] = _next_cursor([last_row] if last_row else [], page_size, count)
+    chunk = '], "metadata": ' + json.dumps(metadata) + '}'
+    payload_bytes += len(chunk)
+    completed(count)
+    yield chunk
 
 class BRQueryBuilder:
     """Class to build BITS queries."""
@@ -114,16 +422,24 @@ class BRQueryBuilder:
                     active: bool = True,
                     br_filters: Optional[List[BRQueryFilter]] = None,
                     select_fields: Optional[BRSelectFields] = None,
-                    show_all: bool = False) -> str:
+                    show_all: bool = False,
+                    after_cursor: bool = False,
+                    target: str = TARGET_LIVE) -> str:
         """Function that will build the select statement for retreiving BRs
         
         Parameters order for the execute query should be as follow:
         
         1) statuses
         2) all thw other fields value
-        3) limit for TOP()
-        
+        3) the last BR_NMBR of the previous page (if after_cursor is set, see decode_cursor)
+        4) limit for TOP()
+
+        The target can either be the live EDR database (SQL Server) or the local replica of the latest
+        BR snapshot (see bits_replica), the parameters order is the same for both.
         """
+        if target == TARGET_REPLICA:
+            return self._get_replica_query(br_number_count, limit, active, br_filters, select_fields,
+                                           show_all, after_cursor)
 
         query = """
         DECLARE @MAX_DATE DATETIME = (SELECT MAX(PERIOD_END_DATE) FROM [EDR_CARZ].[FCT_DEMAND_BR_SNAPSHOT]);
@@ -271,6 +587,9 @@ class BRQueryBuilder:
                     if br_filter.is_date():
                         # Handle date fields
                         base_where_clause.append(f"CONVERT(DATE, {field_name['db_field']}) {br_filter.operator} %s")
+                    elif br_filter.is_exact():
+                        # Value resolved to an exact database value (i.e; organization names)
+                        base_where_clause.append(f"{field_name['db_field']} {br_filter.operator} %s")
                     else:
                         # Handle other fields, defaulting to LIKE operator since they are mostly strings ...
                         _op = "LIKE" if br_filter.operator != '!=' else "NOT LIKE"
@@ -279,21 +598,86 @@ class BRQueryBuilder:
         if base_where_clause:
             query += "WHERE " + " AND ".join(base_where_clause)
 
-        # Wrap CTE statement
+        # Wrap CTE statement, TotalCount is computed before the cursor is applied so it stays the total of all the pages
         query += """)
-        SELECT {top} *,
-            COUNT(*) OVER() AS TotalCount
-        FROM FilteredResults
-        """.replace("{top}", "TOP(%d)" if limit else "")
+        SELECT * FROM (
+            SELECT *,
+                COUNT(*) OVER() AS TotalCount
+            FROM FilteredResults
+        ) AS CountedResults
+        """
+
+        if after_cursor:
+            # Keyset pagination, results are ordered by BR_NMBR DESC so the next page starts below the last one
+            query += """
+        WHERE BR_NMBR < %s
+        """
 
-        # ORDER BY clause
+        # ORDER BY clause (OFFSET/FETCH instead of TOP so the limit parameter comes after the cursor)
         query += """
         ORDER BY
             BR_NMBR DESC
+        """
+        if limit:
+            query += """
+        OFFSET 0 ROWS FETCH NEXT %d ROWS ONLY
+        """
+        query += """
         OPTION (RECOMPILE, OPTIMIZE FOR (@MAX_DATE UNKNOWN))
         """
         return query
 
+    def _get_replica_query(self, br_number_count: int,
+                           limit: bool,
+                           active: bool,
+                           br_filters: Optional[List[BRQueryFilter]],
+                           select_fields: Optional[BRSelectFields],
+                           show_all: bool,
+                           after_cursor: bool) -> str:
+        """Build the SQLite flavor of the BR query, against the flat replica table.
+
+        The replica table already contains every field of the snapshot (joins, products and OPIs pivot
+        were done when it was built) so the columns are the field names themselves.
+        """
+        columns = ["BR_NMBR", "EXTRACTION_DATE", "BR_ACTIVE_EN", "BR_ACTIVE_FR"]
+        if select_fields and not show_all:
+            columns += [field for field in select_fields.fields if field in BRFields.valid_search_fields]
+        else:
+            columns += list(BRFields.valid_search_fields.keys())
+
+        query = f"SELECT * FROM (SELECT {', '.join(columns)}, COUNT(*) OVER() AS TotalCount FROM {REPLICA_TABLE}"
+
+        where_clause = []
+        if active:
+            where_clause.append("BR_ACTIVE_EN = 'Active'")
+
+        if br_number_count:
+            where_clause.append(f"BR_NMBR IN ({', '.join(['?'] * br_number_count)})")
+
+        if br_filters:
+            for br_filter in br_filters:
+                if br_filter.name in BRFields.valid_search_fields:
+                    if br_filter.is_date():
+                        where_clause.append(f"date({br_filter.name}) {br_filter.operator} ?")
+                    elif br_filter.is_exact():
+                        where_clause.append(f"{br_filter.name} {br_filter.operator} ?")
+                    else:
+                        _op = "LIKE" if br_filter.operator != '!=' else "NOT LIKE"
+                        where_clause.append(f"{br_filter.name} {_op} ?")
+
+        if where_clause:
+            query += " WHERE " + " AND ".join(where_clause)
+
+        # Same as the live query, TotalCount is computed before the cursor is applied
+        query += ")"
+        if after_cursor:
+            query += " WHERE BR_NMBR < ?"
+
+        query += " ORDER BY BR_NMBR DESC"
+        if limit:
+            query += " LIMIT ?"
+        return query
+
 def _data_serializer(obj):
     """JSON serializer for datetime and decimal objects."""
     if isinstance(obj, datetime):
@@ -301,3 +685,37 @@ def _data_serializer(obj):
     if isinstance(obj, Decimal):
         return float(obj)
     raise TypeError(f"Type {type(obj)} not serializable")
+
+def serialize_value(value):
+    """Convert a single column value to something JSON can handle."""
+    if isinstance(value, (datetime, Decimal)):
+        return _data_serializer(value)
+    return value
+
+def _clean_row(row: dict) -> dict:
+    """Remove the bookkeeping columns (TotalCount, EXTRACTION_DATE, etc.) and serialize the values."""
+    return {k: serialize_value(v) for k, v in row.items() if k not in _HIDDEN_COLUMNS}
+
+def _next_cursor(rows: list, page_size: int, count: Optional[int] = None) -> Optional[str]:
+    """Return the cursor of the next page if the current page is full, None otherwise."""
+    count = len(rows) if count is None else count
+    if rows and count >= page_size and rows[-1].get(CURSOR_FIELD) is not None:
+        return encode_cursor(rows[-1][CURSOR_FIELD])
+    return None
+
+def encode_cursor(br_number) -> str:
+    """Encode the last BR_NMBR of a page into an opaque cursor token."""
+    payload = json.dumps({"after": int(br_number)}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decode_cursor(token: str) -> int:
+    """Decode a cursor token back into the BR_NMBR the next page starts after.
+
+    Raises a ValueError if the token is invalid.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return int(payload["after"])
+    except (binascii.Error, UnicodeError, json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
@@ -0,0 +1,124 @@
+import json
+import threading
+
+import pytest
+
+from tools.bits.bits_code_tables import CodeTable, CodeTableCache
+from tools.bits.bits_org_index import OrganizationIndex
+
+
+class FakeSource:
+    """Returns the rows of the table named in the query, raises when `fail` is set."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.fail = False
+        self.queries = []
+
+    def iter_rows(self, query, *args, **kwargs):
+        self.queries.append(query)
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        return iter(self.tables[query])
+
+
+@pytest.fixture
+def statuses_file(tmp_path):
+    path = tmp_path / "statuses.json"
+    path.write_text(json.dumps([{"STATUS_ID": "Draft", "NAME_EN": "Draft", "PHASE_EN": "Not started"}]))
+    return str(path)
+
+
+@pytest.fixture
+def source():
+    return FakeSource({
+        "statuses": [
+            {"STATUS_ID": "Draft", "NAME_EN": "Draft", "PHASE_EN": "Not started"},
+            {"STATUS_ID": "Closed", "NAME_EN": "Closed", "PHASE_EN": "Closed"},
+        ],
+        "organizations": [{"GC_ORG_NAME_EN": "Parks Canada", "ORG_ACRN_EN": "PC"}],
+    })
+
+
+@pytest.fixture
+def cache(source, statuses_file):
+    return CodeTableCache(source, tables=(
+        CodeTable("statuses", "statuses", statuses_file),
+        CodeTable("organizations", "organizations"),
+    ))
+
+
+def test_warm_start_from_file(cache, source):
+    assert cache.is_loaded("statuses")
+    assert not cache.is_loaded("organizations")
+    assert [status["STATUS_ID"] for status in cache.rows("statuses")] == ["Draft"]
+    assert not source.queries
+
+
+def test_refresh_swaps_tables(cache):
+    cache.refresh()
+
+    assert [status["STATUS_ID"] for status in cache.rows("statuses")] == ["Draft", "Closed"]
+    assert cache.rows("organizations")[0]["ORG_ACRN_EN"] == "PC"
+
+
+def test_failed_refresh_keeps_current_table(cache, source):
+    source.fail = True
+    cache.refresh()
+
+    assert [status["STATUS_ID"] for status in cache.rows("statuses")] == ["Draft"]
+    assert cache.rows("organizations") == []
+
+
+def test_reads_never_query_the_database(cache, source):
+    assert cache.rows("organizations") == []
+    assert cache.loaded_rows("organizations") is None
+    assert not source.queries
+
+
+def test_background_refresh_starts_on_first_read(source, statuses_file):
+    cache = CodeTableCache(source, tables=(CodeTable("organizations", "organizations"),), refresh_interval=3600)
+    assert cache._thread is None
+
+    refreshed = threading.Event()
+    cache.subscribe("organizations", refreshed.set)
+    cache.rows("organizations")
+
+    assert refreshed.wait(5)
+    assert cache.rows("organizations") == source.tables["organizations"]
+
+
+def test_listeners_are_called_on_refresh(cache, source):
+    refreshed = []
+    cache.subscribe("organizations", lambda: refreshed.append(cache.loaded_rows("organizations")))
+
+    cache.refresh("organizations")
+
+    assert refreshed == [source.tables["organizations"]]
+
+
+def test_organization_index_follows_the_code_table(cache, source):
+    index = OrganizationIndex(lambda: cache.loaded_rows("organizations") or [])
+    cache.subscribe("organizations", index.refresh)
+
+    # Not loaded yet, the index does not query the database itself
+    assert index.search("PC") == []
+    assert not source.queries
+
+    cache.refresh("organizations")
+    assert index.search("PC")[0]["GC_ORG_NAME_EN"] == "Parks Canada"
+
+    source.tables["organizations"] = [{"GC_ORG_NAME_EN": "Shared Services Canada", "ORG_ACRN_EN": "SSC"}]
+    cache.refresh("organizations")
+
+    assert index.search("SSC")[0]["GC_ORG_NAME_EN"] == "Shared Services Canada"
+    assert index.search("PC") == []
+
+
+def test_listeners_can_read_the_tables(cache, source):
+    calls = []
+    cache.subscribe("organizations", lambda: calls.append(cache.rows("organizations")))
+
+    # Listeners read the tables once the refresh lock is released
+    cache.refresh("organizations")
+    assert calls == [source.tables["organizations"]]
@@ -0,0 +1,56 @@
+import pytest
+
+from tools.bits import bits_functions
+
+
+class FakeConnection:
+    """Answers BR lookups from memory, one BR per requested number."""
+
+    def __init__(self):
+        self.calls = []
+
+    def execute_query(self, query, *args, page_size=None, query_label=None):
+        self.calls.append(args)
+        brs = [{"BR_NMBR": int(br_number)} for br_number in sorted(args, key=int, reverse=True)]
+        return {"br": brs, "metadata": {"execution_time": 0.1, "results": len(brs),
+                                        "total_rows": len(brs), "extraction_date": "2025-01-31T00:00:00"}}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeConnection()
+    monkeypatch.setattr(bits_functions, "db", db)
+    monkeypatch.setattr(bits_functions, "replica", None)
+    monkeypatch.setattr(bits_functions, "BR_CHUNK_SIZE", 3)
+    return db
+
+
+def test_small_lists_use_a_single_query(db):
+    result = bits_functions.get_br_information(["1", "2", "3"])
+
+    assert len(db.calls) == 1
+    assert "chunks" not in result["metadata"]
+
+
+def test_large_lists_are_chunked_and_merged(db):
+    result = bits_functions.get_br_information(["4", "10", "2", "7", "1", "9", "3"])
+
+    assert sorted(db.calls) == [("3",), ("4", "10", "2"), ("7", "1", "9")]
+    assert [br["BR_NMBR"] for br in result["br"]] == [10, 9, 7, 4, 3, 2, 1]
+    assert result["metadata"]["results"] == 7
+    assert [chunk["size"] for chunk in result["metadata"]["chunks"]] == [3, 3, 1]
+    assert result["metadata"]["extraction_date"] == "2025-01-31T00:00:00"
+
+
+def test_paged_requests_are_not_chunked(db):
+    bits_functions.get_br_information(["1", "2", "3", "4", "5"], page_size=10)
+
+    assert len(db.calls) == 1
+
+
+def test_duplicates_are_looked_up_once(db):
+    result = bits_functions.get_br_information(["1", "2", "3", "1", "4", "2"])
+
+    assert sorted(number for call in db.calls for number in call) == ["1", "2", "3", "4"]
+    assert [br["BR_NMBR"] for br in result["br"]] == [4, 3, 2, 1]
+    assert result["metadata"]["results"] == 4
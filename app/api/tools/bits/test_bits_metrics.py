@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from tools.bits.bits_metrics import QueryMetrics, query_metrics, query_shape
+from tools.bits.bits_utils import SNAPSHOT_DATE_QUERY, DatabaseConnection
+
+
+class FakeConnection(DatabaseConnection):
+    """DatabaseConnection that answers one row per query parameter."""
+
+    def __init__(self, **kwargs):
+        super().__init__("server", "user", "password", "db", **kwargs)
+
+    def iter_rows(self, query, *args, batch_size=500):
+        if query == SNAPSHOT_DATE_QUERY:
+            yield {"PERIOD_END_DATE": "2025-01-31T00:00:00"}
+            return
+        if "FAIL" in query:
+            raise ConnectionError("database unavailable")
+        for br_number in args:
+            yield {"BR_NMBR": br_number, "BR_SHORT_TITLE": f"BR {br_number}"}
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    query_metrics.reset()
+    yield
+    query_metrics.reset()
+
+
+def test_in_lists_of_any_length_have_the_same_shape():
+    short, _ = query_shape("SELECT * FROM br WHERE BR_NMBR IN (%s)")
+    long, text = query_shape("SELECT *\n  FROM br WHERE BR_NMBR IN (%s, %s,%s)")
+
+    assert short == long
+    assert text == "SELECT * FROM br WHERE BR_NMBR IN (...)"
+    assert query_shape("SELECT * FROM br WHERE BR_NMBR IN (?, ?)")[1].endswith("IN (...)")
+
+
+def test_latency_histogram_and_percentiles():
+    metrics = QueryMetrics(slow_query_ms=10000)
+    for execution_time in (0.001, 0.02, 0.02, 0.3, 12):
+        metrics.record("SELECT 1", (), execution_time, rows=2, payload_bytes=10)
+
+    stats = next(iter(metrics.snapshot()["shapes"].values()))
+
+    assert stats["count"] == 5
+    assert stats["latency_buckets_ms"]["5"] == 1
+    assert stats["latency_buckets_ms"]["25"] == 2
+    assert stats["latency_buckets_ms"]["500"] == 1
+    assert stats["latency_buckets_ms"]["+inf"] == 1
+    assert stats["p50_ms"] == 25
+    assert stats["p95_ms"] == 12000
+    assert stats["rows"] == 10 and stats["payload_bytes"] == 50
+
+
+def test_slow_query_log_keeps_types_not_values():
+    metrics = QueryMetrics(slow_query_ms=100, slow_log_size=2)
+    metrics.record("SELECT 1", ("secret title", 12345), 0.05)
+    for _ in range(3):
+        metrics.record("SELECT 2", ("secret title", 12345), 0.5, label="search")
+
+    slow_queries = metrics.snapshot()["slow_queries"]
+
+    assert len(slow_queries) == 2
+    assert slow_queries[0]["param_types"] == ["str", "int"]
+    assert slow_queries[0]["label"] == "search"
+    assert "secret title" not in json.dumps(slow_queries)
+
+
+def test_shapes_are_bounded():
+    metrics = QueryMetrics(max_shapes=2)
+    for number in range(4):
+        metrics.record(f"SELECT {number}", (), 0.001)
+
+    shapes = metrics.snapshot()["shapes"]
+
+    assert len(shapes) == 3
+    assert shapes["other"]["count"] == 2
+
+
+def test_execute_query_records_metrics():
+    db = FakeConnection(cache_size=4, snapshot_ttl=300)
+
+    db.execute_query("SELECT BR", 1, 2, query_label="get_br_information")
+    db.execute_query("SELECT BR", 1, 2, query_label="get_br_information")
+    with pytest.raises(ConnectionError):
+        db.execute_query("SELECT FAIL", 1)
+
+    shapes = {stats["query"]: stats for stats in query_metrics.snapshot()["shapes"].values()}
+    stats = shapes["SELECT BR"]
+    assert stats["label"] == "get_br_information"
+    assert stats["count"] == 1
+    assert stats["cache_hits"] == 1
+    assert stats["rows"] == 2
+    # Only the streamed queries measure their payload
+    assert stats["payload_bytes"] == 0
+    assert shapes["SELECT FAIL"]["errors"] == 1
+
+
+def test_stream_query_records_metrics_once_sent():
+    db = FakeConnection()
+
+    chunks = db.stream_query("SELECT BR", 1, 2, 3, query_label="export")
+    first_chunk = next(chunks)
+    assert query_metrics.snapshot()["shapes"] == {}
+    document = first_chunk + "".join(chunks)
+
+    stats = next(iter(query_metrics.snapshot()["shapes"].values()))
+    assert stats["count"] == 1
+    assert stats["rows"] == 3
+    assert stats["label"] == "export"
+    assert stats["payload_bytes"] == len(document)
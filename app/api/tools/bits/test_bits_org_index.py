@@ -0,0 +1,119 @@
+import pytest
+
+from tools.bits import bits_functions
+from tools.bits.bits_models import BRQuery, BRSelectFields
+from tools.bits.bits_org_index import OrganizationIndex
+
+ORGANIZATIONS = [
+    {"GC_ORG_NAME_EN": "Parks Canada", "GC_ORG_NAME_FR": "Parcs Canada", "ORG_SHORT_NAME": "Parks",
+     "ORG_ACRN_EN": "PC", "ORG_ACRN_FR": "PC", "ORG_ACRN_BIL": None},
+    {"GC_ORG_NAME_EN": "Shared Services Canada", "GC_ORG_NAME_FR": "Services partagés Canada",
+     "ORG_SHORT_NAME": "Shared Services", "ORG_ACRN_EN": "SSC", "ORG_ACRN_FR": "SPC", "ORG_ACRN_BIL": "SSC-SPC"},
+    {"GC_ORG_NAME_EN": "Employment and Social Development Canada",
+     "GC_ORG_NAME_FR": "Emploi et Développement social Canada", "ORG_SHORT_NAME": "Employment",
+     "ORG_ACRN_EN": "ESDC", "ORG_ACRN_FR": "EDSC", "ORG_ACRN_BIL": None},
+]
+
+
+@pytest.fixture
+def index():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return ORGANIZATIONS
+
+    index = OrganizationIndex(loader)
+    index.loads = loads
+    return index
+
+
+def test_acronyms_match_exactly(index):
+    assert index.search("spc")[0]["GC_ORG_NAME_EN"] == "Shared Services Canada"
+    assert index.search("SSC-SPC")[0]["score"] == 1.0
+    assert index.search("EDSC")[0]["GC_ORG_NAME_EN"] == "Employment and Social Development Canada"
+
+
+def test_names_match_fuzzily_in_both_languages(index):
+    assert index.search("services partages")[0]["GC_ORG_NAME_EN"] == "Shared Services Canada"
+    assert index.search("employment social devlopment")[0]["ORG_ACRN_EN"] == "ESDC"
+    assert index.search("parcs")[0]["GC_ORG_NAME_FR"] == "Parcs Canada"
+
+
+def test_results_are_compact_and_limited(index):
+    results = index.search("canada", limit=2)
+
+    assert len(results) == 2
+    assert set(results[0]) == {"GC_ORG_NAME_EN", "GC_ORG_NAME_FR", "ORG_ACRN_EN", "ORG_ACRN_FR", "score"}
+
+
+def test_index_is_loaded_once(index):
+    index.search("PC")
+    index.canonical_name("Parks Canada")
+
+    assert len(index.loads) == 1
+
+
+def test_canonical_name(index):
+    assert index.canonical_name("services partages canada", language="FR") == "Services partagés Canada"
+    assert index.canonical_name("Parks") is None
+
+
+def test_canonical_name_uses_the_requested_language(index):
+    assert index.canonical_name("Parcs Canada", language="EN") == "Parks Canada"
+    assert index.canonical_name("parks canada", language="FR") == "Parcs Canada"
+
+
+def test_failed_load_is_not_retried_on_every_lookup():
+    attempts = []
+
+    def loader():
+        attempts.append(1)
+        raise ConnectionError("database unavailable")
+
+    index = OrganizationIndex(loader, retry_after=60)
+
+    assert index.search("PC") == []
+    assert index.canonical_name("Parks Canada") is None
+    assert len(attempts) == 1
+
+    index.retry_after = 0
+    index.search("PC")
+    assert len(attempts) == 2
+
+
+def test_search_uses_exact_match_for_known_organizations(index, monkeypatch):
+    monkeypatch.setattr(bits_functions, "org_index", index)
+    user_query = BRQuery.model_validate({"query_filters": [
+        {"name": "RPT_GC_ORG_NAME_EN", "value": "parks canada", "operator": "="},
+        {"name": "BR_SHORT_TITLE", "value": "network", "operator": "="},
+    ]})
+
+    query_args, params, _ = bits_functions.prepare_search_query(user_query, BRSelectFields(fields=["BR_SHORT_TITLE"]))
+    query = bits_functions.query_builder.get_br_query(**query_args)
+
+    assert params == ["Parks Canada", "%network%", 750]
+    assert "br.RPT_GC_ORG_NAME_EN = %s" in query
+    assert "br.BR_SHORT_TITLE LIKE %s" in query
+
+
+def test_french_name_on_english_field_is_translated(index, monkeypatch):
+    monkeypatch.setattr(bits_functions, "org_index", index)
+    user_query = BRQuery.model_validate({"query_filters": [
+        {"name": "RPT_GC_ORG_NAME_EN", "value": "Parcs Canada", "operator": "="},
+    ]})
+
+    _, params, _ = bits_functions.prepare_search_query(user_query, BRSelectFields(fields=["BR_SHORT_TITLE"]))
+
+    assert params == ["Parks Canada", 750]
+
+
+def test_unknown_organizations_keep_a_like_filter(index, monkeypatch):
+    monkeypatch.setattr(bits_functions, "org_index", index)
+    user_query = BRQuery.model_validate({"query_filters": [
+        {"name": "RPT_GC_ORG_NAME_EN", "value": "Parks", "operator": "="},
+    ]})
+
+    _, params, _ = bits_functions.prepare_search_query(user_query, BRSelectFields(fields=["BR_SHORT_TITLE"]))
+
+    assert params == ["%Parks%", 750]
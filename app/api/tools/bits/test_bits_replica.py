@@ -0,0 +1,177 @@
+import datetime
+import sqlite3
+
+import pytest
+
+from tools.bits.bits_models import BRQueryFilter, BRSelectFields
+from tools.bits.bits_replica import BRSnapshotReplica
+from tools.bits.bits_utils import TARGET_REPLICA, BRQueryBuilder, decode_cursor
+
+
+class FakeSource:
+    """Stands in for DatabaseConnection, returns the rows of the current snapshot."""
+
+    def __init__(self, rows, snapshot_date="2025-01-31T00:00:00"):
+        self.rows = rows
+        self.snapshot_date = snapshot_date
+        self.loads = 0
+
+    def get_snapshot_date(self):
+        return self.snapshot_date
+
+    def iter_rows(self, query, *args, **kwargs):
+        self.loads += 1
+        yield from (dict(row) for row in self.rows)
+
+
+def _br(number, status="Active", title=None, impl_date=None):
+    return {
+        "BR_NMBR": number,
+        "EXTRACTION_DATE": datetime.datetime(2025, 1, 31),
+        "BR_ACTIVE_EN": status,
+        "BR_ACTIVE_FR": "Actif" if status == "Active" else "Inactif",
+        "BR_SHORT_TITLE": title or f"BR {number}",
+        "RPT_GC_ORG_NAME_EN": "Shared Services Canada",
+        "REQST_IMPL_DATE": impl_date,
+    }
+
+
+@pytest.fixture
+def source():
+    return FakeSource([
+        _br(100, title="Network upgrade", impl_date=datetime.datetime(2025, 3, 1)),
+        _br(200, status="Inactive", title="Old request"),
+        _br(300, title="Cloud network", impl_date=datetime.datetime(2025, 6, 1)),
+    ])
+
+
+@pytest.fixture
+def replica(tmp_path, source):
+    replica = BRSnapshotReplica(str(tmp_path / "bits.db"), source, BRQueryBuilder())
+    replica.refresh()
+    return replica
+
+
+def _query(**kwargs):
+    return BRQueryBuilder().get_br_query(**kwargs, target=TARGET_REPLICA)
+
+
+def test_refresh_builds_the_replica(replica, source):
+    assert replica.is_ready()
+    assert replica.snapshot_date() == source.snapshot_date
+
+    result = replica.execute_query(_query(br_number_count=2, active=False, show_all=True), 100, 300)
+
+    assert [br["BR_NMBR"] for br in result["br"]] == [300, 100]
+    assert result["br"][1]["REQST_IMPL_DATE"] == "2025-03-01T00:00:00"
+    assert result["metadata"]["total_rows"] == 2
+    assert result["metadata"]["source"] == "replica"
+
+
+def test_not_ready_before_first_refresh(tmp_path, source):
+    replica = BRSnapshotReplica(str(tmp_path / "bits.db"), source, BRQueryBuilder())
+
+    assert not replica.is_ready()
+
+
+def test_search_filters_and_active(replica):
+    filters = [BRQueryFilter(name="BR_SHORT_TITLE", value="%network%", operator="=")]
+    select_fields = BRSelectFields(fields=["BR_SHORT_TITLE"])
+
+    result = replica.execute_query(_query(br_filters=filters, select_fields=select_fields), "%network%")
+
+    assert [br["BR_NMBR"] for br in result["br"]] == [300, 100]
+    assert "RPT_GC_ORG_NAME_EN" not in result["br"][0]
+
+    result = replica.execute_query(_query(active=False, show_all=True))
+    assert len(result["br"]) == 3
+
+
+def test_date_filter(replica):
+    filters = [BRQueryFilter(name="REQST_IMPL_DATE", value="2025-04-01", operator=">")]
+
+    result = replica.execute_query(_query(br_filters=filters), "2025-04-01")
+
+    assert [br["BR_NMBR"] for br in result["br"]] == [300]
+
+
+def test_keyset_pagination(replica):
+    query = _query(limit=True, active=False, show_all=True)
+
+    first_page = replica.execute_query(query, 2, page_size=2)
+    assert [br["BR_NMBR"] for br in first_page["br"]] == [300, 200]
+    cursor = first_page["metadata"]["next_cursor"]
+    assert decode_cursor(cursor) == 200
+
+    next_query = _query(limit=True, active=False, show_all=True, after_cursor=True)
+    second_page = replica.execute_query(next_query, decode_cursor(cursor), 2, page_size=2)
+    assert [br["BR_NMBR"] for br in second_page["br"]] == [100]
+    # The total is the one of the whole query, not of the rows after the cursor
+    assert second_page["metadata"]["total_rows"] == 3
+    assert second_page["metadata"]["next_cursor"] is None
+
+
+def test_refresh_is_a_noop_when_snapshot_is_unchanged(replica, source):
+    assert replica.refresh() is False
+    assert source.loads == 1
+
+
+def test_refresh_applies_changes_of_a_new_snapshot(replica, source):
+    source.rows = [
+        _br(100, status="Inactive", title="Network upgrade"),
+        _br(300, title="Cloud network", impl_date=datetime.datetime(2025, 6, 1)),
+        _br(400, title="New request"),
+    ]
+    source.snapshot_date = "2025-02-28T00:00:00"
+
+    assert replica.refresh() is True
+
+    result = replica.execute_query(_query(active=False, show_all=True))
+    assert [br["BR_NMBR"] for br in result["br"]] == [400, 300, 100]
+    active = replica.execute_query(_query())
+    assert [br["BR_NMBR"] for br in active["br"]] == [400, 300]
+    assert replica.snapshot_date() == "2025-02-28T00:00:00"
+
+
+def test_stream_query_matches_execute_query(replica):
+    query = _query(active=False, show_all=True)
+
+    streamed = "".join(replica.stream_query(query))
+
+    assert '"BR_NMBR": 300' in streamed
+    assert streamed.count('"BR_NMBR"') == 3
+
+
+def test_shared_file_is_loaded_once(tmp_path, source):
+    path = str(tmp_path / "bits.db")
+    first = BRSnapshotReplica(path, source, BRQueryBuilder())
+    other_source = FakeSource(source.rows, source.snapshot_date)
+    second = BRSnapshotReplica(path, other_source, BRQueryBuilder())
+
+    assert first.refresh() is True
+    # The other process sees the snapshot is already loaded once it holds the write lock
+    assert second.refresh() is False
+    assert other_source.loads == 0
+    assert second.is_ready()
+
+
+def test_refresh_is_skipped_while_another_process_writes(tmp_path, source):
+    path = str(tmp_path / "bits.db")
+    replica = BRSnapshotReplica(path, source, BRQueryBuilder())
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    replica._connect = lambda: sqlite3.connect(path, timeout=0.1)  # pylint: disable=protected-access
+    try:
+        assert replica.refresh() is False
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    assert source.loads == 0
+    assert not replica.is_ready()
+
+
+def test_new_instance_is_ready_from_existing_file(replica, source, tmp_path):
+    reopened = BRSnapshotReplica(replica.path, source, BRQueryBuilder())
+
+    assert reopened.is_ready()
+    assert reopened.snapshot_date() == source.snapshot_date
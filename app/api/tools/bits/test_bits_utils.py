@@ -0,0 +1,297 @@
+import datetime
+import json
+import time
+
+import pymssql
+import pytest
+
+from tools.bits.bits_models import BRQueryFilter
+from tools.bits.bits_utils import (SNAPSHOT_DATE_QUERY, BRQueryBuilder, DatabaseConnection, collect_result,
+                                   decode_cursor, encode_cursor, stream_result)
+
+
+class FakeConnection(DatabaseConnection):
+    """DatabaseConnection that answers from memory and counts the queries it runs."""
+
+    def __init__(self, **kwargs):
+        super().__init__("server", "user", "password", "db", **kwargs)
+        self.snapshot = "2025-01-31T00:00:00"
+        self.queries = []
+
+    def iter_rows(self, query, *args, batch_size=500):
+        self.queries.append(query)
+        if query == SNAPSHOT_DATE_QUERY:
+            yield {"PERIOD_END_DATE": self.snapshot}
+            return
+        for br_number in args:
+            yield {"BR_NMBR": br_number, "BR_SHORT_TITLE": f"BR {br_number}", "TotalCount": len(args)}
+
+    def count(self, query="SELECT"):
+        return self.queries.count(query)
+
+
+@pytest.fixture
+def db():
+    return FakeConnection(cache_size=2, snapshot_ttl=300)
+
+
+def test_cache_disabled_by_default():
+    db = FakeConnection()
+
+    db.execute_query("SELECT", 1)
+    result = db.execute_query("SELECT", 1)
+
+    assert db.count() == 2
+    assert db.count(SNAPSHOT_DATE_QUERY) == 0
+    assert "cache_hit" not in result["metadata"]
+
+
+def test_repeat_query_is_served_from_cache(db):
+    first = db.execute_query("SELECT", 1, 2)
+    second = db.execute_query("SELECT", 1, 2)
+
+    assert db.count() == 1
+    assert db.count(SNAPSHOT_DATE_QUERY) == 1
+    assert first["metadata"]["cache_hit"] is False
+    assert second["metadata"]["cache_hit"] is True
+    assert second["br"] == first["br"]
+
+
+def test_params_and_result_key_are_part_of_the_key(db):
+    db.execute_query("SELECT", 1)
+    db.execute_query("SELECT", 2)
+    db.execute_query("SELECT", 2, result_key="other")
+
+    assert db.count() == 3
+
+
+def test_callers_cannot_alter_cached_results(db):
+    first = db.execute_query("SELECT", 1)
+    first["brquery"] = {"query_filters": []}
+    first["br"].append({"BR_NMBR": 99})
+
+    second = db.execute_query("SELECT", 1)
+
+    assert "brquery" not in second
+    assert len(second["br"]) == 1
+
+
+def test_cache_is_bounded(db):
+    db.execute_query("SELECT", 1)
+    db.execute_query("SELECT", 2)
+    db.execute_query("SELECT", 3)
+    db.execute_query("SELECT", 1)
+
+    assert db.count() == 4
+
+
+def test_new_snapshot_invalidates_the_cache(db):
+    db.execute_query("SELECT", 1)
+    db.snapshot = "2025-02-28T00:00:00"
+
+    # Still within the probe TTL, the previous snapshot is assumed
+    db.execute_query("SELECT", 1)
+    assert db.count() == 1
+
+    db.snapshot_ttl = 0
+    result = db.execute_query("SELECT", 1)
+
+    assert db.count() == 2
+    assert result["metadata"]["cache_hit"] is False
+    assert db.current_snapshot_date() == "2025-02-28T00:00:00"
+
+
+class FakePymssqlConnection:
+    """Minimal pymssql connection, returns one row per query parameter."""
+
+    def __init__(self):
+        self.closed = False
+        self.dead = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, args):
+        if self.dead:
+            raise pymssql.OperationalError("connection was dropped")
+        self.rows = [(arg,) for arg in args]
+        self.description = [("BR_NMBR",)]
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pooled_db(monkeypatch):
+    db = DatabaseConnection("server", "user", "password", "db", pool_size=1)
+    connections = []
+
+    def get_conn():
+        connections.append(FakePymssqlConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(db, "get_conn", get_conn)
+    return db, connections
+
+
+def test_connections_are_reused(pooled_db):
+    db, connections = pooled_db
+
+    db.execute_query("SELECT", 1)
+    db.execute_query("SELECT", 2)
+
+    assert len(connections) == 1
+    assert not connections[0].closed
+
+
+def test_partially_read_connections_are_discarded(pooled_db):
+    db, connections = pooled_db
+
+    rows = db.iter_rows("SELECT", 1, 2, batch_size=1)
+    next(rows)
+    rows.close()
+    db.execute_query("SELECT", 1)
+
+    assert len(connections) == 2
+    assert connections[0].closed
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(12345)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == 12345
+
+
+@pytest.mark.parametrize("token", ["", "not-a-cursor", encode_cursor(1)[:-2], "eyJiZWZvcmUiOiAxfQ"])
+def test_invalid_cursors_raise_value_error(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+def _rows():
+    return [
+        {"BR_NMBR": number, "EXTRACTION_DATE": datetime.datetime(2025, 1, 31), "TotalCount": 10,
+         "BR_ACTIVE_EN": "Active", "REQST_IMPL_DATE": datetime.datetime(2025, 3, 1)}
+        for number in (300, 200, 100)
+    ]
+
+
+@pytest.mark.parametrize("page_size", [None, 3, 5])
+def test_stream_result_matches_collect_result(page_size):
+    collected = collect_result(iter(_rows()), page_size=page_size)
+    streamed = json.loads("".join(stream_result(iter(_rows()), page_size=page_size)))
+
+    collected["metadata"].pop("execution_time")
+    streamed["metadata"].pop("execution_time")
+    assert streamed == collected
+    assert collected["br"][0] == {"BR_NMBR": 300, "REQST_IMPL_DATE": "2025-03-01T00:00:00"}
+    assert collected["metadata"]["total_rows"] == 10
+    assert ("next_cursor" in collected["metadata"]) == bool(page_size)
+
+
+def test_full_page_returns_next_cursor():
+    result = collect_result(iter(_rows()), page_size=3)
+
+    assert decode_cursor(result["metadata"]["next_cursor"]) == 100
+    assert collect_result(iter(_rows()), page_size=5)["metadata"]["next_cursor"] is None
+
+
+def test_stream_result_runs_the_query_on_first_chunk():
+    def failing_rows():
+        raise ConnectionError("database unavailable")
+        yield  # pylint: disable=unreachable
+
+    chunks = stream_result(failing_rows())
+
+    with pytest.raises(ConnectionError):
+        next(chunks)
+
+
+def test_stream_result_ends_with_an_error_when_the_query_fails_midway():
+    def failing_rows():
+        yield from _rows()[:2]
+        raise ConnectionError("connection lost")
+
+    document = json.loads("".join(stream_result(failing_rows())))
+
+    assert len(document["br"]) == 2
+    assert "error" in document
+    assert "metadata" not in document
+
+
+def test_live_query_applies_the_cursor_after_the_total_count():
+    filters = [BRQueryFilter(name="BR_SHORT_TITLE", value="%network%", operator="=")]
+
+    query = BRQueryBuilder().get_br_query(limit=True, br_filters=filters, after_cursor=True)
+
+    total_count = query.index("COUNT(*) OVER() AS TotalCount")
+    cursor = query.index("WHERE BR_NMBR < %s")
+    limit = query.index("FETCH NEXT %d ROWS ONLY")
+    assert query.index("br.BR_SHORT_TITLE LIKE %s") < total_count < cursor < limit
+    assert "TOP(" not in query
+
+
+def test_live_query_without_cursor_or_limit():
+    query = BRQueryBuilder().get_br_query(br_number_count=2, active=False, show_all=True)
+
+    assert "br.BR_NMBR IN (%s, %s)" in query
+    assert "BR_NMBR < %s" not in query
+    assert "FETCH NEXT" not in query
+
+
+def test_cache_is_bounded_by_rows():
+    db = FakeConnection(cache_size=10, cache_max_rows=8, snapshot_ttl=300)
+
+    # Larger than a quarter of the budget, never cached
+    db.execute_query("SELECT", 1, 2, 3)
+    assert db.execute_query("SELECT", 1, 2, 3)["metadata"]["cache_hit"] is False
+
+    for first in range(1, 10, 2):
+        db.execute_query("SELECT", first, first + 1)
+    # 5 results of 2 rows, the oldest one was evicted to stay within 8 rows
+    assert db.execute_query("SELECT", 9, 10)["metadata"]["cache_hit"] is True
+    assert db.execute_query("SELECT", 1, 2)["metadata"]["cache_hit"] is False
+
+
+def test_dropped_pooled_connection_is_retried_on_a_new_one(pooled_db):
+    db, connections = pooled_db
+    db.execute_query("SELECT", 1)
+    connections[0].dead = True
+
+    result = db.execute_query("SELECT", 2)
+
+    assert result["br"] == [{"BR_NMBR": 2}]
+    assert len(connections) == 2
+    assert connections[0].closed
+
+
+def test_idle_connections_expire(pooled_db):
+    db, connections = pooled_db
+    db.pool_max_idle = 0
+    db.execute_query("SELECT", 1)
+    time.sleep(0.01)
+
+    db.execute_query("SELECT", 2)
+
+    assert len(connections) == 2
+    assert connections[0].closed
+
+
+def test_new_connection_errors_are_not_retried(pooled_db):
+    db, connections = pooled_db
+
+    def get_dead_conn():
+        connections.append(FakePymssqlConnection())
+        connections[-1].dead = True
+        return connections[-1]
+
+    db.get_conn = get_dead_conn
+
+    with pytest.raises(pymssql.OperationalError):
+        db.execute_query("SELECT", 1)
+    assert len(connections) == 1
@@ -0,0 +1,161 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+__all__ = ["GedsClient", "get_geds_client", "to_profile"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+_api_endpoint: str = os.getenv("GEDS_API", "https://api.geds-sage.gc.ca/gapi/v2")
+_api_token = os.getenv("GEDS_API_TOKEN")
+_domain = os.getenv("GEDS_DOMAIN", "https://geds-sage.gc.ca")
+
+_TIMEOUT_SECS = float(os.getenv("GEDS_TIMEOUT_SECS", "10"))
+_CACHE_TTL_SECS = float(os.getenv("GEDS_CACHE_TTL_SECS", "300"))
+_CACHE_SIZE = int(os.getenv("GEDS_CACHE_SIZE", "256"))
+_POOL_SIZE = int(os.getenv("GEDS_POOL_SIZE", "10"))
+# Names looked up at the same time by a batch search
+_BATCH_WORKERS = int(os.getenv("GEDS_BATCH_WORKERS", "4"))
+
+# Query parameters of every employee search, only searchValue changes
+_SEARCH_PARAMS = {
+    "searchField": 9,
+    "searchCriterion": 2,
+    "searchScope": "sub",
+    "searchFilter": 2,
+    "maxEntries": 5,
+    "pageNumber": 1,
+    "returnOrganizationInformation": "yes",
+}
+
+class GedsClient:
+    """
+    Client of the GEDS employees API.
+
+    Requests go through a single `requests.Session` (keep-alive, up to `pool_size` connections) and are bounded
+    by `timeout` seconds. Responses are parsed once and name searches are cached for `cache_ttl` seconds
+    (up to `cache_size` names), so asking about the same person again during a conversation costs nothing.
+    """
+
+    def __init__(self, endpoint: str = _api_endpoint, token: Optional[str] = _api_token,
+                 timeout: float = _TIMEOUT_SECS, cache_ttl: float = _CACHE_TTL_SECS, cache_size: int = _CACHE_SIZE,
+                 pool_size: int = _POOL_SIZE, batch_workers: int = _BATCH_WORKERS):
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.session = requests.Session()
+        self.session.headers.update({"X-3scale-proxy-secret-token": token or "", "Accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=batch_workers, thread_name_prefix="geds-batch")
+
+    def search(self, search_value: str) -> Optional[list[dict]]:
+        """
+        Search the employees matching `search_value` (a "lastname,firstname" or a phone number).
+
+        Returns the parsed results, or None when GEDS could not be reached or did not answer with a 200.
+        """
+        try:
+            response = self.session.get(f"{self.endpoint}/employees", timeout=self.timeout,
+                                        params={"searchValue": search_value, **_SEARCH_PARAMS})
+        except requests.RequestException as e:
+            logger.error("GEDS request failed: %s", e)
+            return None
+        if response.status_code != 200:
+            logger.debug("Unable to get any info: %s", response.reason)
+            return None
+        try:
+            results = response.json()
+        except ValueError as e:
+            logger.error("GEDS returned an invalid response: %s", e)
+            return None
+        return results if isinstance(results, list) else [results]
+
+    def find_employees(self, lastname: str, firstname: str = "") -> Optional[list[dict]]:
+        """Same as `search` for a name, cached by (lastname, firstname) whatever their case."""
+        lastname, firstname = lastname.strip(), firstname.strip()
+        key = (lastname.lower(), firstname.lower())
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        search_value = f"{lastname},{firstname}" if firstname else lastname
+        results = self.search(search_value)
+        if results is None:
+            return None  # errors are not cached, the next call tries again
+
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic(), results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
+    def find_many_employees(self, names: list[tuple[str, str]]) -> dict[tuple[str, str], Optional[list[dict]]]:
+        """
+        `find_employees` for several (lastname, firstname) at once, looked up concurrently.
+
+        Names are deduplicated (whatever their case), the result maps each distinct (lastname, firstname),
+        as first given, to its employees (None if the search failed).
+        """
+        unique_names = {}
+        for lastname, firstname in names:
+            unique_names.setdefault((lastname.strip().lower(), firstname.strip().lower()),
+                                    (lastname.strip(), firstname.strip()))
+        distinct = list(unique_names.values())
+        results = self._executor.map(lambda name: self.find_employees(*name), distinct)
+        return dict(zip(distinct, results))
+
+    def clear_cache(self):
+        """Drop every cached search."""
+        with self._cache_lock:
+            self._cache.clear()
+
+def _extract_last_description(organization_info):
+    # The JSON response has nested [organizationInformation][organization]
+    # This traverses through the nested objects to get the last description
+    while "organizationInformation" in organization_info:
+        organization_info = organization_info["organizationInformation"]["organization"]
+    return organization_info["description"]
+
+def to_profile(result: dict, domain: str = _domain) -> dict:
+    """The profile card shown in the UI for a GEDS employee result."""
+    contact_information = result["contactInformation"]
+    profile = {
+        "url": f"{domain}/en/GEDS?pgid=015&dn={result['id']}",
+        "name": result["givenName"] + " " + result["surname"],
+        "email": contact_information["email"],
+    }
+
+    description = _extract_last_description(result.get("organizationInformation", {}).get("organization", {}))
+    profile["organization_en"] = description.get("en", "")
+    profile["organization_fr"] = description.get("fr", "")
+
+    if "phoneNumber" in contact_information:
+        profile["phone"] = contact_information["phoneNumber"]
+    return profile
+
+_client: Optional[GedsClient] = None
+_client_lock = threading.Lock()
+
+def get_geds_client() -> GedsClient:
+    """Return the process wide GEDS client (shared session and cache)."""
+    global _client # pylint: disable=global-statement
+    with _client_lock:
+        if _client is None:
+            _client = GedsClient()
+    return _client
@@ -1,21 +1,17 @@
 import json
 import logging
-import os
-
-import requests
 
+from tools.geds.geds_client import get_geds_client, to_profile
 from utils.decorators import tool_metadata
 
-__all__ = ["get_employee_information", "extract_geds_profiles"]
-
-_api_endpoint: str = os.getenv("GEDS_API", "https://api.geds-sage.gc.ca/gapi/v2")
-_api_token = os.getenv("GEDS_API_TOKEN")
-
-_domain = os.getenv("GEDS_DOMAIN", "https://geds-sage.gc.ca")
+__all__ = ["get_employee_information", "get_employees_information", "extract_geds_profiles"]
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# Names looked up by a single get_employees_information call, the others are ignored
+MAX_BATCH_NAMES = 10
+
 @tool_metadata({
   "type": "function",
   "function": {
@@ -46,39 +42,82 @@ def get_employee_information(employee_lastname: str = "", employee_firstname: st
     if not employee_lastname:
         return "Please provide a last name to search for an employee."
 
-    # Check if the first name is provided
-    if employee_firstname:
-        search_value = f"{employee_lastname}%2C{employee_firstname}"
-    else:
-        search_value = employee_lastname
+    employees = get_geds_client().find_employees(employee_lastname, employee_firstname)
+    if not employees:
+        return "Didn't find any matching employee with that name."
 
-    url = (
-        _api_endpoint + "/employees?"
-        f"searchValue={search_value}&searchField=9&searchCriterion=2&searchScope=sub&searchFilter=2&maxEntries=5&pageNumber=1&returnOrganizationInformation=yes"
-    )
+    # Check if the response contains multiple employees with the same last name
+    if len(employees) > 1 and not employee_firstname:
+        message = "Found multiple employees with that last name. Please provide the first name as well. However, here are some of the first results."
+    # Check if the response contains multiple employees with the same first and last name
+    elif len(employees) > 1:
+        message = "Found multiple employees with that name. Return the phone number, name, and address for each employee, if available."
+    else:
+        message = "Found an employee with that name. Return the phone number, name, and address for the employee, if available."
+    return {"message": message, "employees": employees}
 
-    payload = {}
-    headers = {
-        'X-3scale-proxy-secret-token': _api_token,
-        'Accept': 'application/json'
+@tool_metadata({
+  "type": "function",
+  "function": {
+    "name": "get_employees_information",
+    "description": "Gets information on several Government of Canada employees at once by their names, e.g. John Smith, Mary Jones and Daniel Brown. Use this method instead of calling get_employee_information once per person whenever the user asks for the contact information of more than one person.",
+    "parameters": {
+      "type": "object",
+      "properties": {
+        "employees": {
+          "type": "array",
+          "description": "The employees to look up.",
+          "items": {
+            "type": "object",
+            "properties": {
+              "employee_firstname": {
+                "type": "string",
+                "description": "The first name (given name) of an employee, e.g. John, Daniel, or Mary"
+              },
+              "employee_lastname": {
+                "type": "string",
+                "description": "The last name (surname) of an employee, e.g. Smith, Johnson, or Jones"
+              }
+            },
+            "required": ["employee_lastname", "employee_firstname"]
+          }
+        }
+      },
+      "required": ["employees"]
     }
-
-    response = requests.request("GET", url, headers=headers, data=payload)
-
-    # Check if the response was successful
-    if response.status_code == 200:
-        # Check if the response contains multiple employees with the same last name
-        if len(json.loads(response.text)) > 1 and not employee_firstname:
-            return "Found multiple employees with that last name. Please provide the first name as well. However, here are some of the first results: " + response.text
-        
-        # Check if the response contains multiple employees with the same first and last name
-        elif len(json.loads(response.text)) > 1:
-            return "Found multiple employees with that name. Return the phone number, name, and address for each employee, if available. Here are the results: " + response.text
-
+  }
+})
+def get_employees_information(employees: list[dict]):
+    """
+    get information about several employees, the names are looked up concurrently (see GedsClient.find_many_employees)
+    """
+    names = [(employee.get("employee_lastname") or "", employee.get("employee_firstname") or "")
+             for employee in employees[:MAX_BATCH_NAMES]]
+    names = [name for name in names if name[0].strip()]
+    if not names:
+        return "Please provide the last name of each employee to search for."
+    logger.debug("getting info for %s employees", len(names))
+
+    results = []
+    merged = {}
+    for (lastname, firstname), found in get_geds_client().find_many_employees(names).items():
+        if found is None:
+            status = "error"
+        elif not found:
+            status = "not_found"
         else:
-            return "Found an employee with that name. Return the phone number, name, and address for the employee, if available" + response.text
-    else:
-        return "Didn't find any matching employee with that name."
+            status = "found" if len(found) == 1 else "multiple"
+        results.append({"employee_lastname": lastname, "employee_firstname": firstname, "status": status,
+                        "ids": [employee.get("id") for employee in found or []]})
+        for employee in found or []:
+            merged.setdefault(employee.get("id"), employee)
+
+    message = ("Here are the results of each name (status is found, multiple, not_found or error) and the matching "
+               "employees. Return the phone number, name, and address of each employee, if available. "
+               "When a name has multiple matches, ask the user which one they meant.")
+    if len(employees) > MAX_BATCH_NAMES:
+        message += f" Only the first {MAX_BATCH_NAMES} names were looked up."
+    return {"message": message, "results": results, "employees": list(merged.values())}
 
 def _get_employee_by_phone_number(employee_phone_number: str):
     """
@@ -89,62 +128,30 @@ def _get_employee_by_phone_number(employee_phone_number: str):
     if "-" not in employee_phone_number:
         employee_phone_number = employee_phone_number[:3] + "-" + employee_phone_number[3:6] + "-" + employee_phone_number[6:]
 
-    url = (
-        _api_endpoint + "/employees?"
-        f"searchValue={employee_phone_number}&searchField=9&searchCriterion=2&searchScope=sub&searchFilter=2&maxEntries=5&pageNumber=1&returnOrganizationInformation=yes"
-    )
-
-    payload = {}
-    headers = {
-        'X-3scale-proxy-secret-token': _api_token,
-        'Accept': 'application/json'
-    }
-
-    response = requests.request("GET", url, headers=headers, data=payload)
-
-    # Check if the response was successful
-    if response.status_code == 200:
-        return json.dumps(response.text)
-    else:
-        logger.debug("Unable to get any info: %s", response.reason)
+    employees = get_geds_client().search(employee_phone_number)
+    if employees is None:
         return "Didn't find any matching employee with that phone number."
-
-def _extract_last_description(organization_info):
-    # The JSON response has nested [organizationInformation][organization]
-    # This traverses through the nested objects to get the last description
-    while "organizationInformation" in organization_info:
-        organization_info = organization_info["organizationInformation"]["organization"]
-    return organization_info["description"]
+    return {"employees": employees}
 
 def extract_geds_profiles(content):
-    try:
-        start_index = content.find("[") # trim the text preceeding the results
-        if start_index == -1: 
-            return []
-        else:    
-            content = content[start_index:]
-
-        data = json.loads(content)
-        profiles = []
-
-        for result in data:
-            profile = dict()
-
-            geds_profile_string = result["id"]
-            profile["url"] = f"{_domain}/en/GEDS?pgid=015&dn={geds_profile_string}"
-            profile["name"] = result["givenName"] + " " + result["surname"]
-            profile["email"] = result["contactInformation"]["email"]
-
-            description = _extract_last_description(result.get("organizationInformation", {}).get("organization", {}))
-            profile["organization_en"] = description.get("en", "")
-            profile["organization_fr"] = description.get("fr", "")
-
-            if "phoneNumber" in result["contactInformation"]:
-                profile["phone"] = result["contactInformation"]["phoneNumber"]
-
-            profiles.append(profile)
-        
-        return profiles
+    """
+    The UI profiles of the employees returned by get_employee_information or get_employees_information.
 
-    except Exception as e:
-        logger.debug(f"error: {e}")
\ No newline at end of file
+    `content` is the structured response of the function (preferred, nothing is parsed again) or,
+    for older callers, its text.
+    """
+    try:
+        if isinstance(content, dict):
+            employees = content.get("employees") or []
+        elif isinstance(content, list):
+            employees = content
+        else:
+            start_index = content.find("[") # trim the text preceeding the results
+            if start_index == -1:
+                return []
+            employees = json.loads(content[start_index:])
+        return [to_profile(employee) for employee in employees]
+
+    except Exception as e: # pylint: disable=broad-except
+        logger.debug("error: %s", e)
+        return []
@@ -0,0 +1,157 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from tools.geds import geds_client, geds_functions
+from tools.geds.geds_client import GedsClient
+
+
+def _employee(firstname, lastname):
+    return {
+        "id": f"cn={firstname} {lastname}",
+        "givenName": firstname,
+        "surname": lastname,
+        "contactInformation": {"email": f"{firstname}.{lastname}@example.gc.ca", "phoneNumber": "613-555-0100"},
+        "organizationInformation": {"organization": {
+            "description": {"en": "Shared Services Canada", "fr": "Services partagés Canada"},
+            "organizationInformation": {"organization": {"description": {"en": "Cloud", "fr": "Nuage"}}},
+        }},
+    }
+
+
+EMPLOYEES = {
+    "smith,john": [_employee("John", "Smith")],
+    "smith": [_employee("John", "Smith"), _employee("Mary", "Smith")],
+}
+
+
+class GedsStub(BaseHTTPRequestHandler):
+    """Answers /employees searches from EMPLOYEES and records the requests it got."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        self.server.requests.append((url.path, params, self.headers.get("X-3scale-proxy-secret-token")))
+        search_value = params["searchValue"][0].lower()
+        if search_value == "server,broken":
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps(EMPLOYEES.get(search_value, [])).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GedsStub)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    client = GedsClient(endpoint=f"http://127.0.0.1:{server.server_port}/gapi/v2", token="token", timeout=2)
+    monkeypatch.setattr(geds_client, "_client", client)
+    return client
+
+
+def test_search_sends_the_geds_parameters(client, server):
+    results = client.find_employees("Smith", "John")
+
+    assert results[0]["givenName"] == "John"
+    path, params, token = server.requests[0]
+    assert path == "/gapi/v2/employees"
+    assert params["searchValue"] == ["Smith,John"]
+    assert params["maxEntries"] == ["5"]
+    assert token == "token"
+
+
+def test_name_searches_are_cached(client, server):
+    client.find_employees("Smith", "John")
+    client.find_employees(" smith ", "JOHN")
+
+    assert len(server.requests) == 1
+
+    client.cache_ttl = 0
+    client.find_employees("Smith", "John")
+    assert len(server.requests) == 2
+
+
+def test_errors_are_not_cached(client, server):
+    assert client.find_employees("Server", "Broken") is None
+    assert client.find_employees("Server", "Broken") is None
+
+    assert len(server.requests) == 2
+
+
+def test_unreachable_geds_returns_none():
+    client = GedsClient(endpoint="http://127.0.0.1:9", timeout=0.5)
+
+    assert client.find_employees("Smith", "John") is None
+
+
+def test_get_employee_information_returns_structured_results(client):
+    response = geds_functions.get_employee_information("Smith")
+
+    assert "provide the first name" in response["message"]
+    assert [employee["givenName"] for employee in response["employees"]] == ["John", "Mary"]
+    assert geds_functions.get_employee_information("Nobody", "Here") == \
+        "Didn't find any matching employee with that name."
+
+
+def test_profiles_are_built_without_parsing_again(client):
+    response = geds_functions.get_employee_information("Smith", "John")
+
+    profiles = geds_functions.extract_geds_profiles(response)
+
+    assert profiles == [{
+        "url": "https://geds-sage.gc.ca/en/GEDS?pgid=015&dn=cn=John Smith",
+        "name": "John Smith",
+        "email": "John.Smith@example.gc.ca",
+        "organization_en": "Cloud",
+        "organization_fr": "Nuage",
+        "phone": "613-555-0100",
+    }]
+    # Older text responses are still understood
+    assert geds_functions.extract_geds_profiles("Found: " + json.dumps(response["employees"])) == profiles
+
+
+def test_batch_lookup_is_deduplicated(client, server):
+    response = geds_functions.get_employees_information([
+        {"employee_lastname": "Smith", "employee_firstname": "John"},
+        {"employee_lastname": "SMITH", "employee_firstname": "john"},
+        {"employee_lastname": "Smith", "employee_firstname": ""},
+        {"employee_lastname": "Nobody", "employee_firstname": "Here"},
+        {"employee_lastname": "Server", "employee_firstname": "Broken"},
+    ])
+
+    assert len(server.requests) == 4
+    assert [(result["employee_lastname"], result["status"]) for result in response["results"]] == [
+        ("Smith", "found"), ("Smith", "multiple"), ("Nobody", "not_found"), ("Server", "error")]
+    # John Smith matched two names but is returned once
+    assert [employee["givenName"] for employee in response["employees"]] == ["John", "Mary"]
+    assert len(geds_functions.extract_geds_profiles(response)) == 2
+
+
+def test_batch_lookup_is_bounded(client, server):
+    names = [{"employee_lastname": f"Name{i}", "employee_firstname": "A"} for i in range(15)]
+
+    response = geds_functions.get_employees_information(names)
+
+    assert len(response["results"]) == geds_functions.MAX_BATCH_NAMES
+    assert len(server.requests) == geds_functions.MAX_BATCH_NAMES
+    assert f"first {geds_functions.MAX_BATCH_NAMES} names" in response["message"]
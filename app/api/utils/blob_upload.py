@@ -0,0 +1,106 @@
+import base64
+import binascii
+import logging
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from azure.core import MatchConditions
+from azure.storage.blob import BlobBlock, BlobClient, ContentSettings
+
+__all__ = ["UPLOAD_BLOCK_SIZE", "decode_base64_blocks", "read_blocks", "upload_blocks"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(4 * 1024 * 1024)))
+# Blocks staged at the same time by a single upload
+_UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+_NOT_BASE64 = re.compile(r"[^A-Za-z0-9+/=]")
+
+def decode_base64_blocks(encoded: str, block_size: int = UPLOAD_BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Decode base64 text (optionally a `data:` URL) in blocks of about `block_size` bytes.
+
+    Only a slice of the text is copied at a time, instead of the whole decoded file. Like `base64.b64decode`,
+    characters outside of the base64 alphabet (line breaks...) are ignored. Raises a ValueError on invalid data,
+    possibly after the first blocks were returned.
+    """
+    start = encoded.index(",") + 1 if encoded.startswith("data:") else 0
+    step = -(-block_size // 3) * 4
+    pending = ""
+    for offset in range(start, len(encoded), step):
+        piece = encoded[offset:offset + step]
+        if _NOT_BASE64.search(piece):
+            piece = _NOT_BASE64.sub("", piece)
+        pending += piece
+        usable = len(pending) // 4 * 4
+        if usable:
+            try:
+                yield base64.b64decode(pending[:usable], validate=True)
+            except binascii.Error as e:
+                raise ValueError(f"Invalid base64 file data: {e}") from e
+            pending = pending[usable:]
+    if pending:
+        raise ValueError("Invalid base64 file data: incorrect padding")
+
+def read_blocks(stream: BinaryIO, block_size: int = UPLOAD_BLOCK_SIZE) -> Iterator[bytes]:
+    """Read a binary stream (a multipart file...) in blocks of `block_size` bytes."""
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            return
+        yield block
+
+def _block_id(index: int) -> str:
+    # Block ids of a blob must all have the same length
+    return base64.b64encode(f"{index:08d}".encode("ascii")).decode("ascii")
+
+def upload_blocks(blob_client: BlobClient, blocks: Iterable[bytes], metadata: Optional[dict] = None,
+                  content_settings: Optional[ContentSettings] = None, overwrite: bool = True,
+                  concurrency: int = _UPLOAD_CONCURRENCY) -> int:
+    """
+    Upload a blob from its blocks, returns its size.
+
+    A blob of a single block is uploaded with one `upload_blob` call. Larger blobs have their blocks staged
+    concurrently (at most `concurrency` blocks in memory) and committed with their metadata and content settings in
+    one `commit_block_list` call.
+    """
+    blocks = iter(blocks)
+    first = next(blocks, b"")
+    second = next(blocks, None)
+    if second is None:
+        blob_client.upload_blob(first, blob_type="BlockBlob", overwrite=overwrite, metadata=metadata,
+                                content_settings=content_settings)
+        return len(first)
+
+    def stage(index: int, block: bytes):
+        blob_client.stage_block(block_id=_block_id(index), data=block, length=len(block))
+
+    size = 0
+    block_ids = []
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="blob-upload") as executor:
+        staging = set()
+        for index, block in enumerate(_chain(first, second, blocks)):
+            if len(staging) >= concurrency:
+                done, staging = wait(staging, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            staging.add(executor.submit(stage, index, block))
+            block_ids.append(_block_id(index))
+            size += len(block)
+        for future in staging:
+            future.result()
+
+    conditions = {} if overwrite else {"etag": "*", "match_condition": MatchConditions.IfMissing}
+    blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in block_ids], metadata=metadata,
+                                  content_settings=content_settings, **conditions)
+    logger.debug("Uploaded %s bytes in %s blocks to %s", size, len(block_ids), blob_client.blob_name)
+    return size
+
+def _chain(first: bytes, second: bytes, rest: Iterator[bytes]) -> Iterator[bytes]:
+    yield first
+    yield second
+    yield from rest
@@ -1,14 +1,16 @@
-import base64
-import copy
-import json
 import logging
 import os
 import uuid
+from typing import BinaryIO, Iterable
 
 from azure.data.tables import TableServiceClient
 from azure.identity import DefaultAzureCredential
 
 from utils.azure_clients import get_blob_service_client
+from utils.blob_upload import decode_base64_blocks, read_blocks, upload_blocks
+from utils.entity_codec import SPILL_CONTAINER, encode_entity
+from utils.entity_projection import project
+from utils.persistence_worker import get_persistence_worker
 
 from .auth import User
 from .models import Completion, Feedback, FilePayload, MessageRequest
@@ -26,13 +28,17 @@ feedback_table_client = table_service_client.get_table_client(table_name="feedba
 flagged_client = table_service_client.get_table_client(table_name="flagged")
 suggest_client = table_service_client.get_table_client(table_name="suggest")
 
-def create_entity(data, partition_key: str, row_key_prefix: str, user: User | None):
+def _spill_to_blob(blob_name: str, data: bytes):
+    blob_client = get_blob_service_client().get_blob_client(container=SPILL_CONTAINER, blob=blob_name)
+    blob_client.upload_blob(data, blob_type="BlockBlob", overwrite=True)
+
+def build_entity(data, partition_key: str, row_key_prefix: str, user: User | None) -> dict:
     '''
-    Create entity that we will store in the database
+    Build the entity that we will store in the database, before it is encoded (see `encode_chat_entity`)
 
+    Only the stored fields of `data` are read (see `project`), it is not copied.
     TODO: validate parition_key, if empty handle error.
     '''
-    data_copy = copy.deepcopy(data)
     entity = dict()
     entity['PartitionKey'] = partition_key
     entity['RowKey'] = f"{row_key_prefix}-{uuid.uuid4()}"
@@ -53,47 +59,43 @@ def create_entity(data, partition_key: str, row_key_prefix: str, user: User | No
     except Exception as e:
         logger.error("Unable to add user information: %s", e)
 
-    if isinstance(data_copy, Completion):
-        data_copy.message.tools_info = None #avoid functions data returned by SSCA
-        entity['Answer'] = data_copy.message.content
+    columns, payload = project(data)
+    entity.update(columns)
+    entity[row_key_prefix] = payload
 
-    if isinstance(data_copy, MessageRequest) and data_copy.messages:
-        msg = data_copy.messages[-1]
-        data_copy.messages = [] #avoid saving the whole conversation (no need to)
-        data_copy.messages = [msg] #avoid saving the whole conversation (no need to)
-        logger.debug("question length is: %s", len(str(msg.content)))
-        logger.debug("history length is: %s", len(data_copy.messages))
-        entity['Question'] = msg.content
+    return entity
 
-    entity[row_key_prefix] = json.dumps(
-            data_copy.__dict__,
-            default=lambda o: o.__dict__
-    )
+def encode_chat_entity(entity: dict) -> dict:
+    '''
+    Large properties are compressed and split (or spilled to a blob) to fit in the table, see `encode_entity`.
+    '''
+    return encode_entity(entity, spill=_spill_to_blob)
 
-    return entity
+def create_entity(data, partition_key: str, row_key_prefix: str, user: User | None):
+    '''
+    Create entity that we will store in the database, built and encoded
+    '''
+    return encode_chat_entity(build_entity(data, partition_key, row_key_prefix, user))
 
 def store_request(message_request: MessageRequest, conversation_uuid: str, user: User):
     '''
     Store the conversation in the database, we store what we received (history and question) 
-    NOTE: Azure Table storage offers a limit of 32k per column for string type of characters.
-        one solution is to compress and split the data: https://github.com/mebjas/AzureStorageTableLargeDataWriter/blob/master/AzureStorageTableLargeDataWriter/StorageTableWriter.cs
+    The entity is written in the background by the persistence worker, this returns right away.
     '''
     try:
-        message_request_entity = create_entity(message_request, conversation_uuid, 'MessageRequest', user)
-        chat_table_client.upsert_entity(message_request_entity)
+        message_request_entity = build_entity(message_request, conversation_uuid, 'MessageRequest', user)
+        get_persistence_worker().submit(chat_table_client, message_request_entity, encode=encode_chat_entity)
     except Exception as e:
           logger.error(e)
 
 def store_completion(completion: Completion, conversation_uuid: str, user: User):
       '''
       Store the conversation in the database, we store the completion (answer)
-
-      NOTE: Azure Table storage offers a limit of 32k per column for string type of characters.
-            one solution is to compress and split the data: https://github.com/mebjas/AzureStorageTableLargeDataWriter/blob/master/AzureStorageTableLargeDataWriter/StorageTableWriter.cs
+      The entity is written in the background by the persistence worker, this returns right away.
       '''
       try:
-        completion_entity = create_entity(completion, conversation_uuid, 'Completion', user)
-        chat_table_client.upsert_entity(completion_entity)
+        completion_entity = build_entity(completion, conversation_uuid, 'Completion', user)
+        get_persistence_worker().submit(chat_table_client, completion_entity, encode=encode_chat_entity)
       except Exception as e:
           logger.error(e)
 
@@ -120,31 +122,30 @@ def flag_conversation(message_request: MessageRequest, conversation_uuid: str):
 
 def save_file(file: FilePayload, user: User) -> str:
     '''
-    Store the feedback in the database, we store what we received (history and question) and the completion (answer)
+    Store a base64 encoded file (data URL) in the blob storage, decoded block by block
     NOTE: We do not store the user here since the file tied to the user operation 
           is stored in a different table (history)
     Returns the blob storage url if successful
     '''
-    file_name_uuid = str(uuid.uuid4()) + '-' + file.name
+    return _save_blocks(decode_base64_blocks(file.encoded_file), file.name, user)
+
+def save_file_stream(stream: BinaryIO, name: str, user: User) -> str:
+    '''
+    Store a binary file (multipart upload) in the blob storage, read block by block
+    Returns the blob storage url if successful
+    '''
+    return _save_blocks(read_blocks(stream), name, user)
+
+def _save_blocks(blocks: Iterable[bytes], name: str, user: User) -> str:
+    file_name_uuid = str(uuid.uuid4()) + '-' + name
     blob_client = get_blob_service_client().get_blob_client(container="assistant-chat-files", blob=file_name_uuid)
     logger.info("Blob client created for container 'assistant-chat-files' and blob '%s'.", file_name_uuid)
 
-    # Handle different encoded file formats
-    try:
-        # Data URL format: "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAA..."
-        base64_data = file.encoded_file.split(",", 1)[1]
-        file_as_byte = base64.b64decode(base64_data)
-        logger.debug("Successfully decoded base64 file data, size: %d bytes", len(file_as_byte))
-    except Exception as e:
-        logger.error("Failed to decode base64 file data: %s", e)
-        raise ValueError(f"Invalid base64 file data: {e}")
-
-    blob_client.upload_blob(file_as_byte, blob_type="BlockBlob", overwrite=False)
     metadata = {
         "user_id": user.token['oid'] if user.token and 'oid' in user.token else "unknown",
     }
-    blob_client.set_blob_metadata(metadata)
-    logger.debug("File uploaded to blob storage with metadata: %s", metadata)
+    size = upload_blocks(blob_client, blocks, metadata=metadata, overwrite=False)
+    logger.debug("File of %d bytes uploaded to blob storage with metadata: %s", size, metadata)
     return blob_client.url
 
 def store_suggestion(message_request: MessageRequest, user: User):
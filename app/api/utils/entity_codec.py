@@ -0,0 +1,126 @@
+import gzip
+import logging
+import os
+from typing import Callable, Iterable, Mapping, Optional
+
+__all__ = ["SPILL_CONTAINER", "encode_entity", "decode_entity", "codec_columns", "is_encoded", "entity_size"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# String properties longer than that (characters) are stored gzip compressed
+_COMPRESS_THRESHOLD = int(os.getenv("ENTITY_COMPRESS_THRESHOLD", "16000"))
+# Encoded entities larger than that (bytes) have their largest compressed properties spilled to blobs until they
+# fit, Azure Table entities are limited to 1MB (the margin covers the service's own accounting)
+_MAX_ENTITY_BYTES = int(os.getenv("ENTITY_MAX_BYTES", str(960 * 1024)))
+# Container of the properties too large to be stored in the table, even compressed
+SPILL_CONTAINER = os.getenv("CHAT_SPILL_CONTAINER", "chat-entity-spill")
+# Azure Table binary properties are limited to 64KB
+PART_SIZE = 64000
+CODEC_GZIP = "gzip"
+
+_KEYS = {"PartitionKey", "RowKey"}
+_CODEC = "__codec"
+_PARTS = "__parts"
+_PART = "__gz"
+_BLOB = "__blob"
+
+def _property_size(name: str, value) -> int:
+    """Approximate size of a property as Azure counts it: UTF-16 strings and names, 8 bytes for numbers."""
+    if isinstance(value, str):
+        size = len(value) * 2
+    elif isinstance(value, (bytes, bytearray)):
+        size = len(value)
+    else:
+        size = 8
+    return 8 + len(name) * 2 + size
+
+def entity_size(entity: Mapping) -> int:
+    """Approximate size of an entity in Azure Table Storage."""
+    return sum(_property_size(name, value) for name, value in entity.items())
+
+def _parts(name: str, data: bytes) -> dict:
+    parts = [data[i:i + PART_SIZE] for i in range(0, len(data), PART_SIZE)]
+    encoded: dict = {name + _PARTS: len(parts)}
+    for index, part in enumerate(parts):
+        encoded[f"{name}{_PART}{index}"] = part
+    return encoded
+
+def encode_entity(entity: dict, spill: Optional[Callable[[str, bytes], None]] = None) -> dict:
+    """
+    Make an entity fit in Azure Table Storage (32K characters per string property, 1MB per entity).
+
+    Every string property longer than ENTITY_COMPRESS_THRESHOLD characters is gzip compressed and split across
+    numbered binary properties (`Answer__gz0`, `Answer__gz1`...) along with `Answer__codec` and `Answer__parts`.
+    While the encoded entity is larger than ENTITY_MAX_BYTES, its largest compressed property is handed to
+    `spill` (blob name, data) and only the blob name is kept (`Answer__blob`). Other properties are left as is,
+    see `decode_entity`.
+    """
+    encoded = {}
+    compressed: dict[str, dict] = {}
+    for name, value in entity.items():
+        if name in _KEYS or not isinstance(value, str) or len(value) <= _COMPRESS_THRESHOLD:
+            encoded[name] = value
+            continue
+        encoded[name + _CODEC] = CODEC_GZIP
+        compressed[name] = _parts(name, gzip.compress(value.encode("utf-8")))
+
+    total = entity_size(encoded) + sum(entity_size(parts) for parts in compressed.values())
+    if spill is not None:
+        # Largest first, so as few properties as possible are moved out of the table
+        for name in sorted(compressed, key=lambda name: entity_size(compressed[name]), reverse=True):
+            if total <= _MAX_ENTITY_BYTES:
+                break
+            parts = compressed.pop(name)
+            data = b"".join(parts[f"{name}{_PART}{index}"] for index in range(parts[name + _PARTS]))
+            blob_name = f"{entity.get('PartitionKey')}/{entity.get('RowKey')}/{name}.gz"
+            spill(blob_name, data)
+            encoded[name + _BLOB] = blob_name
+            total += _property_size(name + _BLOB, blob_name) - entity_size(parts)
+            logger.debug("%s (%s bytes compressed) spilled to blob %s", name, len(data), blob_name)
+
+    if total > _MAX_ENTITY_BYTES:
+        logger.warning("Entity %s is %s bytes encoded and cannot be spilled, the write may be rejected",
+                       entity.get("RowKey"), total)
+    for parts in compressed.values():
+        encoded.update(parts)
+    return encoded
+
+def decode_entity(entity: Mapping, load_blob: Optional[Callable[[str], bytes]] = None) -> dict:
+    """
+    Reverse of `encode_entity`, returns a copy of the entity with its compressed properties restored.
+
+    Rows written before the encoding existed have no `__codec` property and are returned unchanged. A property
+    whose blob cannot be loaded is restored as None.
+    """
+    decoded = dict(entity)
+    for codec_key in [key for key in entity if key.endswith(_CODEC)]:
+        name = codec_key[:-len(_CODEC)]
+        blob_name = decoded.pop(name + _BLOB, None)
+        parts = decoded.pop(name + _PARTS, 0) or 0
+        chunks = [decoded.pop(f"{name}{_PART}{index}", b"") for index in range(parts)]
+        codec = decoded.pop(codec_key)
+        if codec != CODEC_GZIP:
+            logger.error("Unknown codec %s for %s, leaving it out", codec, name)
+            decoded[name] = None
+            continue
+        try:
+            if blob_name:
+                if load_blob is None:
+                    raise LookupError("no blob loader")
+                data = load_blob(blob_name)
+            else:
+                data = b"".join(bytes(chunk) for chunk in chunks)
+            decoded[name] = gzip.decompress(data).decode("utf-8")
+        except Exception as e: # pylint: disable=broad-except
+            logger.error("Unable to decode %s of %s: %s", name, entity.get("RowKey"), e)
+            decoded[name] = None
+    return decoded
+
+def codec_columns(names: Iterable[str]) -> list[str]:
+    """The columns telling whether the properties `names` were encoded, to select along with them."""
+    return [name + _CODEC for name in names]
+
+def is_encoded(entity: Mapping) -> bool:
+    """Whether some property of the entity was encoded, its parts are needed to decode it."""
+    return any(key.endswith(_CODEC) for key in entity)
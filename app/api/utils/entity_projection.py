@@ -0,0 +1,61 @@
+import json
+from typing import Any, Callable
+
+from .models import Completion, Feedback, MessageRequest
+
+__all__ = ["project"]
+
+# Nested dataclasses (messages, citations, attachments...) are written as their fields
+_encoder = json.JSONEncoder(default=lambda o: o.__dict__, check_circular=False)
+
+def _message_request(data: MessageRequest) -> tuple[dict, dict]:
+    """Only the last message is stored, the history was stored with the previous requests."""
+    if not data.messages:
+        return {}, data.__dict__
+    msg = data.messages[-1]
+    return {'Question': msg.content}, {**data.__dict__, 'messages': [msg]}
+
+def _tools_column(data: Completion) -> str | None:
+    """The tools called for the answer (type, function, calls and search index), without their payloads."""
+    if not data.message.tools_info:
+        return None
+    return json.dumps([{'tool_type': tool.tool_type,
+                        'function_name': tool.function_name,
+                        'count': tool.count,
+                        'index_name': (tool.payload or {}).get('index_name')} for tool in data.message.tools_info])
+
+def _completion(data: Completion) -> tuple[dict, dict]:
+    """
+    The answer without the tools data returned by SSCA.
+    The token counts and the tools called are also stored as columns, read without the payload by the reports.
+    """
+    message = {**data.message.__dict__, 'tools_info': None}
+    columns = {'Answer': data.message.content,
+               'PromptTokens': data.prompt_tokens or 0,
+               'CompletionTokens': data.completion_tokens or 0,
+               'TotalTokens': data.total_tokens or 0}
+    tools = _tools_column(data)
+    if tools is not None:
+        columns['Tools'] = tools
+    return columns, {**data.__dict__, 'message': message}
+
+def _feedback(data: Feedback) -> tuple[dict, dict]:
+    return {}, data.__dict__
+
+# Suggestions are MessageRequest as well, stored with their own row key prefix
+_PROJECTIONS: dict[type, Callable[[Any], tuple[dict, dict]]] = {
+    MessageRequest: _message_request,
+    Completion: _completion,
+    Feedback: _feedback,
+}
+
+def project(data) -> tuple[dict, str]:
+    """
+    Return the columns (Question, Answer) and the JSON payload stored for `data`.
+
+    The projections only read the fields that are stored and shallow copy the top level object when one of its
+    fields is replaced, `data` itself is neither copied nor modified.
+    """
+    projection = _PROJECTIONS.get(type(data))
+    columns, fields = projection(data) if projection else ({}, data.__dict__)
+    return columns, _encoder.encode(fields)
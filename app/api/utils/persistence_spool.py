@@ -0,0 +1,259 @@
+import base64
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from azure.core.exceptions import AzureError, HttpResponseError
+from azure.data.tables import TableClient
+
+__all__ = ["PersistenceSpool"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_SEGMENT_BYTES = int(os.getenv("PERSISTENCE_SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+# Appends are fsynced together, every that many records or seconds (whichever comes first)
+_FSYNC_BATCH = int(os.getenv("PERSISTENCE_SPOOL_FSYNC_BATCH", "32"))
+_FSYNC_INTERVAL_SECS = float(os.getenv("PERSISTENCE_SPOOL_FSYNC_INTERVAL_SECS", "1"))
+# Entities per second written back to Table Storage, so a recovering service is not flooded
+_REPLAY_RATE = float(os.getenv("PERSISTENCE_SPOOL_REPLAY_RATE", "50"))
+_REPLAY_INTERVAL_SECS = float(os.getenv("PERSISTENCE_SPOOL_REPLAY_INTERVAL_SECS", "30"))
+
+_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# Segments are appended to as `.open` files and renamed `.spool` once sealed, only sealed ones are replayed
+_OPEN = ".open"
+_SEALED = ".spool"
+
+def _encode_value(value):
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict) and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0  # replayed meanwhile
+
+class PersistenceSpool:
+    """
+    Local append only spool of the entities that could not be written to Table Storage.
+
+    Entities are appended as JSON lines to segment files of about `segment_bytes` in `directory`, fsynced in
+    batches. A background replayer regularly seals the current segment and writes the sealed ones back to their
+    table at `replay_rate` entities per second, deleting each segment once all of it is written. A pass stops at the
+    first transient error (the service is still down) and the segment is replayed again later, which is safe since
+    entities are upserted with their RowKey. Entities rejected by the service (bad request...) are dropped and logged.
+
+    The directory can be shared by the processes of a server: each process appends to its own segments, holding an
+    exclusive `flock` on them until they are sealed, and a segment is replayed by whichever process takes its lock.
+    Segments left open by a process that died (their lock went with it) are sealed by the next replay.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = _SEGMENT_BYTES, fsync_batch: int = _FSYNC_BATCH,
+                 fsync_interval: float = _FSYNC_INTERVAL_SECS, replay_rate: float = _REPLAY_RATE,
+                 replay_interval: float = _REPLAY_INTERVAL_SECS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.replay_rate = replay_rate
+        self.replay_interval = replay_interval
+        os.makedirs(directory, exist_ok=True)
+        self._tables: dict[str, TableClient] = {}
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._file = None
+        self._path: Optional[str] = None
+        self._file_bytes = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._metrics = {"appended": 0, "replayed": 0, "dropped": 0, "replay_errors": 0}
+
+    def register(self, table_client: TableClient):
+        """Make a table known to the replayer (tables are also registered by `append`)."""
+        self._tables[table_client.table_name] = table_client
+
+    def append(self, table_client: TableClient, entity: dict):
+        """Record an entity to write to a table later."""
+        self.register(table_client)
+        record = {"table": table_client.table_name,
+                  "entity": {name: _encode_value(value) for name, value in entity.items()}}
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None or self._file_bytes >= self.segment_bytes:
+                self._open_segment()
+            self._file.write(line)
+            self._file.flush()
+            self._file_bytes += len(line)
+            self._unsynced += 1
+            self._metrics["appended"] += 1
+            if self._unsynced >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def sync(self):
+        """Fsync what was appended since the last sync."""
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _open_segment(self):
+        self._seal()
+        # Named by creation time so segments replay in order, locked before it is visible to the replayers
+        name = os.path.join(self.directory, f"{time.time_ns():020d}-{os.getpid()}")
+        self._file = open(name + ".tmp", "ab") # pylint: disable=consider-using-with
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        os.rename(name + ".tmp", name + _OPEN)
+        self._path = name + _OPEN
+        self._file_bytes = 0
+
+    def _seal(self):
+        if self._file is not None:
+            self._sync()
+            os.rename(self._path, self._path[:-len(_OPEN)] + _SEALED)
+            self._file.close()
+            self._file = None
+            self._path = None
+
+    def _segments(self, suffix: str = _SEALED) -> list[str]:
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if name.endswith(suffix))
+
+    @staticmethod
+    def _lock_segment(path: str):
+        """Open and lock a segment, None when another process holds it or already removed it."""
+        try:
+            segment = open(path, "rb") # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if os.fstat(segment.fileno()).st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+        except OSError:
+            segment.close()
+            return None
+        return segment
+
+    def _seal_orphans(self):
+        for path in self._segments(_OPEN):
+            segment = self._lock_segment(path)
+            if segment is None:
+                continue  # still appended to
+            with segment:
+                logger.warning("Sealing spool segment %s left open by a stopped process", path)
+                os.rename(path, path[:-len(_OPEN)] + _SEALED)
+
+    def replay(self) -> int:
+        """Write the spooled entities back to their tables, returns how many were written."""
+        with self._replay_lock:
+            with self._lock:
+                self._seal()
+            self._seal_orphans()
+            written = 0
+            for path in self._segments():
+                segment = self._lock_segment(path)
+                if segment is None:
+                    continue  # replayed by another process
+                with segment:
+                    done, count = self._replay_segment(path, segment)
+                    if done:
+                        os.remove(path)
+                written += count
+                if not done:
+                    break
+            return written
+
+    def _replay_segment(self, path: str, segment) -> tuple[bool, int]:
+        written = 0
+        for line in segment:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping a torn record of spool segment %s", path)
+                continue
+            table_client = self._tables.get(record["table"])
+            if table_client is None:
+                # Not registered yet in this process, keep the segment for a later pass
+                return False, written
+            entity = {name: _decode_value(value) for name, value in record["entity"].items()}
+            try:
+                table_client.upsert_entity(entity)
+            except HttpResponseError as e:
+                if e.status_code is None or e.status_code in _RETRY_STATUSES:
+                    self._count("replay_errors")
+                    logger.warning("Table Storage still unavailable (%s), replay paused", e.status_code or e)
+                    return False, written
+                self._count("dropped")
+                logger.error("Dropping spooled entity %s of partition %s: %s",
+                             entity.get("RowKey"), entity.get("PartitionKey"), e)
+                continue
+            except AzureError as e:
+                self._count("replay_errors")
+                logger.warning("Table Storage still unavailable (%s), replay paused", e)
+                return False, written
+            written += 1
+            self._count("replayed")
+            if self.replay_rate > 0:
+                time.sleep(1 / self.replay_rate)
+        return True, written
+
+    def start_replay(self):
+        """Start the background thread that fsyncs the pending appends and replays the spool."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="persistence-spool", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        next_replay = time.monotonic()
+        while not self._stopping.wait(min(self.fsync_interval, self.replay_interval)):
+            self.sync()
+            if time.monotonic() < next_replay:
+                continue
+            try:
+                if self.pending_segments():
+                    replayed = self.replay()
+                    if replayed:
+                        logger.info("Replayed %s spooled entities", replayed)
+            except Exception as e: # pylint: disable=broad-except
+                logger.error("Spool replay failed: %s", e)
+            next_replay = time.monotonic() + self.replay_interval
+
+    def stop(self):
+        """Stop the replayer and seal the current segment."""
+        self._stopping.set()
+        with self._lock:
+            self._seal()
+
+    def pending_segments(self) -> int:
+        return len(self._segments()) + len(self._segments(_OPEN))
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self._metrics[name] += value
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        segments = self._segments() + self._segments(_OPEN)
+        metrics["segments"] = len(segments)
+        metrics["pending_bytes"] = sum(_size(path) for path in segments)
+        return metrics
@@ -0,0 +1,313 @@
+import atexit
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from azure.core.exceptions import AzureError, HttpResponseError, ServiceRequestError, ServiceResponseError
+from azure.data.tables import TableClient, TableTransactionError
+
+from utils.persistence_spool import PersistenceSpool
+
+__all__ = ["PersistenceWorker", "get_persistence_worker"]
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_QUEUE_SIZE = int(os.getenv("PERSISTENCE_QUEUE_SIZE", "1000"))
+_WORKERS = int(os.getenv("PERSISTENCE_WORKERS", "2"))
+_RETRIES = int(os.getenv("PERSISTENCE_RETRIES", "5"))
+_RETRY_BACKOFF_SECS = float(os.getenv("PERSISTENCE_RETRY_BACKOFF_SECS", "0.5"))
+# How long a request waits for room in a full queue before writing its entity itself
+_SUBMIT_TIMEOUT_SECS = float(os.getenv("PERSISTENCE_SUBMIT_TIMEOUT_SECS", "1"))
+_DRAIN_TIMEOUT_SECS = float(os.getenv("PERSISTENCE_DRAIN_TIMEOUT_SECS", "10"))
+# Where entities that could not be written are kept until Table Storage recovers, empty to disable the spool
+_SPOOL_DIR = os.getenv("PERSISTENCE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "chat-persistence-spool"))
+
+# Azure Table transactions: at most 100 entities, 4MB, all in the same partition
+MAX_BATCH_ENTITIES = 100
+_MAX_BATCH_BYTES = 3 * 1024 * 1024
+# Throttling and transient server errors, retried with backoff
+_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+@dataclass
+class _Write:
+    """An entity waiting to be written to a table."""
+    table_client: TableClient
+    entity: dict
+    # Applied by the writer thread before the entity is written (compression, blob spill...)
+    encode: Optional[Callable[[dict], dict]] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def size(self) -> int:
+        return sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in self.entity.values())
+
+class PersistenceWorker:
+    """
+    Write behind queue for the chat tables.
+
+    Requests hand their entities to `submit` and return right away, a fixed pool of `workers` threads drains the
+    bounded queue and upserts them. Writes waiting in the queue are grouped by table and PartitionKey (the
+    conversation uuid) into `submit_transaction` batches of up to 100 entities. Throttling and transient errors are
+    retried with an exponential backoff. When the queue is full the request waits up to `submit_timeout` seconds
+    for room (backpressure) and then writes its entity itself, so nothing is dropped. `shutdown` (run at exit) drains
+    what is left in the queue.
+
+    With a `spool`, entities still failing after the retries (or left in the queue on shutdown) are appended to it
+    to be replayed once Table Storage recovers, and a full queue spills to the spool instead of making the request
+    wait on storage. Entities rejected by the service (bad request...) are not spooled.
+
+    An `encode` function given to `submit` is run by the writer thread, not the request, before the entity is
+    batched, written or spooled.
+    """
+
+    def __init__(self, queue_size: int = _QUEUE_SIZE, workers: int = _WORKERS, retries: int = _RETRIES,
+                 backoff: float = _RETRY_BACKOFF_SECS, submit_timeout: float = _SUBMIT_TIMEOUT_SECS,
+                 spool: Optional[PersistenceSpool] = None):
+        self.workers = workers
+        self.spool = spool
+        self.retries = retries
+        self.backoff = backoff
+        self.submit_timeout = submit_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"submitted": 0, "written": 0, "failed": 0, "batches": 0, "retries": 0, "inline_writes": 0,
+                         "spooled": 0, "max_queue_depth": 0, "total_latency_ms": 0.0, "max_latency_ms": 0.0}
+
+    def start(self):
+        """Start the writer threads (done by the first `submit`)."""
+        with self._start_lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"persistence-writer-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, table_client: TableClient, entity: dict, encode: Optional[Callable[[dict], dict]] = None):
+        """Queue an entity to be upserted in a table, `encode` is applied to it before it is written."""
+        write = _Write(table_client, entity, encode)
+        self._count("submitted")
+        if self.spool is not None:
+            # Spooled entities of this table (from a previous process too) can be replayed
+            self.spool.register(table_client)
+        if self._stopping.is_set():
+            self._write_inline(write)
+            return
+        self.start()
+        try:
+            self._queue.put(write, timeout=self.submit_timeout)
+        except queue.Full:
+            if self.spool is not None:
+                logger.warning("Persistence queue is full, spooling the entity")
+                self._spool([write])
+            else:
+                logger.warning("Persistence queue is full, writing the entity in the request thread")
+                self._write_inline(write)
+            return
+        with self._metrics_lock:
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._queue.qsize())
+
+    def _write_inline(self, write: _Write):
+        self._count("inline_writes")
+        for encoded in self._encode([write]):
+            self._write_batch([encoded])
+
+    def _encode(self, writes: list[_Write]) -> list[_Write]:
+        """Apply the `encode` of the writes, the writes failing to encode are dropped."""
+        encoded = []
+        for write in writes:
+            if write.encode is not None:
+                try:
+                    write.entity = write.encode(write.entity)
+                    write.encode = None
+                except Exception as e: # pylint: disable=broad-except
+                    self._count("failed")
+                    logger.error("Unable to encode an entity of partition %s: %s", write.entity.get("PartitionKey"), e)
+                    continue
+            encoded.append(write)
+        return encoded
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            # Take whatever else is waiting, so writes of the same conversation can share a transaction
+            writes = [first]
+            while len(writes) < MAX_BATCH_ENTITIES * self.workers:
+                try:
+                    writes.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for batch in _batches(self._encode(writes)):
+                    self._write_batch(batch)
+            finally:
+                for _ in writes:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: list[_Write]):
+        """Write entities of a single table and partition, retrying throttled and transient failures."""
+        table_client = batch[0].table_client
+        for attempt in range(self.retries + 1):
+            try:
+                if len(batch) == 1:
+                    table_client.upsert_entity(batch[0].entity)
+                else:
+                    table_client.submit_transaction([("upsert", write.entity) for write in batch])
+                self._written(batch)
+                return
+            except TableTransactionError as e:
+                # One entity was rejected (too large, invalid property...), the others can still be written
+                logger.warning("Transaction of %s entities failed, writing them one by one: %s", len(batch), e)
+                for write in batch:
+                    self._write_batch([write])
+                return
+            except (HttpResponseError, ServiceRequestError, ServiceResponseError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = status is None or status in _RETRY_STATUSES
+                if not retryable or attempt == self.retries:
+                    self._failed(batch, e, spool=retryable)
+                    return
+                self._count("retries")
+                delay = self.backoff * 2 ** attempt
+                logger.warning("Table write failed (%s), retrying in %s seconds", status or e, delay)
+                time.sleep(delay)
+            except AzureError as e:
+                self._failed(batch, e)
+                return
+
+    def _written(self, batch: list[_Write]):
+        now = time.monotonic()
+        latencies = [(now - write.enqueued_at) * 1000 for write in batch]
+        with self._metrics_lock:
+            self._metrics["written"] += len(batch)
+            self._metrics["batches"] += 1
+            self._metrics["total_latency_ms"] += sum(latencies)
+            self._metrics["max_latency_ms"] = max(self._metrics["max_latency_ms"], *latencies)
+
+    def _failed(self, batch: list[_Write], error: Exception, spool: bool = True):
+        if spool and self.spool is not None:
+            logger.warning("Unable to write %s entities of partition %s, spooling them: %s",
+                           len(batch), batch[0].entity.get("PartitionKey"), error)
+            self._spool(batch)
+            return
+        self._count("failed", len(batch))
+        logger.error("Unable to write %s entities of partition %s: %s",
+                     len(batch), batch[0].entity.get("PartitionKey"), error)
+
+    def _spool(self, batch: list[_Write]):
+        batch = self._encode(batch)
+        try:
+            for write in batch:
+                self.spool.append(write.table_client, write.entity)
+            self._count("spooled", len(batch))
+        except OSError as e:
+            self._count("failed", len(batch))
+            logger.error("Unable to spool %s entities: %s", len(batch), e)
+
+    def _count(self, name: str, value: int = 1):
+        with self._metrics_lock:
+            self._metrics[name] += value
+
+    def flush(self, timeout: float = _DRAIN_TIMEOUT_SECS) -> bool:
+        """Wait until every queued entity is written (or failed), returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout: float = _DRAIN_TIMEOUT_SECS):
+        """Drain the queue and stop the writer threads, later submits are written inline."""
+        self._stopping.set()
+        if not self._threads:
+            return
+        if not self.flush(timeout):
+            if self.spool is not None:
+                self._spool_queue()
+            else:
+                logger.error("Persistence queue not drained on shutdown, %s entities lost", self._queue.qsize())
+        for thread in self._threads:
+            thread.join(timeout=1)
+        if self.spool is not None:
+            self.spool.stop()
+
+    def _spool_queue(self):
+        writes = []
+        while True:
+            try:
+                writes.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        logger.warning("Persistence queue not drained on shutdown, spooling %s entities", len(writes))
+        self._spool(writes)
+        for _ in writes:
+            self._queue.task_done()
+
+    def metrics(self) -> dict:
+        """Queue depth, counters and latency (from submit to written) of the writes."""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        written = metrics.pop("written")
+        total_latency_ms = metrics.pop("total_latency_ms")
+        return {
+            **metrics,
+            "written": written,
+            "queue_depth": self._queue.qsize(),
+            "avg_latency_ms": round(total_latency_ms / written, 3) if written else None,
+            "max_latency_ms": round(metrics["max_latency_ms"], 3),
+            "spool": self.spool.metrics() if self.spool is not None else None,
+        }
+
+def _batches(writes: list[_Write]) -> list[list[_Write]]:
+    """Group writes by table and partition into transactions of at most 100 entities (and about 3MB)."""
+    groups: dict[tuple, list[_Write]] = {}
+    for write in writes:
+        key = (id(write.table_client), write.entity.get("PartitionKey"))
+        groups.setdefault(key, []).append(write)
+
+    batches = []
+    for group in groups.values():
+        batch, batch_bytes = [], 0
+        for write in group:
+            size = write.size()
+            if batch and (len(batch) == MAX_BATCH_ENTITIES or batch_bytes + size > _MAX_BATCH_BYTES):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(write)
+            batch_bytes += size
+        batches.append(batch)
+    return batches
+
+_worker: Optional[PersistenceWorker] = None
+_worker_lock = threading.Lock()
+
+def get_persistence_worker() -> PersistenceWorker:
+    """Return the process wide persistence worker, drained when the process exits."""
+    global _worker # pylint: disable=global-statement
+    with _worker_lock:
+        if _worker is None:
+            spool = None
+            if _SPOOL_DIR:
+                try:
+                    spool = PersistenceSpool(_SPOOL_DIR)
+                    spool.start_replay()
+                except OSError as e:
+                    logger.error("Unable to use the persistence spool %s: %s", _SPOOL_DIR, e)
+            _worker = PersistenceWorker(spool=spool)
+            atexit.register(_worker.shutdown)
+    return _worker
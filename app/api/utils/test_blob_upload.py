@@ -0,0 +1,80 @@
+import base64
+import io
+import os
+import threading
+
+import pytest
+
+from utils.blob_upload import decode_base64_blocks, read_blocks, upload_blocks
+
+
+class FakeBlobClient:
+    """Records the calls of an upload."""
+
+    blob_name = "file.pdf"
+
+    def __init__(self):
+        self.uploads = []
+        self.staged = {}
+        self.committed = None
+        self.lock = threading.Lock()
+
+    def upload_blob(self, data, **kwargs):
+        self.uploads.append((data, kwargs))
+
+    def stage_block(self, block_id, data, length):
+        with self.lock:
+            self.staged[block_id] = data
+
+    def commit_block_list(self, block_list, **kwargs):
+        self.committed = ([block.id for block in block_list], kwargs)
+
+    def content(self):
+        return b"".join(self.staged[block_id] for block_id in self.committed[0])
+
+
+def test_base64_is_decoded_in_blocks():
+    data = os.urandom(10000)
+    encoded = base64.b64encode(data).decode("ascii")
+
+    blocks = list(decode_base64_blocks(f"data:application/pdf;base64,{encoded}", block_size=1000))
+
+    assert len(blocks) == 10
+    assert b"".join(blocks) == data
+    # Line breaks are ignored, as base64.b64decode does
+    wrapped = "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+    assert b"".join(decode_base64_blocks(wrapped, block_size=999)) == data
+
+
+def test_invalid_base64_is_rejected():
+    with pytest.raises(ValueError):
+        list(decode_base64_blocks("data:text/plain;base64,abcde"))
+    with pytest.raises(ValueError):
+        list(decode_base64_blocks("ab=cdefg"))
+
+
+def test_small_files_are_uploaded_in_one_call():
+    blob_client = FakeBlobClient()
+
+    size = upload_blocks(blob_client, read_blocks(io.BytesIO(b"hello"), block_size=100), metadata={"user_id": "1"})
+
+    assert size == 5
+    assert blob_client.uploads == [(b"hello", {"blob_type": "BlockBlob", "overwrite": True,
+                                               "metadata": {"user_id": "1"}, "content_settings": None})]
+    assert blob_client.committed is None
+
+
+def test_large_files_are_staged_and_committed_with_their_metadata():
+    blob_client = FakeBlobClient()
+    data = os.urandom(10000)
+
+    size = upload_blocks(blob_client, read_blocks(io.BytesIO(data), block_size=1000), metadata={"user_id": "1"},
+                         overwrite=False, concurrency=3)
+
+    assert size == 10000
+    assert blob_client.uploads == []
+    assert len(blob_client.committed[0]) == 10
+    assert len({len(block_id) for block_id in blob_client.committed[0]}) == 1
+    assert blob_client.content() == data
+    assert blob_client.committed[1]["metadata"] == {"user_id": "1"}
+    assert blob_client.committed[1]["etag"] == "*"
@@ -0,0 +1,103 @@
+import os
+from datetime import datetime
+
+from azure.data.tables import TableEntity
+
+from src.dao.chat_table_dao import ChatTableDaoImpl
+from utils.entity_codec import PART_SIZE, decode_entity, encode_entity, entity_size
+
+
+def _entity(answer):
+    return {"PartitionKey": "convo", "RowKey": "Completion-1", "Answer": answer, "oid": "user"}
+
+
+def test_small_entities_are_left_as_is():
+    entity = _entity("Short answer")
+
+    assert encode_entity(entity) == entity
+    assert decode_entity(entity) == entity
+
+
+def test_large_properties_are_compressed():
+    answer = "The quick brown fox jumps over the lazy dog. " * 2000
+
+    encoded = encode_entity(_entity(answer))
+
+    assert "Answer" not in encoded
+    assert encoded["Answer__codec"] == "gzip"
+    assert encoded["Answer__parts"] == 1
+    assert len(encoded["Answer__gz0"]) < 32000
+    assert decode_entity(encoded) == _entity(answer)
+
+
+def test_compressed_properties_are_split_in_parts():
+    # Random text hardly compresses, so it takes several binary properties
+    answer = os.urandom(150000).hex()
+
+    encoded = encode_entity(_entity(answer))
+
+    assert encoded["Answer__parts"] >= 3
+    assert all(len(encoded[f"Answer__gz{index}"]) <= PART_SIZE for index in range(encoded["Answer__parts"]))
+    assert decode_entity(encoded)["Answer"] == answer
+
+
+def test_very_large_properties_are_spilled_to_a_blob():
+    answer = os.urandom(1100000).hex()
+    blobs = {}
+
+    encoded = encode_entity(_entity(answer), spill=blobs.__setitem__)
+
+    assert encoded["Answer__blob"] == "convo/Completion-1/Answer.gz"
+    assert not any(key.startswith("Answer__gz") for key in encoded)
+    assert decode_entity(encoded, blobs.__getitem__)["Answer"] == answer
+    # A missing blob does not break the read of the row
+    assert decode_entity(encoded, {}.__getitem__) == _entity(None)
+
+
+def test_properties_are_spilled_until_the_entity_fits():
+    # Each about 500KB compressed, under the limit alone but not together
+    question, answer = os.urandom(470000).hex(), os.urandom(460000).hex()
+    entity = {**_entity(answer), "Question": question}
+    blobs = {}
+
+    encoded = encode_entity(entity, spill=blobs.__setitem__)
+
+    assert list(blobs) == ["convo/Completion-1/Question.gz"]
+    assert "Answer__gz0" in encoded
+    assert entity_size(encoded) < 1024 * 1024
+    assert decode_entity(encoded, blobs.__getitem__) == entity
+
+
+class FakeTableServiceClient:
+    """Returns the selected columns of its entities, like the service does."""
+
+    def __init__(self, entities):
+        self.entities = entities
+
+    def get_table_client(self, table_name):
+        return self
+
+    def list_entities(self, select):
+        for entity in self.entities:
+            selected = TableEntity({key: value for key, value in entity.items() if key in select})
+            selected._metadata = entity.metadata
+            yield selected
+
+    def get_entity(self, partition_key, row_key):
+        return next(entity for entity in self.entities
+                    if (entity["PartitionKey"], entity["RowKey"]) == (partition_key, row_key))
+
+
+def test_dao_decodes_new_and_legacy_rows():
+    answer = "Long answer " * 5000
+    timestamp = datetime(2025, 1, 10)
+    new_row = TableEntity(encode_entity({**_entity(answer), "Completion": "{}"}))
+    new_row._metadata = {"timestamp": timestamp}
+    legacy_row = TableEntity(_entity("Legacy answer"))
+    legacy_row._metadata = {"timestamp": timestamp}
+
+    rows = ChatTableDaoImpl(FakeTableServiceClient([new_row, legacy_row])).all()
+
+    assert [row["Answer"] for row in rows] == [answer, "Legacy answer"]
+    assert rows[0]["metadata"]["timestamp"] == timestamp
+
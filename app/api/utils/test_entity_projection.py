@@ -0,0 +1,65 @@
+import copy
+import json
+
+from utils.entity_projection import project
+from utils.models import (Attachment, Citation, Completion, Context, Feedback, Message, MessageRequest,
+                          ToolInfo)
+
+
+def _legacy(data):
+    """What create_entity stored before the projections: a deep copy trimmed and dumped."""
+    data_copy = copy.deepcopy(data)
+    if isinstance(data_copy, Completion):
+        data_copy.message.tools_info = None
+    if isinstance(data_copy, MessageRequest) and data_copy.messages:
+        data_copy.messages = [data_copy.messages[-1]]
+    return json.dumps(data_copy.__dict__, default=lambda o: o.__dict__)
+
+
+def _conversation(length):
+    messages = [Message(role="user" if number % 2 else "assistant", content=f"Message {number}",
+                        attachments=[Attachment(type="image", blob_storage_url=f"https://blob/{number}")])
+                for number in range(length)]
+    return MessageRequest(query=None, messages=messages, quotedText=None, model="gpt-4o", uuid="convo")
+
+
+def test_message_requests_only_store_the_last_message():
+    request = _conversation(200)
+
+    columns, payload = project(request)
+
+    assert columns == {"Question": "Message 199"}
+    assert payload == _legacy(request)
+    assert len(request.messages) == 200
+    assert project(MessageRequest(query="?", messages=[], quotedText=None, model="gpt-4o")) == (
+        {}, _legacy(MessageRequest(query="?", messages=[], quotedText=None, model="gpt-4o")))
+
+
+def test_completions_are_stored_without_the_tools_data():
+    citations = [Citation(content="content", url="https://intranet", title="Title")]
+    tools_info = [ToolInfo(tool_type="geds", function_name="get_employee_information", payload={"employees": []}),
+                  ToolInfo(tool_type="corporate", function_name="intranet_question", count=2,
+                           payload={"index_name": "current"})]
+    message = Message(role="assistant", content="Answer", context=Context(role="tool", citations=citations,
+                                                                          intent=["search"]),
+                      tools_info=tools_info)
+    completion = Completion(message=message, completion_tokens=10, prompt_tokens=20, total_tokens=30)
+
+    columns, payload = project(completion)
+
+    assert columns == {"Answer": "Answer", "PromptTokens": 20, "CompletionTokens": 10, "TotalTokens": 30,
+                       "Tools": json.dumps([
+                           {"tool_type": "geds", "function_name": "get_employee_information", "count": 1,
+                            "index_name": None},
+                           {"tool_type": "corporate", "function_name": "intranet_question", "count": 2,
+                            "index_name": "current"},
+                       ])}
+    assert payload == _legacy(completion)
+    assert json.loads(payload)["message"]["tools_info"] is None
+    assert completion.message.tools_info == tools_info
+
+
+def test_feedback_is_stored_as_is():
+    feedback = Feedback(feedback="Great", positive=True, uuid="convo")
+
+    assert project(feedback) == ({}, _legacy(feedback))
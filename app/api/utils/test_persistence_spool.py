@@ -0,0 +1,137 @@
+import os
+
+import pytest
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+
+from utils.persistence_spool import PersistenceSpool
+from utils.persistence_worker import PersistenceWorker
+
+
+class FakeTableClient:
+    """Upserts into a dict, raises `error` while it is set."""
+
+    def __init__(self, table_name="chat", error=None):
+        self.table_name = table_name
+        self.error = error
+        self.entities = {}
+
+    def upsert_entity(self, entity):
+        if self.error is not None:
+            raise self.error
+        self.entities[entity["RowKey"]] = entity
+
+    def submit_transaction(self, operations):
+        for _, entity in operations:
+            self.upsert_entity(entity)
+
+
+def _entity(number):
+    return {"PartitionKey": "convo", "RowKey": f"Completion-{number}", "Answer": "!", "Answer__gz0": b"\x1f\x8b"}
+
+
+def _status_error(status):
+    error = HttpResponseError(message="error")
+    error.status_code = status
+    return error
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = PersistenceSpool(str(tmp_path), segment_bytes=500, replay_rate=0)
+    yield spool
+    spool.stop()
+
+
+def test_spooled_entities_are_replayed(spool):
+    table = FakeTableClient()
+    for number in range(10):
+        spool.append(table, _entity(number))
+
+    assert spool.pending_segments() > 1
+    assert spool.replay() == 10
+    assert table.entities["Completion-3"] == _entity(3)
+    assert spool.pending_segments() == 0
+
+
+def test_replay_stops_while_storage_is_down(spool):
+    table = FakeTableClient(error=ServiceRequestError("unreachable"))
+    for number in range(3):
+        spool.append(table, _entity(number))
+
+    assert spool.replay() == 0
+    assert spool.pending_segments() == 1
+
+    table.error = None
+    assert spool.replay() == 3
+
+
+def test_rejected_entities_are_dropped(spool):
+    table = FakeTableClient(error=_status_error(400))
+    spool.append(table, _entity(1))
+
+    assert spool.replay() == 0
+    assert spool.metrics()["dropped"] == 1
+    assert spool.pending_segments() == 0
+
+
+def test_spool_survives_a_restart(tmp_path):
+    table = FakeTableClient()
+    spool = PersistenceSpool(str(tmp_path))
+    spool.append(table, _entity(1))
+    spool.stop()
+    # A record torn by a crash is skipped
+    with open(os.path.join(tmp_path, os.listdir(tmp_path)[0]), "ab") as segment:
+        segment.write(b'{"table": "chat", "ent')
+
+    restarted = PersistenceSpool(str(tmp_path), replay_rate=0)
+    assert restarted.replay() == 0  # the chat table is not known yet
+    restarted.register(table)
+    assert restarted.replay() == 1
+    assert list(table.entities) == ["Completion-1"]
+
+
+def test_worker_spools_writes_failing_after_the_retries(spool):
+    worker = PersistenceWorker(workers=1, retries=1, backoff=0, spool=spool)
+    table = FakeTableClient(error=_status_error(503))
+
+    worker.submit(table, _entity(1))
+    assert worker.flush()
+    worker.submit(FakeTableClient("feedback", error=_status_error(400)), _entity(2))
+    assert worker.flush()
+
+    assert worker.metrics()["spooled"] == 1
+    assert worker.metrics()["failed"] == 1
+    table.error = None
+    assert spool.replay() == 1
+    worker.shutdown()
+
+
+def test_processes_sharing_a_directory_only_replay_sealed_segments(tmp_path):
+    table = FakeTableClient()
+    writer = PersistenceSpool(str(tmp_path), replay_rate=0)
+    replayer = PersistenceSpool(str(tmp_path), replay_rate=0)
+    replayer.register(table)
+    writer.append(table, _entity(1))
+
+    # The segment the writer appends to is locked, it is left alone
+    assert replayer.replay() == 0
+    writer.append(table, _entity(2))
+    assert writer.pending_segments() == 1
+
+    writer.stop()
+    assert replayer.replay() == 2
+    assert sorted(table.entities) == ["Completion-1", "Completion-2"]
+    assert replayer.pending_segments() == 0
+
+
+def test_segments_of_a_stopped_process_are_replayed(tmp_path):
+    table = FakeTableClient()
+    crashed = PersistenceSpool(str(tmp_path))
+    crashed.append(table, _entity(1))
+    crashed.sync()
+    crashed._file.close()  # pylint: disable=protected-access
+
+    restarted = PersistenceSpool(str(tmp_path), replay_rate=0)
+    restarted.register(table)
+    assert restarted.replay() == 1
+    assert list(table.entities) == ["Completion-1"]
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import pytest
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+
+from utils.persistence_worker import MAX_BATCH_ENTITIES, PersistenceWorker
+
+
+class FakeTableClient:
+    """Records upserts and transactions, fails the first `failures` calls with `error`."""
+
+    def __init__(self, failures=0, error=None, release=None):
+        self.upserts = []
+        self.transactions = []
+        self.failures = failures
+        self.error = error
+        self.release = release
+        self.lock = threading.Lock()
+
+    def _call(self):
+        if self.release is not None:
+            self.release.wait(timeout=5)
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise self.error
+
+    def upsert_entity(self, entity):
+        self._call()
+        self.upserts.append(entity)
+
+    def submit_transaction(self, operations):
+        self._call()
+        assert len(operations) <= MAX_BATCH_ENTITIES
+        assert len({entity["PartitionKey"] for _, entity in operations}) == 1
+        self.transactions.append([entity for _, entity in operations])
+
+    def written(self):
+        return self.upserts + [entity for transaction in self.transactions for entity in transaction]
+
+
+def _entity(partition, number):
+    return {"PartitionKey": partition, "RowKey": f"MessageRequest-{number}", "Question": "?"}
+
+
+def _throttled():
+    error = HttpResponseError(message="Too many requests")
+    error.status_code = 429
+    return error
+
+
+@pytest.fixture
+def worker():
+    worker = PersistenceWorker(queue_size=500, workers=1, backoff=0)
+    yield worker
+    worker.shutdown(timeout=1)
+
+
+def test_writes_of_a_conversation_are_batched(worker):
+    release = threading.Event()
+    table = FakeTableClient(release=release)
+    # The first write holds the writer so the others pile up in the queue
+    worker.submit(table, _entity("convo-a", 0))
+    for number in range(1, 151):
+        worker.submit(table, _entity("convo-a" if number % 2 else "convo-b", number))
+    release.set()
+
+    assert worker.flush()
+    assert len(table.written()) == 151
+    assert max(len(transaction) for transaction in table.transactions) >= 25
+    assert worker.metrics()["written"] == 151
+    assert worker.metrics()["batches"] < 10
+
+
+def test_throttled_writes_are_retried(worker):
+    table = FakeTableClient(failures=2, error=_throttled())
+
+    worker.submit(table, _entity("convo", 1))
+
+    assert worker.flush()
+    assert len(table.upserts) == 1
+    assert worker.metrics()["retries"] == 2
+
+
+def test_non_transient_errors_are_not_retried(worker):
+    error = HttpResponseError(message="Bad request")
+    error.status_code = 400
+    table = FakeTableClient(failures=1, error=error)
+
+    worker.submit(table, _entity("convo", 1))
+
+    assert worker.flush()
+    assert table.upserts == []
+    assert worker.metrics()["failed"] == 1
+    assert worker.metrics()["retries"] == 0
+
+
+def test_unreachable_storage_gives_up_after_the_retries():
+    worker = PersistenceWorker(workers=1, retries=2, backoff=0)
+    table = FakeTableClient(failures=10, error=ServiceRequestError("unreachable"))
+
+    worker.submit(table, _entity("convo", 1))
+
+    assert worker.flush()
+    assert worker.metrics()["failed"] == 1
+    assert worker.metrics()["retries"] == 2
+    worker.shutdown()
+
+
+def test_full_queue_writes_in_the_request_thread():
+    release = threading.Event()
+    worker = PersistenceWorker(queue_size=1, workers=1, submit_timeout=0.01)
+    table = FakeTableClient(release=release)
+    inline_table = FakeTableClient()
+
+    worker.submit(table, _entity("convo", 1))
+    while worker.metrics()["queue_depth"]:
+        time.sleep(0.01)  # the writer took it and is blocked
+    worker.submit(table, _entity("convo", 2))  # waits in the queue
+    worker.submit(inline_table, _entity("convo", 3))
+    release.set()
+
+    assert inline_table.upserts == [_entity("convo", 3)]
+    assert worker.metrics()["inline_writes"] == 1
+    worker.shutdown()
+    assert len(table.written()) == 2
+
+
+def test_shutdown_drains_the_queue():
+    worker = PersistenceWorker(workers=2)
+    table = FakeTableClient()
+    for number in range(20):
+        worker.submit(table, _entity(f"convo-{number % 3}", number))
+
+    worker.shutdown()
+
+    assert len(table.written()) == 20
+    assert worker.metrics()["queue_depth"] == 0
+    # Late writes still go through
+    worker.submit(table, _entity("convo", 99))
+    assert len(table.written()) == 21
+
+
+def test_entities_are_encoded_by_the_writer_thread(worker):
+    table = FakeTableClient()
+    encoded_in = []
+
+    def encode(entity):
+        encoded_in.append(threading.current_thread().name)
+        if entity["RowKey"].endswith("-2"):
+            raise OSError("blob storage unavailable")
+        return {**entity, "Question__codec": "gzip"}
+
+    worker.submit(table, _entity("convo", 1), encode=encode)
+    worker.submit(table, _entity("convo", 2), encode=encode)
+
+    assert worker.flush()
+    assert [entity["RowKey"] for entity in table.written()] == ["MessageRequest-1"]
+    assert table.written()[0]["Question__codec"] == "gzip"
+    assert threading.current_thread().name not in encoded_in
+    assert worker.metrics()["failed"] == 1
@@ -1,3 +1,4 @@
+import itertools
 import json
 import logging
 import re
@@ -13,16 +14,22 @@ from flask import Response, jsonify, stream_with_context, request
 from openai.types.chat import ChatCompletion
 
 from src.service.suggestion_service import SuggestionService
-from tools.bits.bits_functions import get_br_information
+from tools.bits.bits_functions import get_br_information, stream_br_information, stream_search_br_by_fields
+from tools.bits.bits_metrics import query_metrics
+from tools.bits.bits_models import BRQuery, BRSelectFields
+from tools.bits.bits_utils import decode_cursor
 from utils.manage_message import SUGGEST_SYSTEM_PROMPT_FR, SUGGEST_SYSTEM_PROMPT_EN
-from src.context.build_context import build_prod_context
+from src.context.build_context import build_prod_context, get_built_context
 
+from tools.archibus.archibus_client import get_archibus_client
 from tools.archibus.archibus_functions import make_api_call
 from utils.auth import auth, user_ad
+from utils.persistence_worker import get_persistence_worker
 from utils.db import (
     flag_conversation,
     leave_feedback,
     save_file,
+    save_file_stream,
     store_completion,
     store_request,
     store_suggestion,
@@ -110,18 +117,13 @@ def completion_chat(message_request: MessageRequest):
     try:
         convo_uuid = message_request.uuid if message_request.uuid else str(uuid.uuid4())
         user = user_ad.current_user()
-        thread = threading.Thread(
-            target=store_request, args=(message_request, convo_uuid, user)
-        )
-        thread.start()
+        # Both writes are queued, the persistence worker stores them in the background
+        store_request(message_request, convo_uuid, user)
 
         completion: ChatCompletion = chat_with_data(message_request)  # type: ignore
         completion_response = convert_chat_with_data_response(completion, message_request.lang)
 
-        thread = threading.Thread(
-            target=store_completion, args=(completion_response, convo_uuid, user)
-        )
-        thread.start()
+        store_completion(completion_response, convo_uuid, user)
 
         return completion_response
     except openai.BadRequestError as e:
@@ -161,19 +163,13 @@ def completion_chat_stream(message_request: MessageRequest):
 
     convo_uuid = message_request.uuid if message_request.uuid else str(uuid.uuid4())
     user = user_ad.current_user()
-    thread = threading.Thread(
-        target=store_request, args=(message_request, convo_uuid, user)
-    )
-    thread.start()
+    store_request(message_request, convo_uuid, user)
     try:
         tools_info, completion = chat_with_data(message_request, stream=True)
 
         if isinstance(completion, ChatCompletion):
             completion_response = convert_chat_with_data_response(completion, message_request.lang)
-            thread = threading.Thread(
-                target=store_completion, args=(completion_response, convo_uuid, user)
-            )
-            thread.start()
+            store_completion(completion_response, convo_uuid, user)
 
             def generate_single_response():
                 yield f"--{_BOUNDARY}\r\n"
@@ -214,10 +210,7 @@ def completion_chat_stream(message_request: MessageRequest):
             response = build_completion_response(
                 content=content_txt, chat_completion_dict=context, tools_info=tools_info, lang=message_request.lang
             )
-            thread = threading.Thread(
-                target=store_completion, args=(response, convo_uuid, user)
-            )
-            thread.start()
+            store_completion(response, convo_uuid, user)
             yield json.dumps(response.__dict__, default=lambda o: o.__dict__)
             yield f"\r\n--{_BOUNDARY}--\r\n"
 
@@ -283,7 +276,7 @@ def book_reservation(booking_confirmation: BookingConfirmation):
         )
 
         logger.debug(payload)
-        response = make_api_call(uri, payload)
+        response = make_api_call(uri, payload, label="POST /reservations")
         return response.json()
     except requests.HTTPError as e:
         msg = f"Didn't make the reservation: {e}"
@@ -302,7 +295,27 @@ def upload_file(file: FilePayload):
     user = user_ad.current_user()
     if user is None:
         abort(401, "User not authenticated")
-    url = save_file(file, user)
+    try:
+        url = save_file(file, user)
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify({"message": "File received", "file_url": url}), 200
+
+
+@api_v1.post("/upload/file")
+@api_v1.doc("Upload a file (multipart/form-data, `file` field) that will be stored in the blob storage")
+@api_v1.doc(security="ApiKeyAuth")
+@auth.login_required(role="chat")
+@user_ad.login_required
+def upload_raw_file():
+    """Same as /upload for clients sending the file as is instead of base64 encoded, streamed to the blob storage"""
+    user = user_ad.current_user()
+    if user is None:
+        abort(401, "User not authenticated")
+    file = request.files.get("file")
+    if file is None or not file.filename:
+        abort(400, "Missing file")
+    url = save_file_stream(file.stream, file.filename, user)
     return jsonify({"message": "File received", "file_url": url}), 200
 
 
@@ -552,6 +565,10 @@ def bits_br_information(brnumber):
             - All BR numbers must be numeric; otherwise, a 400 error is returned.
             - If no valid BR numbers are provided, a 400 error is returned.
             - On backend or unexpected errors, a 500 error is returned.
+            - Optional query parameters:
+                - page_size: number of BRs per page, the next page cursor is returned in metadata.next_cursor
+                - cursor: the metadata.next_cursor of the previous page
+                - stream: if true, the JSON response is streamed row by row (for large exports)
     """
     # Ensure all provided BR numbers are numeric
     brnumbers = [br.strip() for br in brnumber.split(",") if br.strip()]
@@ -559,13 +576,116 @@ def bits_br_information(brnumber):
         return jsonify({"error": "No valid BR numbers provided"}), 400
     if not all(br.isdigit() for br in brnumbers):
         return jsonify({"error": "All BR numbers must be numeric"}), 400
+    page_size, cursor, error = _get_pagination_args()
+    if error:
+        return jsonify({"error": error}), 400
     try:
+        if request.args.get("stream", "").lower() == "true":
+            return _stream_response(stream_br_information(brnumbers, page_size, cursor))
         # Call the backend function to get BR information
-        result = get_br_information(brnumbers)
+        result = get_br_information(brnumbers, page_size, cursor)
         return jsonify(result)
     except ValueError as e:
         logger.error("Error getting BR information: %s", str(e))
         return jsonify({"error": "Error processing request"}), 500
     except Exception as e:
         logger.error("Unexpected error getting BR information: %s", str(e))
-        return jsonify({"error": "Unexpected error processing request"}), 500
\ No newline at end of file
+        return jsonify({"error": "Unexpected error processing request"}), 500
+
+
+@api_v1.post("/bits/search")
+@auth.login_required(role="chat")
+def bits_search():
+    """
+        Search BRs with the same query model used by the search_br_by_fields tool and stream the results back.
+
+        Expects a JSON body with:
+            - br_query: an object matching the BRQuery model (the limit is used as the page size)
+            - select_fields: an object matching the BRSelectFields model
+            - cursor (optional): the metadata.next_cursor of the previous page
+
+        The response is always streamed so large exports are sent in constant memory.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        user_query = BRQuery.model_validate(body.get("br_query"))
+        fields = BRSelectFields.model_validate(body.get("select_fields"))
+        cursor = body.get("cursor")
+        rows = stream_search_br_by_fields(user_query, fields, cursor)
+    except ValueError as e: # also covers pydantic's ValidationError and invalid cursors
+        return jsonify({"error": str(e)}), 400
+    try:
+        return _stream_response(rows)
+    except Exception as e:
+        logger.error("Unexpected error searching BRs: %s", str(e))
+        return jsonify({"error": "Unexpected error processing request"}), 500
+
+
+
+@api_v1.get("/admin/metrics")
+@auth.login_required(role="admin")
+def admin_metrics():
+    """
+        In process performance metrics of this worker, one section per backend.
+
+        bits: latency histograms, row counts and payload sizes (streamed queries) per query shape, and the slow query log
+        (shape hash and parameter types only, parameter values are never recorded).
+        archibus: count, errors, retries, latency and status codes of the Archibus API calls.
+        persistence: queue depth, counters and write latency of the chat persistence worker.
+        chat_table_cache: refresh durations and staleness of the cached chat table (null until first used).
+        stats_reports: refreshes of the precomputed stats reports (null until first used).
+    """
+    context = get_built_context()
+    return jsonify({
+        "bits": query_metrics.snapshot(),
+        "archibus": get_archibus_client().metrics(),
+        "persistence": get_persistence_worker().metrics(),
+        "chat_table_cache": context["chat_table_dao"].metrics() if context else None,
+        "stats_reports": context["stats_report_cache"].metrics() if context else None,
+    })
+
+@api_v1.get("/stats/reports")
+@auth.login_required(role="admin")
+def stats_reports():
+    """
+        The usage reports (by month, by day of week, top users of the past 90 days, monthly user engagement and
+        token usage of the completions), precomputed in the background every STATS_REPORT_REFRESH_SECS seconds.
+
+        The body has the reports and their generated_at timestamp. Responses carry an ETag and Last-Modified,
+        send the ETag back in If-None-Match to get a 304 until the reports change. Answers 503 with a Retry-After
+        until the first reports are computed.
+    """
+    stats_report_cache = build_prod_context()["stats_report_cache"]
+    snapshot = stats_report_cache.snapshot()
+    if snapshot is None:
+        stats_report_cache.start()
+        return jsonify({"error": "The reports are being computed"}), 503, {"Retry-After": "30"}
+    response = Response(snapshot.body, content_type="application/json")
+    response.set_etag(snapshot.etag)
+    response.last_modified = snapshot.generated_at
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def _stream_response(chunks):
+    """
+    Build a streamed JSON response, the first chunk is produced right away so the query runs
+    (and can fail with a proper error status) before the headers are sent.
+    """
+    first_chunk = next(chunks)
+    return Response(stream_with_context(itertools.chain([first_chunk], chunks)), content_type="application/json")
+
+
+def _get_pagination_args():
+    """Read and validate the page_size and cursor query parameters, returns (page_size, cursor, error)"""
+    page_size = request.args.get("page_size")
+    cursor = request.args.get("cursor") or None
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            return None, None, "Invalid cursor"
+    if page_size is None:
+        return None, cursor, None
+    if not page_size.isdigit() or int(page_size) < 1:
+        return None, None, "page_size must be a positive integer"
+    return int(page_size), cursor, None
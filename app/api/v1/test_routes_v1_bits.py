@@ -0,0 +1,141 @@
+import itertools
+import json
+import os
+
+import jwt
+import pytest  # type: ignore[import]
+from apiflask import APIFlask
+
+# The v1 routes create their Azure clients at import time, they only need well formed endpoints here
+os.environ.setdefault("BLOB_ENDPOINT", "https://localhost.blob.core.windows.net/")
+os.environ.setdefault("DATABASE_ENDPOINT", "https://localhost.table.core.windows.net/")
+os.environ.setdefault("SKIP_USER_VALIDATION", "true")
+
+from tools.bits.bits_utils import encode_cursor, stream_result  # pylint: disable=wrong-import-position
+from v1 import routes_v1  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture
+def api_headers():
+    token = jwt.encode({"roles": ["chat"]}, "secret", algorithm="HS256")
+    if isinstance(token, bytes):
+        token = token.decode("utf-8")
+    return {"X-API-Key": token}
+
+
+@pytest.fixture
+def test_client():
+    app = APIFlask(__name__)
+    app.config["TESTING"] = True
+    app.register_blueprint(routes_v1.api_v1, url_prefix="/api/1.0")
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Record the calls made to the BITS functions, answering with two BRs."""
+    calls = []
+
+    def rows():
+        return iter([{"BR_NMBR": 2, "TotalCount": 2}, {"BR_NMBR": 1, "TotalCount": 2}])
+
+    def get_br_information(br_numbers, page_size=None, cursor=None):
+        calls.append(("get", br_numbers, page_size, cursor))
+        return {"br": [{"BR_NMBR": 2}, {"BR_NMBR": 1}], "metadata": {"results": 2}}
+
+    def stream_br_information(br_numbers, page_size=None, cursor=None):
+        calls.append(("stream", br_numbers, page_size, cursor))
+        return stream_result(rows(), page_size=page_size)
+
+    def stream_search_br_by_fields(user_query, fields, cursor=None):
+        calls.append(("search", user_query.limit, fields.fields, cursor))
+        return stream_result(rows(), page_size=user_query.limit)
+
+    monkeypatch.setattr(routes_v1, "get_br_information", get_br_information)
+    monkeypatch.setattr(routes_v1, "stream_br_information", stream_br_information)
+    monkeypatch.setattr(routes_v1, "stream_search_br_by_fields", stream_search_br_by_fields)
+    return calls
+
+
+def test_br_information_pagination_args(test_client, api_headers, calls):
+    cursor = encode_cursor(10)
+
+    response = test_client.get(f"/api/1.0/bits/br/1,2?page_size=2&cursor={cursor}", headers=api_headers)
+
+    assert response.status_code == 200
+    assert calls == [("get", ["1", "2"], 2, cursor)]
+
+
+@pytest.mark.parametrize("query", ["page_size=0", "page_size=abc", "cursor=invalid"])
+def test_br_information_rejects_invalid_pagination_args(test_client, api_headers, calls, query):
+    response = test_client.get(f"/api/1.0/bits/br/1?{query}", headers=api_headers)
+
+    assert response.status_code == 400
+    assert not calls
+
+
+def test_br_information_stream(test_client, api_headers, calls):
+    response = test_client.get("/api/1.0/bits/br/1,2?stream=true&page_size=2", headers=api_headers)
+
+    assert response.status_code == 200
+    document = json.loads(response.get_data(as_text=True))
+    assert [br["BR_NMBR"] for br in document["br"]] == [2, 1]
+    assert document["metadata"]["next_cursor"] == encode_cursor(1)
+    assert calls[0][0] == "stream"
+
+
+def test_br_information_stream_reports_query_errors(test_client, api_headers, monkeypatch):
+    def stream_br_information(*args):
+        return stream_result(itertools.chain(iter(()), _raise()))
+
+    def _raise():
+        raise ConnectionError("database unavailable")
+        yield  # pylint: disable=unreachable
+
+    monkeypatch.setattr(routes_v1, "stream_br_information", stream_br_information)
+
+    response = test_client.get("/api/1.0/bits/br/1?stream=true", headers=api_headers)
+
+    assert response.status_code == 500
+
+
+def test_search_streams_results(test_client, api_headers, calls):
+    body = {
+        "br_query": {"query_filters": [{"name": "BR_SHORT_TITLE", "value": "network", "operator": "="}], "limit": 2},
+        "select_fields": {"fields": ["BR_SHORT_TITLE"]},
+    }
+
+    response = test_client.post("/api/1.0/bits/search", json=body, headers=api_headers)
+
+    assert response.status_code == 200
+    document = json.loads(response.get_data(as_text=True))
+    assert len(document["br"]) == 2
+    assert calls == [("search", 2, ["BR_SHORT_TITLE"], None)]
+
+
+def test_search_rejects_invalid_body(test_client, api_headers, calls):
+    body = {"br_query": {"query_filters": [{"name": "NOT_A_FIELD", "value": "x", "operator": "="}]},
+            "select_fields": {"fields": ["BR_SHORT_TITLE"]}}
+
+    response = test_client.post("/api/1.0/bits/search", json=body, headers=api_headers)
+
+    assert response.status_code == 400
+    assert not calls
+
+
+def test_routes_require_the_chat_role(test_client, calls):
+    response = test_client.get("/api/1.0/bits/br/1")
+
+    assert response.status_code == 401
+
+
+def test_admin_metrics_requires_the_admin_role(test_client, api_headers):
+    assert test_client.get("/api/1.0/admin/metrics", headers=api_headers).status_code == 403
+
+    token = jwt.encode({"roles": ["admin"]}, "secret", algorithm="HS256")
+    response = test_client.get("/api/1.0/admin/metrics", headers={"X-API-Key": token})
+
+    assert response.status_code == 200
+    assert set(response.get_json()["bits"]) == {"slow_query_ms", "shapes", "slow_queries"}
+    assert "archibus" in response.get_json()
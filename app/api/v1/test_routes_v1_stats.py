@@ -0,0 +1,78 @@
+import os
+from typing import cast
+from unittest.mock import MagicMock
+
+import jwt
+import pytest  # type: ignore[import]
+from apiflask import APIFlask
+
+# The v1 routes create their Azure clients at import time, they only need well formed endpoints here
+os.environ.setdefault("BLOB_ENDPOINT", "https://localhost.blob.core.windows.net/")
+os.environ.setdefault("DATABASE_ENDPOINT", "https://localhost.table.core.windows.net/")
+os.environ.setdefault("SKIP_USER_VALIDATION", "true")
+
+from src.service.stats_report_cache import StatsReportCache  # pylint: disable=wrong-import-position
+from src.service.stats_report_service import StatsReportService  # pylint: disable=wrong-import-position
+from v1 import routes_v1  # pylint: disable=wrong-import-position
+
+
+@pytest.fixture
+def api_headers():
+    token = jwt.encode({"roles": ["admin"]}, "secret", algorithm="HS256")
+    if isinstance(token, bytes):
+        token = token.decode("utf-8")
+    return {"X-API-Key": token}
+
+
+@pytest.fixture
+def test_client():
+    app = APIFlask(__name__)
+    app.config["TESTING"] = True
+    app.register_blueprint(routes_v1.api_v1, url_prefix="/api/1.0")
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def stats_report_cache(monkeypatch):
+    service = MagicMock()
+    service.get_statistics_by_month_of_year.return_value = []
+    service.get_statistics_by_day_of_week.return_value = []
+    service.get_top_users_past_90_days.return_value = [("1", 3)]
+    service.get_monthly_user_engagement_report.return_value = []
+    service.get_token_usage_report.return_value = None
+    cache = StatsReportCache(cast(StatsReportService, service))
+    cache.start = MagicMock()
+    monkeypatch.setattr(routes_v1, "build_prod_context", lambda: {"stats_report_cache": cache})
+    return cache
+
+
+def test_reports_are_unavailable_until_computed(test_client, api_headers, stats_report_cache):
+    response = test_client.get("/api/1.0/stats/reports", headers=api_headers)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    stats_report_cache.start.assert_called_once()
+
+
+def test_reports_are_served_with_an_etag(test_client, api_headers, stats_report_cache):
+    stats_report_cache.refresh()
+
+    response = test_client.get("/api/1.0/stats/reports", headers=api_headers)
+    assert response.status_code == 200
+    assert response.get_json()["reports"]["top_users_past_90_days"] == [["1", 3]]
+    assert response.headers["ETag"] == f'"{stats_report_cache.snapshot().etag}"'
+    assert "Last-Modified" in response.headers
+
+    cached = test_client.get(
+        "/api/1.0/stats/reports", headers={**api_headers, "If-None-Match": response.headers["ETag"]}
+    )
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+
+def test_reports_require_the_admin_role(test_client, stats_report_cache):
+    token = jwt.encode({"roles": ["chat"]}, "secret", algorithm="HS256")
+    response = test_client.get("/api/1.0/stats/reports", headers={"X-API-Key": token})
+
+    assert response.status_code == 403